@@ -6,18 +6,23 @@ import os
 import shutil
 import numpy as np
 from scipy.spatial.transform import Rotation
+from scipy.optimize import least_squares
+from scipy.sparse import coo_matrix
 import time
 import json
+import hashlib
+import struct
 import cv2.aruco as aruco
 import logging
+import threading
 logging.getLogger('matplotlib').setLevel(logging.WARNING)
 
 from pathlib import Path
-from functools import reduce
-from collections import deque
+from functools import reduce, partial
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 from typing import Optional
 import matplotlib.pyplot as plt
-from scipy.interpolate import griddata
 plt.rcParams.update({'font.size': 16})
 import matplotlib.colors as colors
 import logging
@@ -36,33 +41,44 @@ cdict = {'red':  ((0.0, 0.0, 0.0),   # no red at 0
 }
 # Create the colormap using the dictionary
 GnRd = colors.LinearSegmentedColormap('GnRd', cdict)
-def get_quadrant_coordinates(width, height, nx, ny):
-    quadrant_width = width // nx
-    quadrant_height = height // ny
-    quadrant_coords = []
-    
-    for i in range(int(nx)):
-        for j in range(int(ny)):
-            left = i * quadrant_width
-            upper = j * quadrant_height
-            right = left + quadrant_width
-            bottom = upper + quadrant_height
-            quadrant_coords.append((left, upper, right, bottom))
-    
-    return quadrant_coords
-
-def sort_points_into_quadrants(points, width, height, error, nx = 4, ny = 4):
-    quadrant_coords = get_quadrant_coordinates(width, height, nx, ny)
-    quadrants = {i: [] for i in range(int(nx*ny))}  # Create a dictionary to store points by quadrant index
-
-    for x, y in points:
-        # Find the correct quadrant for each point
-        for index, (left, upper, right, bottom) in enumerate(quadrant_coords):
-            if left <= x < right and upper <= y < bottom:
-                quadrants[index].append(error[index])
-                break
-            
-    return quadrants, quadrant_coords
+class ErrorField(object):
+    """
+    Reprojection errors binned onto an nx x ny grid over the image in one pass. count, mean, rms and max
+    are (ny, nx) arrays indexed [row, column], NaN where a cell has no points.
+    """
+    def __init__(self, points, errors, width, height, nx = 4, ny = 4):
+        self.width, self.height, self.nx, self.ny = width, height, nx, ny
+        points = np.asarray(points, np.float64).reshape(-1, 2)
+        errors = np.asarray(errors, np.float64).ravel()
+        column = np.floor(points[:, 0] * nx / width).astype(np.int64)
+        row = np.floor(points[:, 1] * ny / height).astype(np.int64)
+        inside = (column >= 0) & (column < nx) & (row >= 0) & (row < ny)
+        cells = (row * nx + column)[inside]
+        errors = errors[inside]
+        size = nx * ny
+        count = np.bincount(cells, minlength = size)
+        total = np.bincount(cells, weights = errors, minlength = size)
+        squared = np.bincount(cells, weights = errors * errors, minlength = size)
+        maximum = np.full(size, -np.inf)
+        np.maximum.at(maximum, cells, errors)
+        empty = count == 0
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            self.count = count.reshape(ny, nx)
+            self.mean = np.where(empty, np.nan, total / count).reshape(ny, nx)
+            self.rms = np.where(empty, np.nan, np.sqrt(squared / count)).reshape(ny, nx)
+            self.max = np.where(empty, np.nan, maximum).reshape(ny, nx)
+
+    def cell_bounds(self, row, column):
+        """(left, upper, right, bottom) pixel bounds of a cell."""
+        left, upper = int(column * self.width / self.nx), int(row * self.height / self.ny)
+        right, bottom = int((column + 1) * self.width / self.nx), int((row + 1) * self.height / self.ny)
+        return left, upper, right, bottom
+
+    def cell_centers(self):
+        """x and y pixel coordinates (ny, nx) of the cell centers."""
+        x = (np.arange(self.nx) + 0.5) * self.width / self.nx
+        y = (np.arange(self.ny) + 0.5) * self.height / self.ny
+        return np.meshgrid(x, y)
 
 def distance(point1, point2):
     return np.sqrt((point1[0] - point2[0])**2 + (point1[1] - point2[1])**2)
@@ -138,6 +154,1203 @@ def polygon_from_image_name(image_name):
     """Returns the polygon index from an image name (ex: "left_p10_0.png" => 10)"""
     return int(re.findall("p(\d+)", image_name)[0])
 
+# SUB PIXEL CORNER DETECTION CRITERION
+charuco_subpix_criteria = (cv2.TERM_CRITERIA_EPS +
+                           cv2.TERM_CRITERIA_MAX_ITER, 10000, 0.00001)
+
+# Solve criteria of the calibrate_camera_charuco refinement loop with intrinsic_schedule="coarse_to_fine".
+# The legacy criteria (EPS & COUNT, 50000, 1e-9) have type 0, for which OpenCV falls back to
+# 30 iterations with eps DBL_EPSILON, so "tight" is exactly what the legacy loop solves with.
+intrinsic_solve_schedule = {
+    "loose": (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_COUNT, 30, 1e-6),
+    "tight": (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_COUNT, 30, np.finfo(np.float64).eps),
+    "parameter_tol": 1e-4,
+}
+
+def resize_to_resolution(gray, req_resolution):
+    expected_height = gray.shape[0]*(req_resolution[1]/gray.shape[1])
+    if int(expected_height) == req_resolution[0]:
+        # resizing to have both stereo and rgb to have same
+        # resolution to capture extrinsics of the rgb-right camera
+        gray = cv2.resize(gray, req_resolution[::-1],
+                          interpolation=cv2.INTER_CUBIC)
+    else:
+        # resizing and cropping to have both stereo and rgb to have same resolution
+        # to calculate extrinsics of the rgb-right camera
+        scale_width = req_resolution[1]/gray.shape[1]
+        dest_res = (
+            int(gray.shape[1] * scale_width), int(gray.shape[0] * scale_width))
+        gray = cv2.resize(
+            gray, dest_res, interpolation=cv2.INTER_CUBIC)
+        if gray.shape[0] < req_resolution[0]:
+            raise RuntimeError("resizeed height of rgb is smaller than required. {0} < {1}".format(
+                gray.shape[0], req_resolution[0]))
+        del_height = (gray.shape[0] - req_resolution[0]) // 2
+        gray = gray[del_height: del_height + req_resolution[0], :]
+    return gray
+
+def pyramid_levels_for(shape, min_side=720):
+    """Number of pyrDown levels that keep the shorter image side at or above min_side."""
+    levels = 0
+    while min(shape[:2]) / 2**(levels + 1) >= min_side:
+        levels += 1
+    return levels
+
+class FrameStore(object):
+    """
+    Bounded LRU of decoded images, so each image of a calibrate() run is decoded from
+    disk once. Grayscale requests are decoded as grayscale (or converted from an already
+    resident color frame). Returned frames are shared and must not be modified in place.
+    """
+    def __init__(self, max_bytes=1 << 30):
+        self.max_bytes = max_bytes
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_resident = 0
+
+    def get(self, path, grayscale=False):
+        key = (str(path), grayscale)
+        with self.lock:
+            frame = self.frames.get(key)
+            if frame is not None:
+                self.frames.move_to_end(key)
+                self.hits += 1
+                return frame
+            color = self.frames.get((key[0], False)) if grayscale else None
+        if color is not None:
+            frame = cv2.cvtColor(color, cv2.COLOR_BGR2GRAY)
+        else:
+            frame = cv2.imread(key[0], cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR)
+            if frame is None:
+                return None
+        with self.lock:
+            if color is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            if key not in self.frames:
+                self.frames[key] = frame
+                self.bytes_resident += frame.nbytes
+            while self.bytes_resident > self.max_bytes and len(self.frames) > 1:
+                _, evicted = self.frames.popitem(last=False)
+                self.bytes_resident -= evicted.nbytes
+                self.evictions += 1
+        return frame
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.bytes_resident = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "frames_resident": len(self.frames), "bytes_resident": self.bytes_resident}
+
+def probe_image_size(im):
+    """
+    Reads (height, width) from the PNG IHDR or JPEG SOF header without decoding the image.
+    Returns None for other formats or unexpected headers.
+    """
+    with open(im, 'rb') as f:
+        header = f.read(24)
+        if header[:8] == b'\x89PNG\r\n\x1a\n' and header[12:16] == b'IHDR':
+            width, height = struct.unpack('>II', header[16:24])
+            return height, width
+        if header[:2] != b'\xff\xd8':
+            return None
+        f.seek(2)
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None
+            while marker[1] == 0xFF:  # fill bytes
+                marker = marker[1:] + f.read(1)
+            if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:  # markers without a segment
+                continue
+            segment = f.read(2)
+            if len(segment) < 2:
+                return None
+            length, = struct.unpack('>H', segment)
+            # SOF0..SOF15 except DHT (C4), JPG (C8) and DAC (CC)
+            if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                sof = f.read(5)
+                if len(sof) < 5:
+                    return None
+                _, height, width = struct.unpack('>BHH', sof)
+                return height, width
+            f.seek(length - 2, 1)
+
+def load_gray(im, scale_req=False, req_resolution=(800, 1280), frame_store=None):
+    if frame_store is not None:
+        gray = frame_store.get(im, grayscale=True)
+    else:
+        gray = cv2.imread(im, cv2.IMREAD_GRAYSCALE)
+    if scale_req and not (gray.shape[0] == req_resolution[0] and gray.shape[1] == req_resolution[1]):
+        gray = resize_to_resolution(gray, req_resolution)
+    return gray
+
+def empty_detection():
+    """Corners and ids placeholder of a frame without a usable detection, keeps the views of all cameras index aligned."""
+    return np.zeros((0, 1, 2), np.float32), np.zeros((0, 1), np.int32)
+
+def detected_views(allIds, min_corners=4):
+    """Indices of the views with a usable detection, placeholders ((None, None) or empty) left out."""
+    return [i for i, ids in enumerate(allIds) if ids is not None and len(ids) >= min_corners]
+
+# limits of the frame quality prefilter: minimum sharpness and contrast, maximum saturated fraction
+frame_quality_thresholds = {"sharpness": 200.0, "saturation": 0.3, "contrast": 10.0}
+
+def frame_quality(gray, max_side=640):
+    """
+    Sharpness (variance of the Laplacian), saturation (fraction of pixels at 250 or above) and contrast
+    (standard deviation) of a grayscale frame, measured on a copy downscaled to max_side so it costs a
+    fraction of the detection. Blur and exposure problems show up in these before they turn into
+    missing markers or outlier corners.
+    """
+    scale = max_side / max(gray.shape[:2])
+    if scale < 1:
+        gray = cv2.resize(gray, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    _, laplacian_std = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_32F))
+    _, std = cv2.meanStdDev(gray)
+    return {"sharpness": float(laplacian_std[0, 0] ** 2),
+            "saturation": float(np.count_nonzero(gray >= 250)) / gray.size,
+            "contrast": float(std[0, 0])}
+
+def frame_quality_issues(quality, thresholds=frame_quality_thresholds):
+    """Reasons why a frame with the frame_quality measures fails the thresholds, empty when it passes."""
+    reasons = []
+    if quality["sharpness"] < thresholds["sharpness"]:
+        reasons.append(f"blurred (sharpness {round(quality['sharpness'], 1)} < {thresholds['sharpness']})")
+    if quality["saturation"] > thresholds["saturation"]:
+        reasons.append(f"overexposed ({round(100 * quality['saturation'], 1)}% saturated > {100 * thresholds['saturation']}%)")
+    if quality["contrast"] < thresholds["contrast"]:
+        reasons.append(f"low contrast ({round(quality['contrast'], 1)} < {thresholds['contrast']})")
+    return reasons
+
+def measure_frame_quality(im, thresholds=frame_quality_thresholds, frame_store=None):
+    """frame_quality of an image file with the frame_quality_issues reasons under "reasons"."""
+    quality = frame_quality(load_gray(im, frame_store=frame_store))
+    quality["reasons"] = frame_quality_issues(quality, thresholds)
+    return quality
+
+# DetectorParameters overrides, on top of the OpenCV defaults
+charuco_detector_presets = {
+    # the tuning analyze_charuco has always used
+    "default": {"minMarkerDistanceRate": 0.01},
+    # fewer adaptive threshold passes, for evenly lit stations
+    "fast": {"minMarkerDistanceRate": 0.01,
+             "adaptiveThreshWinSizeMin": 5,
+             "adaptiveThreshWinSizeMax": 21,
+             "adaptiveThreshWinSizeStep": 16},
+    # denser adaptive threshold sweep and sub-pixel marker corners, for difficult lighting
+    "accurate": {"minMarkerDistanceRate": 0.01,
+                 "adaptiveThreshWinSizeMin": 3,
+                 "adaptiveThreshWinSizeMax": 33,
+                 "adaptiveThreshWinSizeStep": 5,
+                 "cornerRefinementMethod": cv2.aruco.CORNER_REFINE_SUBPIX},
+}
+
+class CharucoDetector(object):
+    """
+    ChArUco detection set up once per board: dictionary, board, detector parameters and
+    sub-pixel criteria. Shared by the calibration, the epipolar checks and the helper scripts
+    so every one of them detects with the same tuning.
+    """
+    def __init__(self, squaresX, squaresY, square_size, mrk_size, preset="default", pyramid_levels=0,
+                 dictionary=aruco.DICT_4X4_1000, subpix_win_size=(5, 5), subpix_criteria=charuco_subpix_criteria, min_markers=1):
+        if preset not in charuco_detector_presets:
+            raise ValueError(f"Unknown detector preset {preset}, use one of {list(charuco_detector_presets)}")
+        self.config = {
+            "board": (squaresX, squaresY, square_size, mrk_size),
+            "preset": preset,
+            "pyramid_levels": pyramid_levels,
+            "dictionary": dictionary,
+            "subpix_win_size": tuple(subpix_win_size),
+            "subpix_criteria": tuple(subpix_criteria),
+            "min_markers": min_markers,
+        }
+        self._build()
+
+    def _build(self):
+        squaresX, squaresY, square_size, mrk_size = self.config["board"]
+        self.aruco_dictionary = aruco.Dictionary_get(self.config["dictionary"])
+        self.board = aruco.CharucoBoard_create(squaresX, squaresY, square_size, mrk_size, self.aruco_dictionary)
+        self.parameters = aruco.DetectorParameters_create()
+        for key, value in charuco_detector_presets[self.config["preset"]].items():
+            setattr(self.parameters, key, value)
+        self.pyramid_levels = self.config["pyramid_levels"]
+        self.subpix_win_size = self.config["subpix_win_size"]
+        self.subpix_criteria = self.config["subpix_criteria"]
+
+    # cv2 objects can't be pickled, process pool workers rebuild them from the config
+    def __getstate__(self):
+        return self.config
+
+    def __setstate__(self, config):
+        self.config = config
+        self._build()
+
+    def fingerprint(self):
+        config = dict(self.config)
+        config["preset"] = charuco_detector_presets[self.config["preset"]]
+        return config
+
+    def detect(self, image):
+        """Markers and interpolated chessboard corners, (None, None, None, None, None) when no marker is found."""
+        pyramid_levels = self.pyramid_levels
+        if pyramid_levels == "auto":
+            pyramid_levels = pyramid_levels_for(image.shape)
+        if pyramid_levels > 0:
+            # markers are found on the downscaled image, everything after that runs on full resolution
+            small = image
+            for _ in range(pyramid_levels):
+                small = cv2.pyrDown(small)
+            corners, ids, rejectedImgPoints = cv2.aruco.detectMarkers(small, self.aruco_dictionary, parameters=self.parameters)
+            # pyrDown keeps the even pixels, so pixel coordinates scale exactly by 2 per level
+            scale = 2 ** pyramid_levels
+            corners = tuple(np.ascontiguousarray(c * scale, dtype=np.float32) for c in corners)
+            rejectedImgPoints = tuple(np.ascontiguousarray(c * scale, dtype=np.float32) for c in rejectedImgPoints)
+            if len(corners) > 0:
+                marker_points = cv2.cornerSubPix(image, np.concatenate(corners).reshape(-1, 1, 2),
+                                                 winSize=(scale + 1, scale + 1),
+                                                 zeroZone=(-1, -1),
+                                                 criteria=(cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01))
+                corners = tuple(marker_points.reshape(-1, 1, 4, 2))
+        else:
+            corners, ids, rejectedImgPoints = cv2.aruco.detectMarkers(image, self.aruco_dictionary, parameters=self.parameters)  # First, detect markers
+        marker_corners, marker_ids, refusd, recoverd = cv2.aruco.refineDetectedMarkers(image, self.board, corners, ids, rejectedCorners=rejectedImgPoints, parameters=self.parameters)
+        # If found, add object points, image points (after refining them)
+        if len(marker_corners) > 0:
+            ret, corners, ids = cv2.aruco.interpolateCornersCharuco(marker_corners, marker_ids, image, self.board, minMarkers = self.config["min_markers"])
+            return ret, corners, ids, marker_corners, marker_ids
+        else:
+            return None, None, None, None, None
+
+    def refine(self, gray, charuco_corners):
+        return cv2.cornerSubPix(gray, charuco_corners,
+                                winSize=self.subpix_win_size,
+                                zeroZone=(-1, -1),
+                                criteria=self.subpix_criteria)
+
+    def detect_image(self, im, scale_req=False, req_resolution=(800, 1280), keep_frame=False, frame_store=None):
+        """
+        Decodes one image (path or grayscale array), detects the board on it and refines the chessboard corners.
+        Returns (shape, charuco_corners, charuco_ids, marker_corners, marker_ids, frame),
+        frame is only kept for visualization.
+        """
+        if isinstance(im, np.ndarray):
+            gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY) if im.ndim == 3 else im
+            if scale_req and not (gray.shape[0] == req_resolution[0] and gray.shape[1] == req_resolution[1]):
+                gray = resize_to_resolution(gray, req_resolution)
+        else:
+            gray = load_gray(im, scale_req, req_resolution, frame_store)
+
+        ret, charuco_corners, charuco_ids, marker_corners, marker_ids = self.detect(gray)
+        if charuco_corners is not None and charuco_ids is not None and len(charuco_corners) > 3:
+            charuco_corners = self.refine(gray, charuco_corners)
+        return gray.shape, charuco_corners, charuco_ids, marker_corners, marker_ids, gray if keep_frame else None
+
+    def detect_many(self, frames, workers=1, executor="thread", scale_req=False, req_resolution=(800, 1280), keep_frame=False, frame_store=None):
+        """
+        Yields detect_image results in the order of frames. With workers > 1 the frames are
+        decoded, detected and refined in a thread or process pool.
+        """
+        if workers <= 1 or len(frames) <= 1:
+            for im in frames:
+                yield self.detect_image(im, scale_req, req_resolution, keep_frame, frame_store)
+            return
+
+        if executor == "process":
+            # frame store lives in this process, workers decode on their own
+            pool = ProcessPoolExecutor(max_workers=workers)
+            futures = [pool.submit(self.detect_image, im, scale_req, req_resolution, keep_frame) for im in frames]
+        else:
+            pool = ThreadPoolExecutor(max_workers=workers)
+            futures = [pool.submit(self.detect_image, im, scale_req, req_resolution, keep_frame, frame_store) for im in frames]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            # stop the queued frames when the caller bails out on a failed one
+            pool.shutdown(wait=True, cancel_futures=True)
+
+def rodrigues_many(rvecs):
+    """Rotation matrices (V, 3, 3) of V rotation vectors."""
+    rvecs = np.asarray(rvecs, np.float64).reshape(-1, 3)
+    theta = np.linalg.norm(rvecs, axis=1)
+    axis = rvecs / np.where(theta > 0, theta, 1)[:, None]
+    skew = np.zeros((len(rvecs), 3, 3))
+    skew[:, 0, 1], skew[:, 0, 2] = -axis[:, 2], axis[:, 1]
+    skew[:, 1, 0], skew[:, 1, 2] = axis[:, 2], -axis[:, 0]
+    skew[:, 2, 0], skew[:, 2, 1] = -axis[:, 1], axis[:, 0]
+    sin, cos = np.sin(theta)[:, None, None], np.cos(theta)[:, None, None]
+    return np.eye(3) + sin * skew + (1 - cos) * skew @ skew
+
+def per_view_rms(errors, view_index, num_views):
+    """RMS of the per-point errors of every view, 0 for views without points."""
+    counts = np.bincount(view_index, minlength=num_views)
+    squared = np.bincount(view_index, weights=np.square(errors), minlength=num_views)
+    return np.sqrt(squared / np.maximum(counts, 1))
+
+class PinholeModel(object):
+    """
+    OpenCV pinhole camera with the full distortion model (radial k1-k6, tangential p1 p2, thin prism
+    s1-s4, tilt tauX tauY), vectorized over the points of all views at once. Matches cv2.projectPoints.
+    """
+    def __init__(self, K, dist):
+        self.K = np.asarray(K, np.float64)
+        self.dist = np.zeros(14)
+        dist = np.asarray(dist, np.float64).ravel()
+        self.dist[:len(dist)] = dist
+
+    def camera_points(self, obj_pts, rvecs, tvecs, view_index=None):
+        """Object points (N, 3) in camera coordinates, point i seen from view view_index[i]."""
+        obj_pts = np.asarray(obj_pts, np.float64).reshape(-1, 3)
+        if view_index is None:
+            view_index = np.zeros(len(obj_pts), np.int64)
+        R = rodrigues_many(rvecs)[view_index]
+        t = np.asarray(tvecs, np.float64).reshape(-1, 3)[view_index]
+        return np.einsum('nij,nj->ni', R, obj_pts) + t
+
+    def distort(self, x, y):
+        k1, k2, p1, p2, k3, k4, k5, k6, s1, s2, s3, s4, tau_x, tau_y = self.dist
+        r2 = x * x + y * y
+        r4 = r2 * r2
+        radial = (1 + k1 * r2 + k2 * r4 + k3 * r4 * r2) / (1 + k4 * r2 + k5 * r4 + k6 * r4 * r2)
+        xd = x * radial + 2 * p1 * x * y + p2 * (r2 + 2 * x * x) + s1 * r2 + s2 * r4
+        yd = y * radial + p1 * (r2 + 2 * y * y) + 2 * p2 * x * y + s3 * r2 + s4 * r4
+        if tau_x or tau_y:
+            rot_x = np.array([[1, 0, 0], [0, np.cos(tau_x), np.sin(tau_x)], [0, -np.sin(tau_x), np.cos(tau_x)]])
+            rot_y = np.array([[np.cos(tau_y), 0, -np.sin(tau_y)], [0, 1, 0], [np.sin(tau_y), 0, np.cos(tau_y)]])
+            tilt = rot_y @ rot_x
+            tilt = np.array([[tilt[2, 2], 0, -tilt[0, 2]], [0, tilt[2, 2], -tilt[1, 2]], [0, 0, 1]]) @ tilt
+            w = tilt[2, 0] * xd + tilt[2, 1] * yd + tilt[2, 2]
+            xd, yd = (tilt[0, 0] * xd + tilt[0, 1] * yd + tilt[0, 2]) / w, (tilt[1, 0] * xd + tilt[1, 1] * yd + tilt[1, 2]) / w
+        return xd, yd
+
+    def project(self, cam):
+        """Image points (N, 2) of points (N, 3) already in camera coordinates."""
+        xd, yd = self.distort(cam[:, 0] / cam[:, 2], cam[:, 1] / cam[:, 2])
+        return np.stack([self.K[0, 0] * xd + self.K[0, 2], self.K[1, 1] * yd + self.K[1, 2]], axis=1)
+
+    def project_many(self, obj_pts, rvecs, tvecs, view_index=None):
+        """Image points (N, 2) of object points (N, 3), point i seen from view view_index[i]."""
+        return self.project(self.camera_points(obj_pts, rvecs, tvecs, view_index))
+
+    def unproject_many(self, img_pts, R=None, P=None):
+        """Undistorted normalized points (N, 2), or pixels when P is given."""
+        img_pts = np.asarray(img_pts, np.float64).reshape(-1, 1, 2)
+        return cv2.undistortPoints(img_pts, self.K, self.dist, R=R, P=P).reshape(-1, 2)
+
+    def residuals(self, obj_pts, img_pts, rvecs, tvecs, view_index=None):
+        """Reprojection error of every point."""
+        projected = self.project_many(obj_pts, rvecs, tvecs, view_index)
+        return np.linalg.norm(projected - np.asarray(img_pts, np.float64).reshape(-1, 2), axis=1)
+
+class FisheyeModel(PinholeModel):
+    """OpenCV fisheye (equidistant, k1-k4) camera, vectorized like PinholeModel. Matches cv2.fisheye.projectPoints."""
+    def __init__(self, K, dist, alpha=0.0):
+        self.K = np.asarray(K, np.float64)
+        self.dist = np.zeros(4)
+        dist = np.asarray(dist, np.float64).ravel()[:4]
+        self.dist[:len(dist)] = dist
+        self.alpha = alpha
+
+    def distort(self, x, y):
+        k1, k2, k3, k4 = self.dist
+        r = np.sqrt(x * x + y * y)
+        theta = np.arctan(r)
+        theta2 = theta * theta
+        theta_d = theta * (1 + theta2 * (k1 + theta2 * (k2 + theta2 * (k3 + theta2 * k4))))
+        scale = np.where(r > 1e-8, theta_d / np.where(r > 1e-8, r, 1), 1.0)
+        return x * scale, y * scale
+
+    def project(self, cam):
+        xd, yd = self.distort(cam[:, 0] / cam[:, 2], cam[:, 1] / cam[:, 2])
+        return np.stack([self.K[0, 0] * (xd + self.alpha * yd) + self.K[0, 2], self.K[1, 1] * yd + self.K[1, 2]], axis=1)
+
+    def unproject_many(self, img_pts, R=None, P=None):
+        img_pts = np.asarray(img_pts, np.float64).reshape(-1, 1, 2)
+        return cv2.fisheye.undistortPoints(img_pts, self.K, self.dist, R=R, P=P).reshape(-1, 2)
+
+def camera_model(model, K, dist):
+    """PinholeModel or FisheyeModel for the calib_model / cameraModel string."""
+    if model == "fisheye":
+        return FisheyeModel(K, dist)
+    return PinholeModel(K, dist)
+
+def intrinsic_parameter_mask(flags, initial, fisheye=False):
+    """
+    Which intrinsic parameters a sparse solve may change, following the OpenCV calibration flags, and the
+    starting values with the disabled distortion terms zeroed. Pinhole parameters are laid out like
+    OpenCV's stdDeviationsIntrinsics (fx fy cx cy k1 k2 p1 p2 k3 k4 k5 k6 s1 s2 s3 s4 tauX tauY),
+    fisheye ones as fx fy cx cy k1 k2 k3 k4.
+    """
+    initial = np.array(initial, np.float64)
+    free = np.ones(len(initial), bool)
+    if fisheye:
+        fix = {cv2.fisheye.CALIB_FIX_FOCAL_LENGTH: [0, 1], cv2.fisheye.CALIB_FIX_PRINCIPAL_POINT: [2, 3],
+               cv2.fisheye.CALIB_FIX_K1: [4], cv2.fisheye.CALIB_FIX_K2: [5], cv2.fisheye.CALIB_FIX_K3: [6], cv2.fisheye.CALIB_FIX_K4: [7]}
+        for flag, parameters in fix.items():
+            if flags & flag:
+                free[parameters] = False
+        return free, initial
+    fix = {cv2.CALIB_FIX_FOCAL_LENGTH: [0, 1], cv2.CALIB_FIX_ASPECT_RATIO: [0], cv2.CALIB_FIX_PRINCIPAL_POINT: [2, 3],
+           cv2.CALIB_FIX_K1: [4], cv2.CALIB_FIX_K2: [5], cv2.CALIB_FIX_K3: [8], cv2.CALIB_FIX_K4: [9], cv2.CALIB_FIX_K5: [10],
+           cv2.CALIB_FIX_K6: [11], cv2.CALIB_FIX_S1_S2_S3_S4: [12, 13, 14, 15], cv2.CALIB_FIX_TAUX_TAUY: [16, 17]}
+    for flag, parameters in fix.items():
+        if flags & flag:
+            free[parameters] = False
+    # terms of disabled models are zero and stay zero
+    disabled = {cv2.CALIB_ZERO_TANGENT_DIST: ([6, 7], True), cv2.CALIB_RATIONAL_MODEL: ([9, 10, 11], False),
+                cv2.CALIB_THIN_PRISM_MODEL: ([12, 13, 14, 15], False), cv2.CALIB_TILTED_MODEL: ([16, 17], False)}
+    for flag, (parameters, when_set) in disabled.items():
+        if bool(flags & flag) == when_set:
+            free[parameters] = False
+            initial[parameters] = 0
+    return free, initial
+
+# least_squares solves the trust region steps with LSMR on the sparse Jacobian. The camera models are
+# badly conditioned enough that LSMR's default tolerances stop far from the Gauss-Newton step and the
+# solve crawls, with these the sparse solves land on the OpenCV solution.
+sparse_lsmr_options = {'atol': 1e-12, 'btol': 1e-12, 'maxiter': 2000}
+
+def sparse_calibrate(object_points, image_points, view_index, K, dist, rvecs, tvecs, flags=0, fisheye=False, max_nfev=100, loss='linear', f_scale=1.0):
+    """
+    Bundle adjustment of the intrinsics, distortion and the 6 pose parameters of every view with
+    scipy.optimize.least_squares. Each residual only depends on the intrinsics and its own view's pose,
+    the block-sparse Jacobian structure keeps the cost linear in the number of views. Takes the points of
+    all views at once (object_points (N, 3), image_points (N, 2), view_index (N,)) and returns what
+    cv2.aruco.calibrateCameraCharucoExtended returns: (rms, K, dist, rvecs, tvecs,
+    stdDeviationsIntrinsics, stdDeviationsExtrinsics, perViewErrors). A robust loss ('huber', 'cauchy', ...
+    see least_squares) with f_scale in pixels down-weights outliers, the returned errors stay plain. The
+    standard deviations are normalised over 2N - p residual degrees of freedom, not OpenCV's N - p.
+    """
+    object_points = np.asarray(object_points, np.float64).reshape(-1, 3)
+    image_points = np.asarray(image_points, np.float64).reshape(-1, 2)
+    view_index = np.asarray(view_index, np.int64)
+    num_views = len(rvecs)
+    model = FisheyeModel(K, dist) if fisheye else PinholeModel(K, dist)
+    initial = np.concatenate([[model.K[0, 0], model.K[1, 1], model.K[0, 2], model.K[1, 2]], model.dist])
+    free, initial = intrinsic_parameter_mask(flags, initial, fisheye)
+    aspect_ratio = initial[0] / initial[1] if (not fisheye and flags & cv2.CALIB_FIX_ASPECT_RATIO) else None
+    poses = np.concatenate([np.asarray(rvecs, np.float64).reshape(-1, 3), np.asarray(tvecs, np.float64).reshape(-1, 3)], axis=1)
+    num_free = int(np.count_nonzero(free))
+
+    def unpack(x):
+        intrinsics = initial.copy()
+        intrinsics[free] = x[:num_free]
+        if aspect_ratio is not None:
+            intrinsics[0] = intrinsics[1] * aspect_ratio
+        model.K = np.array([[intrinsics[0], 0, intrinsics[2]], [0, intrinsics[1], intrinsics[3]], [0, 0, 1]])
+        model.dist = intrinsics[4:]
+        return intrinsics, x[num_free:].reshape(num_views, 6)
+
+    def residuals(x):
+        _, view_poses = unpack(x)
+        return (model.project_many(object_points, view_poses[:, :3], view_poses[:, 3:], view_index) - image_points).ravel()
+
+    # every residual row touches all free intrinsics and the 6 pose parameters of its own view
+    num_rows = 2 * len(view_index)
+    rows = np.concatenate([np.repeat(np.arange(num_rows), num_free), np.repeat(np.arange(num_rows), 6)])
+    columns = np.concatenate([np.tile(np.arange(num_free), num_rows),
+                              num_free + 6 * np.repeat(view_index, 2 * 6) + np.tile(np.arange(6), num_rows)])
+    sparsity = coo_matrix((np.ones(len(rows), np.int8), (rows, columns)), shape=(num_rows, num_free + 6 * num_views)).tocsr()
+    result = least_squares(residuals, np.concatenate([initial[free], poses.ravel()]), jac_sparsity=sparsity,
+                           x_scale='jac', method='trf', ftol=1e-6, max_nfev=max_nfev, loss=loss, f_scale=f_scale,
+                           tr_options=sparse_lsmr_options)
+    intrinsics, view_poses = unpack(result.x)
+
+    errors = result.fun.reshape(-1, 2)
+    rms = np.sqrt(np.mean(np.sum(errors ** 2, axis=1)))
+    per_view = per_view_rms(np.linalg.norm(errors, axis=1), view_index, num_views).reshape(-1, 1)
+
+    # covariance of the intrinsics through the Schur complement of the block diagonal pose part,
+    # residual variance over the degrees of freedom of the 2N residual components. OpenCV 4.6 divides by
+    # N - p instead, its deviations come out sqrt((2N - p) / (N - p)) larger. The poses of views without
+    # points are not observed and do not count, without redundancy there is no estimate
+    counts = np.bincount(view_index, minlength=num_views)
+    dof = result.fun.size - num_free - 6 * np.count_nonzero(counts)
+    sigma2 = np.sum(np.square(result.fun)) / dof if dof > 0 else np.inf
+    jacobian = result.jac.tocsr()
+    row_view = np.repeat(view_index, 2)
+    J_intrinsics = jacobian[:, :num_free].toarray()
+    pose_part = jacobian[:, num_free:].tocoo()
+    J_pose = np.zeros((jacobian.shape[0], 6))
+    J_pose[pose_part.row, pose_part.col - 6 * row_view[pose_part.row]] = pose_part.data
+    order = np.argsort(row_view, kind='stable')
+    # reduceat needs valid start indices and repeats a row for empty segments, views without points get zero blocks
+    starts = np.minimum(np.searchsorted(row_view[order], np.arange(num_views)), len(order) - 1)
+    C = np.add.reduceat(J_pose[order, :, None] * J_pose[order, None, :], starts, axis=0)
+    B = np.add.reduceat(J_intrinsics[order, :, None] * J_pose[order, None, :], starts, axis=0)
+    C[counts == 0] = 0
+    B[counts == 0] = 0
+    C_inv = np.linalg.pinv(C)
+    B_C_inv = np.einsum('vij,vjk->vik', B, C_inv)
+    schur = J_intrinsics.T @ J_intrinsics - np.einsum('vik,vjk->ij', B_C_inv, B)
+    schur_inv = np.linalg.pinv(schur)
+    std_intrinsics = np.zeros(len(initial))
+    std_intrinsics[free] = np.sqrt(np.abs(np.diag(schur_inv)) * sigma2)
+    pose_variance = np.einsum('vkk->vk', C_inv) + np.einsum('vik,ij,vjk->vk', B_C_inv, schur_inv, B_C_inv)
+    std_extrinsics = np.sqrt(np.abs(pose_variance) * sigma2).ravel()
+
+    if fisheye:
+        dist_out = intrinsics[4:8].reshape(-1, 1)
+    else:
+        # same layout as OpenCV: 14 coefficients as soon as one of the extended models is on
+        size = 14 if flags & (cv2.CALIB_RATIONAL_MODEL | cv2.CALIB_THIN_PRISM_MODEL | cv2.CALIB_TILTED_MODEL) else 5
+        dist_out = intrinsics[4:4 + size].reshape(-1, 1)
+    rvecs_out = tuple(pose[:3].reshape(3, 1) for pose in view_poses)
+    tvecs_out = tuple(pose[3:].reshape(3, 1) for pose in view_poses)
+    return rms, model.K, dist_out, rvecs_out, tvecs_out, std_intrinsics.reshape(-1, 1), std_extrinsics.reshape(-1, 1), per_view
+
+def rig_calibrate(models, object_points, image_points, camera_index, capture_index, camera_poses, board_poses, flags, max_nfev=100):
+    """
+    Joint bundle adjustment of a camera rig: the intrinsics of every camera, the pose of every camera
+    relative to camera 0 (camera_poses (C, 6), rvec and tvec taking reference coordinates into the
+    camera, row 0 stays the identity) and one board pose per capture in reference coordinates
+    (board_poses (I, 6)). Point i is board point object_points[i] seen by camera camera_index[i] in
+    capture capture_index[i]. models are PinholeModel/FisheyeModel instances with the starting
+    intrinsics, flags the OpenCV calibration flags of every camera. The models are updated in place,
+    returns (rms, camera_poses, board_poses, per_camera_rms, errors) with errors the per-point
+    reprojection error.
+    """
+    object_points = np.asarray(object_points, np.float64).reshape(-1, 3)
+    image_points = np.asarray(image_points, np.float64).reshape(-1, 2)
+    camera_index = np.asarray(camera_index, np.int64)
+    capture_index = np.asarray(capture_index, np.int64)
+    num_cameras = len(models)
+    num_captures = len(board_poses)
+
+    # per camera intrinsic layout and free parameters, same flag semantics as sparse_calibrate
+    initials, frees, aspect_ratios = [], [], []
+    for model, camera_flags in zip(models, flags):
+        fisheye = isinstance(model, FisheyeModel)
+        initial = np.concatenate([[model.K[0, 0], model.K[1, 1], model.K[0, 2], model.K[1, 2]], model.dist])
+        free, initial = intrinsic_parameter_mask(camera_flags, initial, fisheye)
+        initials.append(initial)
+        frees.append(free)
+        aspect_ratios.append(initial[0] / initial[1] if (not fisheye and camera_flags & cv2.CALIB_FIX_ASPECT_RATIO) else None)
+    num_free = np.array([np.count_nonzero(free) for free in frees], np.int64)
+    intrinsic_offsets = np.concatenate([[0], np.cumsum(num_free)])
+    camera_offset = intrinsic_offsets[-1]
+    board_offset = camera_offset + 6 * (num_cameras - 1)
+    points = [np.flatnonzero(camera_index == camera) for camera in range(num_cameras)]
+
+    def unpack(x):
+        for camera, model in enumerate(models):
+            intrinsics = initials[camera].copy()
+            intrinsics[frees[camera]] = x[intrinsic_offsets[camera]:intrinsic_offsets[camera + 1]]
+            if aspect_ratios[camera] is not None:
+                intrinsics[0] = intrinsics[1] * aspect_ratios[camera]
+            model.K = np.array([[intrinsics[0], 0, intrinsics[2]], [0, intrinsics[1], intrinsics[3]], [0, 0, 1]])
+            model.dist = intrinsics[4:]
+        rig_poses = np.vstack([np.zeros((1, 6)), x[camera_offset:board_offset].reshape(-1, 6)])
+        return rig_poses, x[board_offset:].reshape(num_captures, 6)
+
+    def residuals(x):
+        rig_poses, capture_poses = unpack(x)
+        # board -> reference for every point, then reference -> camera
+        reference = models[0].camera_points(object_points, capture_poses[:, :3], capture_poses[:, 3:], capture_index)
+        projected = np.empty_like(image_points)
+        for camera, model in enumerate(models):
+            cam = model.camera_points(reference[points[camera]], rig_poses[camera:camera + 1, :3], rig_poses[camera:camera + 1, 3:])
+            projected[points[camera]] = model.project(cam)
+        return (projected - image_points).ravel()
+
+    # a point depends on its camera's intrinsics, its camera's rig pose (not for the reference) and its capture's board pose
+    point_ids = np.arange(len(camera_index))
+    counts = num_free[camera_index]
+    intrinsic_points = np.repeat(point_ids, counts)
+    intrinsic_columns = np.repeat(intrinsic_offsets[camera_index], counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    rig_points = point_ids[camera_index > 0]
+    rig_columns = camera_offset + 6 * np.repeat(camera_index[rig_points] - 1, 6) + np.tile(np.arange(6), len(rig_points))
+    board_columns = board_offset + 6 * np.repeat(capture_index, 6) + np.tile(np.arange(6), len(point_ids))
+    point_rows = np.concatenate([intrinsic_points, np.repeat(rig_points, 6), np.repeat(point_ids, 6)])
+    columns = np.concatenate([intrinsic_columns, rig_columns, board_columns])
+    rows = np.concatenate([2 * point_rows, 2 * point_rows + 1])
+    columns = np.concatenate([columns, columns])
+    num_parameters = board_offset + 6 * num_captures
+    sparsity = coo_matrix((np.ones(len(rows), np.int8), (rows, columns)), shape=(2 * len(point_ids), num_parameters)).tocsr()
+
+    x0 = np.concatenate([np.concatenate([initial[free] for initial, free in zip(initials, frees)]),
+                         np.asarray(camera_poses, np.float64).reshape(-1, 6)[1:].ravel(),
+                         np.asarray(board_poses, np.float64).reshape(-1, 6).ravel()])
+    result = least_squares(residuals, x0, jac_sparsity=sparsity, x_scale='jac', method='trf', ftol=1e-6, max_nfev=max_nfev,
+                           tr_options=sparse_lsmr_options)
+    rig_poses, capture_poses = unpack(result.x)
+
+    errors = np.linalg.norm(result.fun.reshape(-1, 2), axis=1)
+    rms = np.sqrt(np.mean(np.square(errors)))
+    per_camera = per_view_rms(errors, camera_index, num_cameras)
+    return rms, rig_poses, capture_poses, per_camera, errors
+
+def expand_views(result, views, num_views):
+    """
+    Result of a calibrateCameraCharucoExtended style solve over the given views, back to num_views entries.
+    The views left out get None poses and zero extrinsic deviations and errors.
+    """
+    if len(views) == num_views:
+        return result
+    ret, camera_matrix, distortion_coefficients, rvecs, tvecs, std_intrinsics, std_extrinsics, per_view = result
+    all_rvecs, all_tvecs = [None] * num_views, [None] * num_views
+    all_std_extrinsics = np.zeros((num_views, 6))
+    all_per_view = np.zeros((num_views, 1))
+    for position, view in enumerate(views):
+        all_rvecs[view], all_tvecs[view] = rvecs[position], tvecs[position]
+        all_std_extrinsics[view] = np.ravel(std_extrinsics)[6 * position:6 * position + 6]
+        all_per_view[view] = np.ravel(per_view)[position]
+    return ret, camera_matrix, distortion_coefficients, all_rvecs, all_tvecs, std_intrinsics, all_std_extrinsics.reshape(-1, 1), all_per_view
+
+class DetectionSet(object):
+    """
+    ChArUco detections of one camera in CSR layout: contiguous float32 corners (N, 2), int32 ids (N,),
+    per-view offsets (V + 1,) and a boolean inlier mask (N,). Filtering flips the mask instead of
+    rebuilding lists, views are slices of the shared arrays and the per-view lists the OpenCV
+    solvers take are only built when asked for.
+    """
+    def __init__(self, corners, ids, offsets, inliers=None):
+        self.corners = corners
+        self.ids = ids
+        self.offsets = offsets
+        self.inliers = np.ones(len(ids), bool) if inliers is None else inliers
+        self._view_index = None
+
+    @classmethod
+    def from_lists(cls, allCorners, allIds):
+        counts = np.array([0 if ids is None else len(ids) for ids in allIds], np.int64)
+        offsets = np.zeros(len(counts) + 1, np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        if offsets[-1] == 0:
+            return cls(np.zeros((0, 2), np.float32), np.zeros(0, np.int32), offsets)
+        corners = np.concatenate([np.asarray(c, np.float32).reshape(-1, 2) for c, n in zip(allCorners, counts) if n > 0])
+        ids = np.concatenate([np.asarray(i, np.int32).ravel() for i, n in zip(allIds, counts) if n > 0])
+        return cls(corners, ids, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def num_points(self):
+        return len(self.ids)
+
+    @property
+    def counts(self):
+        return np.diff(self.offsets)
+
+    @property
+    def view_index(self):
+        """View number of every point."""
+        if self._view_index is None:
+            self._view_index = np.repeat(np.arange(len(self)), self.counts)
+        return self._view_index
+
+    def view(self, i):
+        """(corners, ids, inliers) of view i, as slices of the shared arrays."""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.corners[start:end], self.ids[start:end], self.inliers[start:end]
+
+    def object_points(self, chessboard_corners):
+        """Board coordinates of every point, (N, 3) float32."""
+        return np.asarray(chessboard_corners, np.float32).reshape(-1, 3)[self.ids]
+
+    def select_views(self, views):
+        """New set holding only the given views, in the given order."""
+        views = np.asarray(views, np.int64)
+        counts = self.counts[views]
+        offsets = np.zeros(len(views) + 1, np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        points = np.concatenate([np.arange(self.offsets[v], self.offsets[v + 1]) for v in views]) if len(views) else np.zeros(0, np.int64)
+        return DetectionSet(self.corners[points], self.ids[points], offsets, self.inliers[points])
+
+    def drop_views(self, views):
+        keep = np.ones(len(self), bool)
+        keep[np.asarray(views, np.int64)] = False
+        return self.select_views(np.flatnonzero(keep))
+
+    def corners_list(self, views=None, inliers_only=True):
+        """Per-view (n, 1, 2) float32 corners as the OpenCV solvers take them."""
+        views = range(len(self)) if views is None else views
+        out = []
+        for i in views:
+            corners, _, inliers = self.view(i)
+            out.append((corners[inliers] if inliers_only else corners).reshape(-1, 1, 2))
+        return out
+
+    def ids_list(self, views=None, inliers_only=True):
+        """Per-view (n, 1) int32 ids as the OpenCV solvers take them."""
+        views = range(len(self)) if views is None else views
+        out = []
+        for i in views:
+            _, ids, inliers = self.view(i)
+            out.append((ids[inliers] if inliers_only else ids).reshape(-1, 1))
+        return out
+
+class CoverageAccumulator(object):
+    """
+    Occupancy grid of the detected corners of one camera, updated per detection with a single bincount,
+    so it can run live in the capture loop. score() and region_scores() give the fraction of occupied cells,
+    render() paints the grid into a coverage image in one step.
+    """
+    def __init__(self, width, height, grid=(32, 20)):
+        self.width, self.height = width, height
+        self.nx, self.ny = grid
+        self.counts = np.zeros(self.nx * self.ny, np.int64)
+        self.views = 0
+
+    def add(self, corners):
+        """Accumulates the corners (n, 1, 2) or (n, 2) of one detection."""
+        if corners is None or len(corners) == 0:
+            return
+        corners = np.asarray(corners, np.float64).reshape(-1, 2)
+        column = np.clip((corners[:, 0] * self.nx / self.width).astype(np.int64), 0, self.nx - 1)
+        row = np.clip((corners[:, 1] * self.ny / self.height).astype(np.int64), 0, self.ny - 1)
+        self.counts += np.bincount(row * self.nx + column, minlength=self.counts.size)
+        self.views += 1
+
+    def grid(self):
+        return self.counts.reshape(self.ny, self.nx)
+
+    def score(self, min_count=1):
+        """Fraction of cells with at least min_count corners."""
+        return float(np.mean(self.counts >= min_count))
+
+    def region_scores(self, nx=4, ny=4, min_count=1):
+        """(ny, nx) fractions of occupied cells per image region."""
+        region_x = np.arange(self.nx) * nx // self.nx
+        region_y = np.arange(self.ny) * ny // self.ny
+        regions = (region_y[:, None] * nx + region_x[None, :]).ravel()
+        occupied = np.bincount(regions, weights=self.counts >= min_count, minlength=nx * ny)
+        cells = np.bincount(regions, minlength=nx * ny)
+        return (occupied / np.maximum(cells, 1)).reshape(ny, nx)
+
+    def sufficient(self, target=0.8, min_count=1):
+        return self.score(min_count) >= target
+
+    def render(self, background=None, saturation=5):
+        """BGR coverage image, occupied cells shaded from light to dark green with the corner density."""
+        if background is None:
+            background = np.full((self.height, self.width, 3), 255, np.uint8)
+        density = np.minimum(self.grid(), saturation) / saturation
+        cells = np.stack([80 * (1 - density), 255 - 100 * density, 80 * (1 - density)], axis=2).astype(np.uint8)
+        cells = cv2.resize(cells, (background.shape[1], background.shape[0]), interpolation=cv2.INTER_NEAREST)
+        occupied = cv2.resize((self.grid() > 0).astype(np.uint8), (background.shape[1], background.shape[0]), interpolation=cv2.INTER_NEAREST)
+        return np.where(occupied[..., None] > 0, cells, background)
+
+class CaptureSufficiencyEstimator(object):
+    """
+    Intrinsic calibration of one camera updated after every captured view, so the capture loop can
+    stop once the parameters are known well enough. Each add() poses the new view with the current
+    intrinsics and re-runs sparse_calibrate started from the previous solution, which only needs a few
+    iterations. uncertainty() gives the standard deviation of every free parameter, sufficient() tells
+    whether fx/fy/cx/cy (pixels) and all distortion terms are below their targets. The deviations are only
+    trusted once the residual degrees of freedom (2N - p) are at least min_redundancy times the number of
+    parameters p, before that the camera is never reported sufficient.
+    """
+    pinhole_parameters = ["fx", "fy", "cx", "cy", "k1", "k2", "p1", "p2", "k3", "k4", "k5", "k6", "s1", "s2", "s3", "s4", "tauX", "tauY"]
+    fisheye_parameters = ["fx", "fy", "cx", "cy", "k1", "k2", "k3", "k4"]
+
+    def __init__(self, board, K, dist=None, flags=0, fisheye=False, targets=None, min_views=5, min_corners=6, max_nfev=20, min_redundancy=1.0):
+        self.board = board
+        self.flags = flags
+        self.fisheye = fisheye
+        self.targets = {"fx": 1.0, "fy": 1.0, "cx": 1.0, "cy": 1.0, "distortion": 0.01}
+        if targets is not None:
+            self.targets.update(targets)
+        self.min_views = min_views
+        self.min_corners = min_corners
+        self.max_nfev = max_nfev
+        self.min_redundancy = min_redundancy
+        self.model = camera_model("fisheye" if fisheye else "perspective", K, np.zeros(4 if fisheye else 14) if dist is None else dist)
+        self.names = self.fisheye_parameters if fisheye else self.pinhole_parameters
+        self.free, _ = intrinsic_parameter_mask(flags, np.zeros(len(self.names)), fisheye)
+        self.object_points = []
+        self.image_points = []
+        self.view_index = []
+        self.rvecs = []
+        self.tvecs = []
+        self.std = np.full(len(self.names), np.inf)
+        self.rms = None
+        self.dof = 0
+        self.views = 0
+
+    def add(self, corners, ids):
+        """Adds the detection of one view and updates the solution, returns sufficient()."""
+        if corners is None or ids is None or len(ids) < self.min_corners:
+            return self.sufficient()
+        image_points = np.asarray(corners, np.float64).reshape(-1, 2)
+        object_points = np.asarray(self.board.chessboardCorners, np.float64)[np.asarray(ids).ravel()]
+        # the new view starts from its pose under the current intrinsics
+        normalized = self.model.unproject_many(image_points)
+        ok, rvec, tvec = cv2.solvePnP(object_points, normalized, np.eye(3), None, flags=cv2.SOLVEPNP_IPPE)
+        if not ok or not (np.all(np.isfinite(rvec)) and np.all(np.isfinite(tvec))):
+            # degenerate view (e.g. collinear corners), it would only break the solve
+            return self.sufficient()
+        self.object_points.append(object_points)
+        self.image_points.append(image_points)
+        self.view_index.append(np.full(len(image_points), self.views))
+        self.rvecs.append(rvec.reshape(3, 1))
+        self.tvecs.append(tvec.reshape(3, 1))
+        self.views += 1
+        self.dof = 2 * sum(len(points) for points in self.image_points) - self.num_parameters()
+        if self.views >= self.min_views and self.dof > 0:
+            self.update()
+        return self.sufficient()
+
+    def update(self):
+        rms, K, dist, rvecs, tvecs, std_intrinsics, _, _ = sparse_calibrate(
+            np.concatenate(self.object_points), np.concatenate(self.image_points), np.concatenate(self.view_index),
+            self.model.K, self.model.dist, self.rvecs, self.tvecs, self.flags, self.fisheye, max_nfev=self.max_nfev)
+        self.model = camera_model("fisheye" if self.fisheye else "perspective", K, dist)
+        self.rvecs, self.tvecs = list(rvecs), list(tvecs)
+        self.std = np.where(self.free, std_intrinsics.ravel(), 0.0)
+        self.rms = rms
+
+    def num_parameters(self):
+        return int(np.count_nonzero(self.free)) + 6 * self.views
+
+    def redundant(self):
+        """Whether there are enough residual degrees of freedom for the deviations to mean anything."""
+        return self.dof >= self.min_redundancy * self.num_parameters()
+
+    def uncertainty(self):
+        """Standard deviation of every free parameter by name."""
+        return {name: float(std) for name, std, free in zip(self.names, self.std, self.free) if free}
+
+    def converged(self):
+        """Per free parameter whether its standard deviation is below the target."""
+        return {name: std <= self.targets.get(name, self.targets["distortion"]) for name, std in self.uncertainty().items()}
+
+    def sufficient(self):
+        return self.views >= self.min_views and self.redundant() and all(self.converged().values())
+
+    def report(self):
+        converged = self.converged()
+        print(f"Capture sufficiency after {self.views} views: rms {self.rms}, {self.dof} degrees of freedom, {'sufficient' if self.sufficient() else 'not sufficient'}")
+        for name, std in self.uncertainty().items():
+            print(f"  {name}: std {round(std, 6)} ({'ok' if converged[name] else 'above ' + str(self.targets.get(name, self.targets['distortion']))})")
+
+class CharucoDetectionStream(object):
+    """
+    Detection stage fed from the capture loop. Frames (paths or arrays) are submitted as they
+    are captured, detected in the background and handed back in submission order, so detection
+    is done by the time the capture is. charucos() gives the detections in the format
+    StereoCalibration.calibrate() takes for its charucos argument. With a CoverageAccumulator
+    as coverage, every successful detection is added to it as it is collected.
+    """
+    def __init__(self, detector, workers=2, scale_req=False, req_resolution=(800, 1280), coverage=None):
+        self.detector = detector
+        self.coverage = coverage
+        self.scale_req = scale_req
+        self.req_resolution = req_resolution
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.pending = deque()
+        self.detections = []
+        self.failed = []
+
+    def submit(self, frame, key=None):
+        """Queues a frame for detection, key defaults to the path or the submission index."""
+        if key is None:
+            key = frame if not isinstance(frame, np.ndarray) else len(self.detections) + len(self.pending)
+        if isinstance(frame, np.ndarray):
+            # capture loops tend to reuse their buffers
+            frame = frame.copy()
+        future = self.pool.submit(self.detector.detect_image, frame, self.scale_req, self.req_resolution)
+        self.pending.append((key, future))
+
+    def _collect(self):
+        key, future = self.pending.popleft()
+        shape, charuco_corners, charuco_ids, marker_corners, marker_ids, _ = future.result()
+        detection = (key, shape, charuco_corners, charuco_ids, marker_corners, marker_ids)
+        if charuco_corners is None or charuco_ids is None or len(charuco_corners) <= 3:
+            print(f'Failed to detect more than 3 markers on image {key}')
+            self.failed.append(key)
+        elif self.coverage is not None:
+            self.coverage.add(charuco_corners)
+        self.detections.append(detection)
+        return detection
+
+    def poll(self):
+        """Yields the detections that are already done, in submission order, without blocking."""
+        while self.pending and self.pending[0][1].done():
+            yield self._collect()
+
+    def drain(self):
+        """Yields all outstanding detections in submission order, waiting for them."""
+        while self.pending:
+            yield self._collect()
+
+    def run(self, frames):
+        """Generator over a capture iterable: submits every frame as it arrives and yields detections as soon as they are done."""
+        for frame in frames:
+            if isinstance(frame, tuple):
+                self.submit(*frame)
+            else:
+                self.submit(frame)
+            yield from self.poll()
+        yield from self.drain()
+
+    def close(self):
+        for _ in self.drain():
+            pass
+        self.pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def charucos(self):
+        """
+        [(ids, corners), ...] sorted like calibrate() sorts the image paths, one entry per frame. Failed
+        frames keep an empty placeholder so the entries stay aligned with the images and the other cameras.
+        """
+        detections = self.detections
+        if all(isinstance(d[0], str) for d in detections):
+            detections = sorted(detections, key=lambda d: d[0])
+        charucos = []
+        for key, _, charuco_corners, charuco_ids, _, _ in detections:
+            if key in self.failed:
+                charuco_corners, charuco_ids = empty_detection()
+            charucos.append((charuco_ids, charuco_corners))
+        return charucos
+
+class CharucoDetectionCache(object):
+    """
+    On-disk cache of ChArUco detections for one image directory.
+    Entries are keyed by the hash of the image file, the whole file is dropped when the
+    board or detector setup (fingerprint) changes and entries of images that are no
+    longer in the dataset are pruned on save.
+    """
+    version = 1
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.entries = {}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self.load()
+
+    @staticmethod
+    def image_key(im):
+        with open(im, 'rb') as f:
+            return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            data = np.load(self.path, allow_pickle=False)
+            if int(data['version']) != self.version or str(data['fingerprint']) != self.fingerprint:
+                print(f"Detection cache {self.path} is stale, detecting again")
+                self.dirty = True
+                return
+            corner_offsets = data['corner_offsets']
+            marker_offsets = data['marker_offsets']
+            for i, key in enumerate(data['keys']):
+                if not data['detected'][i]:
+                    self.entries[str(key)] = (tuple(data['shapes'][i]), None, None, None, None)
+                    continue
+                c0, c1 = corner_offsets[i], corner_offsets[i + 1]
+                m0, m1 = marker_offsets[i], marker_offsets[i + 1]
+                charuco_corners = data['charuco_corners'][c0:c1].reshape(-1, 1, 2)
+                charuco_ids = data['charuco_ids'][c0:c1].reshape(-1, 1)
+                marker_corners = tuple(corner.reshape(1, 4, 2) for corner in data['marker_corners'][m0:m1])
+                marker_ids = data['marker_ids'][m0:m1].reshape(-1, 1)
+                self.entries[str(key)] = (tuple(data['shapes'][i]), charuco_corners, charuco_ids, marker_corners, marker_ids)
+        except Exception as e:
+            print(f"Failed to read detection cache {self.path}: {e}")
+            self.entries = {}
+            self.dirty = True
+
+    def get(self, key):
+        self.used.add(key)
+        if key in self.entries:
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, shape, charuco_corners, charuco_ids, marker_corners, marker_ids):
+        self.used.add(key)
+        self.entries[key] = (tuple(shape), charuco_corners, charuco_ids, marker_corners, marker_ids)
+        self.dirty = True
+
+    def save(self):
+        stale = set(self.entries) - self.used
+        if not self.dirty and not stale:
+            return
+        for key in stale:
+            del self.entries[key]
+        keys = sorted(self.entries)
+        shapes = np.zeros((len(keys), 2), np.int32)
+        detected = np.zeros(len(keys), bool)
+        corner_offsets = np.zeros(len(keys) + 1, np.int64)
+        marker_offsets = np.zeros(len(keys) + 1, np.int64)
+        charuco_corners, charuco_ids, marker_corners, marker_ids = [], [], [], []
+        for i, key in enumerate(keys):
+            shape, corners, ids, markers, mids = self.entries[key]
+            shapes[i] = shape[:2]
+            detected[i] = corners is not None and ids is not None
+            if detected[i]:
+                charuco_corners.append(np.asarray(corners, np.float32).reshape(-1, 2))
+                charuco_ids.append(np.asarray(ids, np.int32).ravel())
+                marker_corners.append(np.asarray(markers, np.float32).reshape(-1, 4, 2))
+                marker_ids.append(np.asarray(mids, np.int32).ravel())
+            corner_offsets[i + 1] = corner_offsets[i] + (len(charuco_ids[-1]) if detected[i] else 0)
+            marker_offsets[i + 1] = marker_offsets[i] + (len(marker_ids[-1]) if detected[i] else 0)
+        with open(self.path, 'wb') as f:
+            np.savez_compressed(f,
+                version=self.version,
+                fingerprint=self.fingerprint,
+                keys=np.array(keys, dtype='U32'),
+                shapes=shapes,
+                detected=detected,
+                corner_offsets=corner_offsets,
+                marker_offsets=marker_offsets,
+                charuco_corners=np.concatenate(charuco_corners) if charuco_corners else np.zeros((0, 2), np.float32),
+                charuco_ids=np.concatenate(charuco_ids) if charuco_ids else np.zeros(0, np.int32),
+                marker_corners=np.concatenate(marker_corners) if marker_corners else np.zeros((0, 4, 2), np.float32),
+                marker_ids=np.concatenate(marker_ids) if marker_ids else np.zeros(0, np.int32))
+        self.dirty = False
+
+class StageLocal(object):
+    """
+    StereoCalibration attribute private to the thread of the calibration stage that set it, so stages
+    running concurrently each see their own camera. Threads that never set it (helper pools) see the
+    value set last by any stage, which is what the sequential code always saw.
+    """
+    def __set_name__(self, owner, name):
+        self.attribute = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        local = instance.__dict__.setdefault('_stage_local', threading.local())
+        if hasattr(local, self.attribute):
+            return getattr(local, self.attribute)
+        shared = instance.__dict__.setdefault('_stage_shared', {})
+        if self.attribute not in shared:
+            raise AttributeError(self.attribute)
+        return shared[self.attribute]
+
+    def __set__(self, instance, value):
+        setattr(instance.__dict__.setdefault('_stage_local', threading.local()), self.attribute, value)
+        instance.__dict__.setdefault('_stage_shared', {})[self.attribute] = value
+
+class StageScheduler(object):
+    """
+    Runs calibration stages as a dependency graph on a pool of workers: a stage starts as soon as the
+    stages it depends on are done. A stage fails by returning an error string (or raising), the stages
+    depending on it are skipped. A failed required stage also skips every stage which has not started
+    yet, other than the required ones. With one worker the stages run in the order they were added on the
+    calling thread. errors collects the messages per stage, timeline the start/end of every stage.
+    """
+    def __init__(self, workers=1):
+        self.workers = workers
+        self.stages = OrderedDict()
+        self.required = set()
+        self.results = {}
+        self.errors = {}
+        self.timeline = []
+        self.exception = None
+
+    def add(self, name, function, depends=(), required=False):
+        unknown = [depend for depend in depends if depend not in self.stages]
+        if unknown:
+            raise ValueError(f"Stage {name} depends on {unknown}, which have not been added")
+        self.stages[name] = (function, tuple(depends))
+        if required:
+            self.required.add(name)
+
+    def run_stage(self, name, origin):
+        function, _ = self.stages[name]
+        start = time.time()
+        status = "done"
+        try:
+            result = function()
+        except Exception as e:
+            result = None
+            status = "raised"
+            self.exception = self.exception or e
+            self.errors.setdefault(name, []).append(str(e))
+        self.results[name] = result
+        if isinstance(result, str):
+            status = "failed"
+            self.errors.setdefault(name, []).append(result)
+        end = time.time()
+        self.timeline.append({"stage": name, "start": start - origin, "end": end - origin, "duration": end - start,
+                              "thread": threading.current_thread().name, "status": status})
+        return status
+
+    def run(self):
+        origin = time.time()
+        status = {}
+        def ready(name):
+            depends = self.stages[name][1]
+            return name not in status and all(status.get(depend) in ("done", "failed", "raised", "skipped") for depend in depends)
+        def skip_failed(name):
+            failed = [depend for depend in self.stages[name][1] if status.get(depend) != "done"]
+            if name not in self.required:
+                failed += [stage for stage in self.required if status.get(stage) in ("failed", "raised") and stage not in failed]
+            if failed:
+                status[name] = "skipped"
+                self.errors.setdefault(name, []).append(f"Skipped, {', '.join(failed)} did not finish")
+                self.timeline.append({"stage": name, "start": time.time() - origin, "end": time.time() - origin, "duration": 0.0,
+                                      "thread": threading.current_thread().name, "status": "skipped"})
+            return bool(failed)
+
+        if self.workers <= 1:
+            for name in self.stages:
+                if not skip_failed(name):
+                    status[name] = self.run_stage(name, origin)
+                if self.exception is not None:
+                    break
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                running = {}
+                while len(status) < len(self.stages):
+                    for name in [name for name in self.stages if ready(name) and name not in running.values()]:
+                        if not skip_failed(name):
+                            running[executor.submit(self.run_stage, name, origin)] = name
+                    if not running:
+                        continue
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        status[running.pop(future)] = future.result()
+                    if any(status.get(stage) in ("failed", "raised") for stage in self.required):
+                        # stages still queued behind the workers do not start after a required stage failed
+                        for future, name in list(running.items()):
+                            if name not in self.required and future.cancel():
+                                running.pop(future)
+                                skip_failed(name)
+        if self.exception is not None:
+            raise self.exception
+        return status
+
+    def critical_path(self):
+        """Duration of the longest chain of dependent stages, the lower bound of the wall time."""
+        durations = {entry["stage"]: entry["duration"] for entry in self.timeline}
+        finish = {}
+        for name, (_, depends) in self.stages.items():
+            finish[name] = durations.get(name, 0.0) + max([finish[depend] for depend in depends], default=0.0)
+        return max(finish.values(), default=0.0)
+
+    def report(self):
+        wall = max([entry["end"] for entry in self.timeline], default=0.0)
+        total = sum(entry["duration"] for entry in self.timeline)
+        print(f"Stage timeline ({self.workers} workers):")
+        for entry in sorted(self.timeline, key=lambda entry: entry["start"]):
+            print(f"  {entry['stage']}: {round(entry['start'], 3)}s -> {round(entry['end'], 3)}s ({round(entry['duration'], 3)}s, {entry['status']}, {entry['thread']})")
+        print(f"Stages took {round(total, 3)}s in {round(wall, 3)}s wall time, critical path {round(self.critical_path(), 3)}s")
+
 class StereoExceptions(Exception):
     def __init__(self, message, stage, path=None, *args, **kwargs) -> None:
         self.stage = stage
@@ -154,8 +1367,15 @@ class StereoExceptions(Exception):
 
 class StereoCalibration(object):
     """Class to Calculate Calibration and Rectify a Stereo Camera."""
-
-    def __init__(self, traceLevel: float = 1.0, outputScaleFactor: float = 0.5, disableCamera: list = [], model = None,distortion_model = {}, filtering_enable = False, initial_max_threshold = 15, initial_min_filtered = 0.05, calibration_max_threshold = 10):
+    # per camera state of the calibration stages, private to the stage's thread
+    name = StageLocal()
+    id = StageLocal()
+    img_path = StageLocal()
+    cameraModel_ccm = StageLocal()
+    model_ccm = StageLocal()
+    keyframe_points_ratio = StageLocal()
+
+    def __init__(self, traceLevel: float = 1.0, outputScaleFactor: float = 0.5, disableCamera: list = [], model = None,distortion_model = {}, filtering_enable = False, initial_max_threshold = 15, initial_min_filtered = 0.05, calibration_max_threshold = 10, detection_workers = 1, detection_executor = "thread", detection_cache = False, frame_store_bytes = 1 << 30, detection_pyramid_levels = 0, detection_preset = "default", pose_threshold_sweep = False, pose_workers = 4, pose_init = "ransac", intrinsic_init = "hfov", intrinsic_schedule = "legacy", keyframe_selection = False, keyframe_coverage = 0.95, coverage_grid = (32, 20), intrinsic_solver = "opencv", rig_calibration = False, stage_workers = 1, robust_loss = None, robust_loss_scale = 1.0, distortion_candidates = ("000111011", "THERMAL", "NORMAL", "PRISM"), model_selection_folds = 3, model_selection_tolerance = 0.02, model_selection_workers = 4, quality_filter = None, quality_thresholds = {}):
         self.filtering_enable = filtering_enable
         self.ccm_model = distortion_model
         self.model = model
@@ -167,6 +1387,39 @@ class StereoCalibration(object):
         self.initial_min_filtered = initial_min_filtered
         self.calibration_max_threshold = calibration_max_threshold
         self.calibration_min_filtered = initial_min_filtered
+        self.detection_workers = detection_workers
+        self.detection_executor = detection_executor
+        self.detection_cache = detection_cache
+        self.frame_store_bytes = frame_store_bytes
+        self.detection_pyramid_levels = detection_pyramid_levels
+        self.detection_preset = detection_preset
+        self.pose_threshold_sweep = pose_threshold_sweep
+        self.pose_workers = pose_workers
+        self.pose_init = pose_init
+        self.intrinsic_init = intrinsic_init
+        self.closed_form_init = set()
+        self.intrinsic_schedule = intrinsic_schedule
+        self.keyframe_selection = keyframe_selection
+        self.keyframe_coverage = keyframe_coverage
+        self.coverage_grid = coverage_grid
+        self.coverage = {}
+        self.intrinsic_solver = intrinsic_solver
+        self.rig_calibration = rig_calibration
+        self.stage_workers = stage_workers
+        self.robust_loss = robust_loss
+        self.robust_loss_scale = robust_loss_scale
+        self.distortion_candidates = distortion_candidates
+        self.model_selection_folds = model_selection_folds
+        self.model_selection_tolerance = model_selection_tolerance
+        self.model_selection_workers = model_selection_workers
+        self.model_selection = {}
+        self.intrinsic_std = {}
+        self.quality_filter = quality_filter
+        self.quality_thresholds = dict(frame_quality_thresholds, **quality_thresholds)
+        self.frame_quality = {}
+        self.stage_timeline = []
+        self.solve_stats = {}
+        self.frame_store = FrameStore(frame_store_bytes)
 
         """Class to Calculate Calibration and Rectify a Stereo Camera."""
 
@@ -187,6 +1440,13 @@ class StereoCalibration(object):
         self.extrinsic_img = extrinsic_img
         self.cameraModel = camera_model
         self.cameraIntrinsics = {}
+        self.closed_form_init = set()
+        self.solve_stats = {}
+        self.model_selection = {}
+        self.intrinsic_std = {}
+        self.frame_quality = {}
+        self.camera_locks = {}
+        self.coverage = {}
         self.cameraDistortion = {}
         self.distortion_model = {}
         self.calib_model = {}
@@ -196,16 +1456,21 @@ class StereoCalibration(object):
         self.all_errors = {}
         self.errors = {}
         self.data_path = filepath
+        self.frame_store = FrameStore(self.frame_store_bytes)
         self.charucos = charucos 
-        self.aruco_dictionary = aruco.Dictionary_get(aruco.DICT_4X4_1000)
         self.squaresX = squaresX
         self.squaresY = squaresY
-        self.board = aruco.CharucoBoard_create(
+        self.square_size = square_size
+        self.mrk_size = mrk_size
+        self.charuco_detector = CharucoDetector(
             # 22, 16,
             squaresX, squaresY,
             square_size,
             mrk_size,
-            self.aruco_dictionary)
+            preset=self.detection_preset,
+            pyramid_levels=self.detection_pyramid_levels)
+        self.aruco_dictionary = self.charuco_detector.aruco_dictionary
+        self.board = self.charuco_detector.board
 
         self.cams = []
         # parameters = aruco.DetectorParameters_create()
@@ -221,244 +1486,67 @@ class StereoCalibration(object):
                 image_files = glob.glob(images_path + "/*")
                 image_files.sort()
                 for im in image_files:
-                    frame = cv2.imread(im)
-                    self.height[cam_info["name"]], self.width[cam_info["name"]], _ = frame.shape
+                    self.height[cam_info["name"]], self.width[cam_info["name"]] = self.image_size(im)
                     widthRatio = resizeWidth / self.width[cam_info["name"]]
                     heightRatio = resizeHeight / self.height[cam_info["name"]]
                     if (widthRatio > 0.8 and heightRatio > 0.8 and widthRatio <= 1.0 and heightRatio <= 1.0) or (widthRatio > 1.2 and heightRatio > 1.2) or (resizeHeight == 0):
                         resizeWidth = self.width[cam_info["name"]]
                         resizeHeight = self.height[cam_info["name"]]
                     break
+        stage_workers = self.stage_workers
+        if self.traceLevel not in (0, 1):
+            # the trace levels plot from inside the stages, which has to happen on the main thread
+            stage_workers = 1
+        scheduler = StageScheduler(stage_workers)
+        intrinsic_stages = []
         for camera in board_config['cameras'].keys():
             cam_info = board_config['cameras'][camera]
-            self.id = cam_info["name"]
             if cam_info["name"] not in self.disableCamera:
-                print(
-                    '<------------Calibrating {} ------------>'.format(cam_info['name']))
-                images_path = filepath + '/' + cam_info['name']
-                distCoeffsInit = np.zeros((12, 1))
-                if "calib_model" in cam_info.keys():
-                    self.cameraModel_ccm, self.model_ccm = cam_info["calib_model"].split("_")
-                    if self.cameraModel_ccm == "fisheye":
-                        self.model_ccm == None
-                        distCoeffsInit = np.zeros((4, 1))
-                    self.calib_model[cam_info["name"]] = self.cameraModel_ccm
-                    self.distortion_model[cam_info["name"]] = self.model_ccm
-                else:
-                    self.calib_model[cam_info["name"]] = self.cameraModel
-                    if cam_info["name"] in self.ccm_model:
-                        self.distortion_model[cam_info["name"]] = self.ccm_model[cam_info["name"]]
-                    else:
-                        self.distortion_model[cam_info["name"]] = self.model
-
-
-                features = None
-                self.img_path = glob.glob(images_path + "/*")
-                if charucos == {}:
-                    try:
-                        self.img_path = sorted(self.img_path, key=lambda x: int(x.split('_')[1]))
-                    except:
-                        self.img_path.sort()
-                else:
-                    self.img_path.sort()
-                cam_info["img_path"] = self.img_path
-                self.name = cam_info["name"]
-                if per_ccm:
-                    all_features, all_ids, imsize = self.getting_features(images_path, cam_info["name"], features=features)
-                    if isinstance(all_features, str) and all_ids is None:
-                        if cam_info["name"] not in self.errors.keys():
-                            self.errors[cam_info["name"]] = []
-                        self.errors[cam_info["name"]].append(all_features)
-                        continue
-                    cam_info["imsize"] = imsize
-
-                    f = imsize[0] / (2 * np.tan(np.deg2rad(cam_info["hfov"]/2)))
-                    print("INTRINSIC CALIBRATION")
-                    cameraMatrixInit = np.array([[f,    0.0,      imsize[0]/2],
-                                                 [0.0,     f,      imsize[1]/2],
-                                                 [0.0,   0.0,        1.0]])
-                    if cam_info["name"] not in self.cameraIntrinsics.keys():
-                        self.cameraIntrinsics[cam_info["name"]] = cameraMatrixInit
-
-                    if self.traceLevel == 3 or self.traceLevel == 10:
-                        print(
-                            f'Camera Matrix initialization with HFOV of {cam_info["name"]} is.............')
-                        print(cameraMatrixInit)
-                    if cam_info["name"] not in self.cameraDistortion:
-                        self.cameraDistortion[cam_info["name"]] = distCoeffsInit
-
-                    if cam_info["name"] in self.intrinsic_img:
-                        all_features, all_ids, filtered_images = self.remove_features(filtered_features, filtered_ids, self.intrinsic_img[cam_info["name"]], image_files)
-                    else:
-                        filtered_images = images_path
-                    current_time = time.time()
-                    if self.cameraModel != "fisheye":
-                        print("Filtering corners")
-                        removed_features, filtered_features, filtered_ids = self.filtering_features(all_features, all_ids, cam_info["name"],imsize,cam_info["hfov"], cameraMatrixInit, distCoeffsInit)
-
-                        if filtered_features is None:
-                            if cam_info["name"] not in self.errors.keys():
-                                self.errors[cam_info["name"]] = []
-                            self.errors[cam_info["name"]].append(removed_features)
-                            continue
-
-                        print(f"Filtering takes: {time.time()-current_time}")
-                        if  cam_info["name"] not in self.collected_features.keys():
-                            self.collected_features[cam_info["name"]] = filtered_features
-                        if  cam_info["name"] not in self.collected_ids.keys():
-                            self.collected_ids[cam_info["name"]] = filtered_ids
-                    else:
-                        filtered_features = all_features
-                        filtered_ids = all_ids
-
-                    cam_info['filtered_ids'] = filtered_ids
-                    cam_info['filtered_corners'] = filtered_features
-
-                    ret, intrinsics, dist_coeff, _, _, filtered_ids, filtered_corners, size, coverageImage, all_corners, all_ids = self.calibrate_wf_intrinsics(cam_info["name"], all_features, all_ids, filtered_features, filtered_ids, cam_info["imsize"], cam_info["hfov"], features, filtered_images)
-                    if isinstance(ret, str) and all_ids is None:
-                        if cam_info["name"] not in self.errors.keys():
-                            self.errors[cam_info["name"]] = []
-                        self.errors[cam_info["name"]].append(ret)
-                        continue
-                else:
-                    ret, intrinsics, dist_coeff, _, _, filtered_ids, filtered_corners, size, coverageImage, all_corners, all_ids = self.calibrate_intrinsics(
-                        images_path, cam_info['hfov'], cam_info["name"])
-                    cam_info['filtered_ids'] = filtered_ids
-                    cam_info['filtered_corners'] = filtered_corners
-                self.cameraIntrinsics[cam_info["name"]] = intrinsics
-                self.cameraDistortion[cam_info["name"]] = dist_coeff
-                cam_info['intrinsics'] = intrinsics
-                cam_info['dist_coeff'] = dist_coeff
-                cam_info['size'] = size # (Width, height)
-                cam_info['reprojection_error'] = ret
-                print("Reprojection error of {0}: {1}".format(
-                    cam_info['name'], ret))
-                if self.traceLevel == 3 or self.traceLevel == 10:
-                    print("Estimated intrinsics of {0}: \n {1}".format(
-                    cam_info['name'], intrinsics))
-                
-                coverage_name = cam_info['name']
-                print_text = f'Coverage Image of {coverage_name} with reprojection error of {round(ret,5)}'
-                height, width, _ = coverageImage.shape
-
-                if width > resizeWidth and height > resizeHeight:
-                    coverageImage = cv2.resize(
-                    coverageImage, (0, 0), fx= resizeWidth / width, fy= resizeWidth / width)
-
-                height, width, _ = coverageImage.shape
-                if height > resizeHeight:
-                    height_offset = (height - resizeHeight)//2
-                    coverageImage = coverageImage[height_offset:height_offset+resizeHeight, :]
-                
-                height, width, _ = coverageImage.shape
-                height_offset = (resizeHeight - height)//2
-                width_offset = (resizeWidth - width)//2
-                subImage = np.pad(coverageImage, ((height_offset, height_offset), (width_offset, width_offset), (0, 0)), 'constant', constant_values=0)
-                cv2.putText(subImage, print_text, (50, 50+height_offset), cv2.FONT_HERSHEY_SIMPLEX, 2*coverageImage.shape[0]/1750, (0, 0, 0), 2)
-                if combinedCoverageImage is None:
-                    combinedCoverageImage = subImage
-                else:
-                    combinedCoverageImage = np.hstack((combinedCoverageImage, subImage))
-                coverage_file_path = filepath + '/' + coverage_name + '_coverage.png'
-                
-                cv2.imwrite(coverage_file_path, subImage)
+                # a failed intrinsic calibration stops the extrinsic stages, the other intrinsics still run to report their errors
+                scheduler.add(cam_info["name"], partial(self.calibrate_camera_stage, board_config, camera, filepath, charucos, (resizeWidth, resizeHeight)), required = True)
+                intrinsic_stages.append(cam_info["name"])
+        if self.rig_calibration:
+            # one joint solve of all cameras replaces the pairwise stereo calibrations
+            scheduler.add("rig", partial(self.calibrate_rig_stage, board_config), depends = intrinsic_stages)
+        else:
+            # every pair starts as soon as the intrinsics of its two cameras are done
+            for camera in board_config['cameras'].keys():
+                left_cam_info = board_config['cameras'][camera]
+                if str(left_cam_info["name"]) in self.disableCamera or 'to_cam' not in left_cam_info.get('extrinsics', {}):
+                    continue
+                right_cam_info = board_config['cameras'][left_cam_info['extrinsics']['to_cam']]
+                if str(right_cam_info["name"]) not in self.disableCamera:
+                    scheduler.add(f"{left_cam_info['name']}-{right_cam_info['name']}", partial(self.calibrate_extrinsic_stage, board_config, camera, filepath),
+                                  depends = [left_cam_info["name"], right_cam_info["name"]])
+        scheduler.run()
+        scheduler.report()
+        self.stage_timeline = scheduler.timeline
+        for name in intrinsic_stages:
+            if name in scheduler.errors:
+                self.errors[name] = scheduler.errors[name]
         if self.errors != {}:
             string = ""
             for key in self.errors.keys():
                 string += self.errors[key][0] + "\n"
             raise StereoExceptions(message=string, stage="intrinsic")
 
+        for name in intrinsic_stages:
+            subImage = scheduler.results[name]
+            if combinedCoverageImage is None:
+                combinedCoverageImage = subImage
+            else:
+                combinedCoverageImage = np.hstack((combinedCoverageImage, subImage))
         combinedCoverageImage = cv2.resize(combinedCoverageImage, (0, 0), fx=self.output_scale_factor, fy=self.output_scale_factor)
         if enable_disp_rectify:
             # cv2.imshow('coverage image', combinedCoverageImage)
             cv2.waitKey(1)
             cv2.destroyAllWindows()
-        
-        for camera in board_config['cameras'].keys():
-            left_cam_info = board_config['cameras'][camera]
-            if str(left_cam_info["name"]) not in self.disableCamera:
-                if 'extrinsics' in left_cam_info:
-                    if 'to_cam' in left_cam_info['extrinsics']:
-                        left_cam = camera
-                        right_cam = left_cam_info['extrinsics']['to_cam']
-                        left_path = filepath + '/' + left_cam_info['name']
-    
-                        right_cam_info = board_config['cameras'][left_cam_info['extrinsics']['to_cam']]
-                        if str(right_cam_info["name"]) not in self.disableCamera:
-                            right_path = filepath + '/' + right_cam_info['name']
-                            print('<-------------Extrinsics calibration of {} and {} ------------>'.format(
-                                left_cam_info['name'], right_cam_info['name']))
-    
-                            specTranslation = left_cam_info['extrinsics']['specTranslation']
-                            rot = left_cam_info['extrinsics']['rotation']
-    
-                            translation = np.array(
-                                [specTranslation['x'], specTranslation['y'], specTranslation['z']], dtype=np.float32)
-                            rotation = Rotation.from_euler(
-                                'xyz', [rot['r'], rot['p'], rot['y']], degrees=True).as_matrix().astype(np.float32)
-                            if per_ccm and extrinsic_per_ccm:
-                                if left_cam_info["name"] in self.extrinsic_img or right_cam_info["name"] in self.extrinsic_img:
-                                    if left_cam_info["name"] in self.extrinsic_img:
-                                        array = self.extrinsic_img[left_cam_info["name"]]
-                                    elif right_cam_info["name"] in self.extrinsic_img:
-                                        array = self.extrinsic_img[left_cam_info["name"]]
-                                    left_cam_info['filtered_corners'], left_cam_info['filtered_ids'], filtered_images = self.remove_features(left_cam_info['filtered_corners'], left_cam_info['filtered_ids'], array)
-                                    right_cam_info['filtered_corners'], right_cam_info['filtered_ids'], filtered_images = self.remove_features(right_cam_info['filtered_corners'], right_cam_info['filtered_ids'], array)
-                                    removed_features, left_cam_info['filtered_corners'], left_cam_info['filtered_ids'] = self.filtering_features(left_cam_info['filtered_corners'], left_cam_info['filtered_ids'], left_cam_info["name"],left_cam_info["imsize"],left_cam_info["hfov"], left_cam_info['intrinsics'], left_cam_info['dist_coeff'])
-                                    removed_features, right_cam_info['filtered_corners'], right_cam_info['filtered_ids'] = self.filtering_features(right_cam_info['filtered_corners'], right_cam_info['filtered_ids'], right_cam_info["name"], right_cam_info["imsize"], right_cam_info["hfov"], right_cam_info['intrinsics'], right_cam_info['dist_coeff'])
-                            
-                            extrinsics = self.calibrate_stereo(left_cam_info['name'], right_cam_info['name'], left_cam_info['filtered_ids'], left_cam_info['filtered_corners'], right_cam_info['filtered_ids'], right_cam_info['filtered_corners'], left_cam_info['intrinsics'], left_cam_info[
-                                                                   'dist_coeff'], right_cam_info['intrinsics'], right_cam_info['dist_coeff'], translation, rotation, features)
-                            if extrinsics[0] == -1:
-                                return -1, extrinsics[1]
-    
-                            if board_config['stereo_config']['left_cam'] == left_cam and board_config['stereo_config']['right_cam'] == right_cam:
-                                board_config['stereo_config']['rectification_left'] = extrinsics[3]
-                                board_config['stereo_config']['rectification_right'] = extrinsics[4]
+        for name, errors in scheduler.errors.items():
+            if name not in intrinsic_stages:
+                return -1, errors[0]
 
-                            elif board_config['stereo_config']['left_cam'] == right_cam and board_config['stereo_config']['right_cam'] == left_cam:
-                                board_config['stereo_config']['rectification_left'] = extrinsics[4]
-                                board_config['stereo_config']['rectification_right'] = extrinsics[3]
-    
-                            """ for stereoObj in board_config['stereo_config']:
-    
-                                if stereoObj['left_cam'] == left_cam and stereoObj['right_cam'] == right_cam and stereoObj['main'] == 1:
-                                    stereoObj['rectification_left'] = extrinsics[3]
-                                    stereoObj['rectification_right'] = extrinsics[4] """
-    
-                            print('<-------------Epipolar error of {} and {} ------------>'.format(
-                                left_cam_info['name'], right_cam_info['name']))
-                            #print(f"dist {left_cam_info['name']}: {left_cam_info['dist_coeff']}")
-                            #print(f"dist {right_cam_info['name']}: {right_cam_info['dist_coeff']}")
-                            if left_cam_info['intrinsics'][0][0] < right_cam_info['intrinsics'][0][0]:
-                                scale = right_cam_info['intrinsics'][0][0]
-                            else:
-                                scale = left_cam_info['intrinsics'][0][0]
-                            if per_ccm and extrinsic_per_ccm:
-                                scale = ((left_cam_info['intrinsics'][0][0]*right_cam_info['intrinsics'][0][0] + left_cam_info['intrinsics'][1][1]*right_cam_info['intrinsics'][1][1])/2)
-                                print(f"Epipolar error {extrinsics[0]*np.sqrt(scale)}")
-                                left_cam_info['extrinsics']['epipolar_error'] = extrinsics[0]*np.sqrt(scale)
-                                left_cam_info['extrinsics']['stereo_error'] = extrinsics[0]*np.sqrt(scale)
-                            else:
-                                print(f"Epipolar error {extrinsics[0]}")
-                                left_cam_info['extrinsics']['epipolar_error'] = extrinsics[0]
-                                left_cam_info['extrinsics']['stereo_error'] = extrinsics[0]
-                            """self.test_epipolar_charuco(left_cam_info['name'], 
-                                                        right_cam_info['name'],
-                                                        left_path, 
-                                                        right_path, 
-                                                        left_cam_info['intrinsics'], 
-                                                        left_cam_info['dist_coeff'], 
-                                                        right_cam_info['intrinsics'], 
-                                                        right_cam_info['dist_coeff'], 
-                                                        extrinsics[2], # Translation between left and right Cameras
-                                                        extrinsics[3], # Left Rectification rotation 
-                                                        extrinsics[4]) # Right Rectification rotation"""
-                                                                                            
-    
-                            left_cam_info['extrinsics']['rotation_matrix'] = extrinsics[1]
-                            left_cam_info['extrinsics']['translation'] = extrinsics[2]
-    
+        frame_stats = self.frame_store.stats()
+        print(f"Frame store: {frame_stats['hits']} hits, {frame_stats['misses']} misses, {frame_stats['evictions']} evictions, {frame_stats['bytes_resident'] / 2**20:.1f} MB resident")
         return 1, board_config
 
     def getting_features(self, img_path, name, features = None):
@@ -485,35 +1573,124 @@ class StereoCalibration(object):
             return allCorners, allIds, imsize
         ###### ADD HERE WHAT IT IS NEEDED ######
 
-    def filtering_features(self,allCorners, allIds, name,imsize, hfov, cameraMatrixInit, distCoeffsInit):
+    def homography_intrinsics(self, allCorners, allIds, imsize, hfov, fisheye = False):
+        """
+        Closed-form (Zhang) camera matrix from the per-view board homographies, cv2.initCameraMatrix2D
+        with the principal point at the image center. For fisheye only the corners close to the center,
+        where the equidistant projection is still close to a pinhole, are used. Returns None when there
+        are too few views or the focal length is far from the one implied by hfov.
+        """
+        if fisheye:
+            f_hfov = imsize[0] / np.deg2rad(hfov)
+        else:
+            f_hfov = imsize[0] / (2 * np.tan(np.deg2rad(hfov/2)))
+        center = np.array(imsize, np.float32) / 2
+        chessboard_corners = np.asarray(self.board.chessboardCorners, np.float32).reshape(-1, 3)
+        objpoints = []
+        imgpoints = []
+        for corners, ids in zip(allCorners, allIds):
+            if ids is None:
+                continue
+            corners = np.asarray(corners, np.float32).reshape(-1, 2)
+            obj = chessboard_corners[np.asarray(ids).ravel()]
+            if fisheye:
+                central = np.linalg.norm(corners - center, axis = 1) < 0.35 * min(imsize)
+                corners, obj = corners[central], obj[central]
+            if len(corners) >= 8:
+                objpoints.append(obj)
+                imgpoints.append(corners)
+        if len(objpoints) < 3:
+            print(f"Too few views ({len(objpoints)}) for the closed-form intrinsic initialization, using hfov")
+            return None
+        try:
+            cameraMatrix = cv2.initCameraMatrix2D(objpoints, imgpoints, tuple(int(v) for v in imsize), 0)
+        except cv2.error:
+            return None
+        f = (cameraMatrix[0, 0] + cameraMatrix[1, 1]) / 2
+        if not 0.5 < f / f_hfov < 2:
+            print(f"Closed-form focal length {round(f, 2)} does not match the hfov {hfov}, using hfov")
+            return None
+        if self.traceLevel == 3 or self.traceLevel == 10:
+            print(f'Closed-form camera matrix from {len(objpoints)} homographies')
+            print(cameraMatrix)
+        return cameraMatrix
+
+    def select_keyframes(self, allCorners, allIds, imsize, name, grid = (12, 8), views_per_cell = 3, duplicate_distance = 0.05, diversity_distance = 0.35, min_views = 6):
+        """
+        Indices of the views the intrinsic solve needs. Every view is scored by the grid cells its corners
+        cover and by its pose (rotation angle plus translation relative to the board distance) to the views
+        already picked. Near-duplicates of a picked view (close pose, same cells) are dropped, then views are
+        picked greedily until the cells are covered by views_per_cell views as well as keyframe_coverage
+        of the full set covers them and no remaining view is further than diversity_distance from the picks.
+        """
+        num_views = len(allCorners)
+        if num_views <= min_views:
+            self.keyframe_points_ratio = 1.0
+            return list(range(num_views))
+        detections = DetectionSet.from_lists(allCorners, allIds)
+        cell_x = np.clip((detections.corners[:, 0] * grid[0] / imsize[0]).astype(np.int64), 0, grid[0] - 1)
+        cell_y = np.clip((detections.corners[:, 1] * grid[1] / imsize[1]).astype(np.int64), 0, grid[1] - 1)
+        occupancy = np.zeros((num_views, grid[0] * grid[1]), bool)
+        occupancy[detections.view_index, cell_y * grid[0] + cell_x] = True
+
+        rvecs, tvecs, _ = self.estimate_poses(allCorners, allIds, self.cameraIntrinsics[name], self.cameraDistortion[name], stage = "keyframes")
+        # views without a pose are skipped, they are never picked
+        posed = np.array([rvec is not None for rvec in rvecs], bool)
+        rvecs = [np.zeros((3, 1)) if rvec is None else rvec for rvec in rvecs]
+        tvecs = [np.zeros((3, 1)) if tvec is None else tvec for tvec in tvecs]
+        # pairwise distances from V x V products only, no V x V x 3 (x 3) intermediates
+        quaternions = Rotation.from_rotvec(np.array(rvecs).reshape(-1, 3)).as_quat()
+        angles = 2 * np.arccos(np.clip(np.abs(quaternions @ quaternions.T), 0, 1))
+        translations = np.array(tvecs).reshape(-1, 3)
+        squared = np.sum(translations * translations, axis = 1)
+        offsets = np.sqrt(np.maximum(squared[:, None] + squared[None] - 2 * translations @ translations.T, 0))
+        distances = angles + offsets / np.mean(np.sqrt(squared[posed]))
+
+        def coverage(counts):
+            return np.sum(np.minimum(counts, views_per_cell)) / views_per_cell
+
+        full_coverage = coverage(occupancy[posed].sum(axis = 0))
+        counts = np.zeros(occupancy.shape[1])
+        selected = []
+        candidates = [view for view in np.argsort(-detections.counts, kind = 'stable') if posed[view]]
+        while candidates:
+            closest = distances[np.ix_(candidates, selected)].min(axis = 1) if selected else np.full(len(candidates), np.inf)
+            covered = coverage(counts) >= self.keyframe_coverage * full_coverage
+            if covered and len(selected) >= min_views and closest.max() <= diversity_distance:
+                break
+            gain = np.sum(occupancy[candidates] & (counts < views_per_cell), axis = 1) / views_per_cell
+            best = int(np.argmax(gain + 0.1 * np.minimum(closest, 1)))
+            view = candidates.pop(best)
+            selected.append(view)
+            counts += occupancy[view]
+            # drop near-duplicates of the new keyframe
+            duplicates = [c for c in candidates if distances[view, c] < duplicate_distance and np.sum(occupancy[c] & ~occupancy[view]) == 0]
+            candidates = [c for c in candidates if c not in duplicates]
+
+        selected.sort()
+        kept_points = np.sum(detections.counts[selected])
+        self.keyframe_points_ratio = detections.num_points / max(kept_points, 1)
+        print(f"Keyframes of {name}: {len(selected)}/{num_views} views, {kept_points}/{detections.num_points} corners, coverage {round(100 * coverage(counts) / max(full_coverage, 1e-9), 1)}% of all views")
+        return selected
+
+    def filtering_features(self,allCorners, allIds, name,imsize, hfov, cameraMatrixInit, distCoeffsInit, closed_form_init = False):
 
          # check if there are any suspicious corners with high reprojection error
         rvecs = []
         tvecs = []
         max_threshold = 75 + self.initial_max_threshold * (hfov / 30 + imsize[1] / 800 * 0.2)
+        if closed_form_init:
+            # K from the board homographies is close to the solution, the schedule can start tight
+            max_threshold = 10 + self.initial_max_threshold * (hfov / 30 + imsize[1] / 800 * 0.2)
         threshold_stepper = int(1.5 * (hfov / 30 + imsize[1] / 800))
         if threshold_stepper < 1:
             threshold_stepper = 1
         print(threshold_stepper)
         min_inlier = 1 - self.initial_min_filtered * (hfov / 60 + imsize[1] / 800 * 0.2)
-        overall_pose = time.time()
         for index, corners in enumerate(allCorners):
             if len(corners) < 4:
                 return f"Less than 4 corners detected on {index} image.", None, None
-        index = 0
-        self.index = 0
-        for corners, ids in zip(allCorners, allIds):
-            current = time.time()
-            self.index = index
-            objpts = self.charuco_ids_to_objpoints(ids)
-            rvec, tvec, newids = self.camera_pose_charuco(objpts, corners, ids, cameraMatrixInit, distCoeffsInit, max_threshold = max_threshold, min_inliers=min_inlier, ini_threshold = 5, threshold_stepper=threshold_stepper)
-            #allCorners[index] = np.array([corners[id[0]-1] for id in newids])
-            #allIds[index] = np.array([ids[id[0]-1] for id in newids])
-            tvecs.append(tvec)
-            rvecs.append(rvec)
-            print(f"Pose estimation {index}, {time.time() -current}s")
-            index += 1
-        print(f"Overall pose estimation {time.time() - overall_pose}s")
+        rvecs, tvecs, _ = self.estimate_poses(allCorners, allIds, cameraMatrixInit, distCoeffsInit, stage = "filtering", max_threshold = max_threshold, min_inliers=min_inlier, ini_threshold = 5, threshold_stepper=threshold_stepper)
 
         # Here we need to get initialK and parameters for each camera ready and fill them inside reconstructed reprojection error per point
         ret = 0.0
@@ -521,20 +1698,28 @@ class StereoCalibration(object):
         flags = cv2.CALIB_USE_INTRINSIC_GUESS + distortion_flags
         current = time.time()
         filtered_corners, filtered_ids,all_error, removed_corners, removed_ids, removed_error = self.features_filtering_function(rvecs, tvecs, cameraMatrixInit, distCoeffsInit, ret, allCorners, allIds, camera = name)
-        corner_detector = filtered_corners.copy()
-        for index, corners in enumerate(filtered_corners):
-            if len(corners) < 4:
-                corner_detector.remove(corners)
+        corner_detector = [corners for corners in filtered_corners if len(corners) >= 4]
         if len(corner_detector) < int(len(self.img_path)*0.75):
             return f"More than 1/4 of images has less than 4 corners for {name}", None, None
 
                 
         print(f"Filtering {time.time() -current}s")
+        if closed_form_init:
+            # no throwaway solve, the intrinsic calibration starts from the closed-form K
+            self.cameraIntrinsics[name] = cameraMatrixInit
+            self.cameraDistortion[name] = distCoeffsInit
+            self.closed_form_init.add(name)
+            return removed_corners, filtered_corners, filtered_ids
+        if self.robust_loss is not None:
+            # the robust solve copes with the outliers itself, no throwaway solve to seed it
+            self.cameraIntrinsics[name] = cameraMatrixInit
+            self.cameraDistortion[name] = distCoeffsInit
+            return removed_corners, filtered_corners, filtered_ids
         try:
             (ret, camera_matrix, distortion_coefficients,
                      rotation_vectors, translation_vectors,
                      stdDeviationsIntrinsics, stdDeviationsExtrinsics,
-                     perViewErrors) = cv2.aruco.calibrateCameraCharucoExtended(
+                     perViewErrors) = self.calibrate_charuco_extended(
                         charucoCorners=filtered_corners,
                         charucoIds=filtered_ids,
                         board=self.board,
@@ -551,36 +1736,33 @@ class StereoCalibration(object):
         return removed_corners, filtered_corners, filtered_ids
     
     def remove_features(self, allCorners, allIds, array, img_files = None):
-        filteredCorners = allCorners.copy()
-        filteredIds = allIds.copy()
+        detections = DetectionSet.from_lists(allCorners, allIds).drop_views(array)
+        img_path = None
         if img_files is not None:
-            img_path = img_files.copy()
-
-        for index in array:
-            filteredCorners.pop(index)
-            filteredIds.pop(index)
-            if img_files is not None:
-                img_path.pop(index)
+            removed = set(array)
+            img_path = [im for index, im in enumerate(img_files) if index not in removed]
 
-        return filteredCorners, filteredIds, img_path
+        return detections.corners_list(), detections.ids_list(), img_path
 
-    def get_distortion_flags(self,name):
+    def get_distortion_flags(self,name, model = None):
         def is_binary_string(s: str) -> bool:
         # Check if all characters in the string are '0' or '1'
             return all(char in '01' for char in s)
-        if self.distortion_model[name] == None:
+        if model is None:
+            model = self.distortion_model[name]
+        if model == None:
             print("Use DEFAULT model")
             flags = cv2.CALIB_RATIONAL_MODEL
-        elif is_binary_string(self.distortion_model[name]):
+        elif is_binary_string(model):
             flags = cv2.CALIB_RATIONAL_MODEL
             flags += cv2.CALIB_TILTED_MODEL
             flags += cv2.CALIB_THIN_PRISM_MODEL
-            binary_number = int(self.distortion_model[name], 2)
+            binary_number = int(model, 2)
             # Print the results
             if binary_number == 0:
                 clauses_status = [True, True,True, True, True, True, True, True, True]
             else:
-                clauses_status = [(binary_number & (1 << i)) != 0 for i in range(len(self.distortion_model[name]))]
+                clauses_status = [(binary_number & (1 << i)) != 0 for i in range(len(model))]
                 clauses_status = clauses_status[::-1]
             if clauses_status[0]:
                 print("FIX_K1")
@@ -610,33 +1792,39 @@ class StereoCalibration(object):
                 print("FIX_PRISM_DISTORTION")
                 flags += cv2.CALIB_FIX_S1_S2_S3_S4
 
-        elif isinstance(self.distortion_model[name], str):
-            if self.distortion_model[name] == "NORMAL":
+        elif isinstance(model, str):
+            if model == "AUTO":
+                # only until select_distortion_model replaces it with the chosen candidate
+                print("Using NORMAL model until the AUTO selection")
+                flags = cv2.CALIB_RATIONAL_MODEL
+                flags += cv2.CALIB_TILTED_MODEL
+
+            elif model == "NORMAL":
                 print("Using NORMAL model")
                 flags = cv2.CALIB_RATIONAL_MODEL
                 flags += cv2.CALIB_TILTED_MODEL
 
-            elif self.distortion_model[name] == "TILTED":
+            elif model == "TILTED":
                 print("Using TILTED model")
                 flags = cv2.CALIB_RATIONAL_MODEL
                 flags += cv2.CALIB_TILTED_MODEL
 
-            elif self.distortion_model[name] == "PRISM":
+            elif model == "PRISM":
                 print("Using PRISM model")
                 flags = cv2.CALIB_RATIONAL_MODEL
                 flags += cv2.CALIB_TILTED_MODEL
                 flags += cv2.CALIB_THIN_PRISM_MODEL
 
-            elif self.distortion_model[name] == "THERMAL":
+            elif model == "THERMAL":
                 print("Using THERMAL model")
                 flags = cv2.CALIB_RATIONAL_MODEL
                 flags += cv2.CALIB_FIX_K3
                 flags += cv2.CALIB_FIX_K5
                 flags += cv2.CALIB_FIX_K6
 
-        elif isinstance(self.distortion_model[name], int):
+        elif isinstance(model, int):
             print("Using CUSTOM flags")
-            flags = self.distortion_model[name]
+            flags = model
         return flags
     
     def get_fisheye_distortion_flags(self,name):
@@ -674,17 +1862,19 @@ class StereoCalibration(object):
         return flags
 
     def calibrate_wf_intrinsics(self, name, all_Features, all_features_Ids, allCorners, allIds, imsize, hfov, features, image_files):
-        image_files = glob.glob(image_files + "/*")
-        image_files.sort()
+        if isinstance(image_files, str):
+            image_files = glob.glob(image_files + "/*")
+            image_files.sort()
         coverageImage = np.ones(imsize[::-1], np.uint8) * 255
         coverageImage = cv2.cvtColor(coverageImage, cv2.COLOR_GRAY2BGR)
-        coverageImage = self.draw_corners(allCorners, coverageImage)
+        coverageImage = self.draw_corners(allCorners, coverageImage, name)
         if self.calib_model[name] == 'perspective':
             if features == None or features == "charucos":
                 distortion_flags = self.get_distortion_flags(name)
                 ret, camera_matrix, distortion_coefficients, rotation_vectors, translation_vectors, filtered_ids, filtered_corners, allCorners, allIds  = self.calibrate_camera_charuco(
                     all_Features, all_features_Ids,allCorners, allIds, imsize, hfov, name, distortion_flags)
-            if self.charucos == {}:
+            # a failed calibration has nothing to undistort with, the stage reports ret
+            if self.charucos == {} and not isinstance(ret, str):
                 self.undistort_visualization(
                     image_files, camera_matrix, distortion_coefficients, imsize, name)
 
@@ -705,13 +1895,15 @@ class StereoCalibration(object):
                 # (Height, width)
                 return ret, camera_matrix, distortion_coefficients, rotation_vectors, translation_vectors, filtered_ids, filtered_corners, imsize, coverageImage, allCorners, allIds
 
-    def draw_corners(self, charuco_corners, displayframe):
-        for corners in charuco_corners:
-            color = (int(np.random.randint(0, 255)), int(np.random.randint(0, 255)), int(np.random.randint(0, 255)))
-            for corner in corners:
-                corner_int = (int(corner[0][0]), int(corner[0][1]))
-                cv2.circle(displayframe, corner_int, 4, color, -1)
+    def draw_corners(self, charuco_corners, displayframe, name = None):
         height, width = displayframe.shape[:2]
+        coverage = CoverageAccumulator(width, height, self.coverage_grid)
+        for corners in charuco_corners:
+            coverage.add(corners)
+        if name is not None:
+            self.coverage[name] = coverage
+            print(f"Coverage of {name}: {round(100 * coverage.score(), 1)}% of the image grid")
+        displayframe = coverage.render(displayframe)
         start_point = (0, 0)  # top of the image
         end_point = (0, height)
 
@@ -723,64 +1915,59 @@ class StereoCalibration(object):
         return displayframe
 
     def features_filtering_function(self,rvecs, tvecs, cameraMatrix, distCoeffs, reprojection, filtered_corners,filtered_id, camera, display = True, threshold = None, draw_quadrants = False, nx = 4, ny = 4):
-        whole_error = []
-        all_points = []
-        all_corners = []
-        all_error = []
-        all_ids = []
-        removed_corners = []
-        removed_points = []
-        removed_ids = []
-        removed_error = []
-        display_corners = []
-        display_points = []
         circle_size = 0
-        reported_error = []
-        for i, (corners, ids, frame_path) in enumerate(zip(filtered_corners, filtered_id, self.img_path)):
-            frame = cv2.imread(frame_path)
-            if ids is not None and corners.size > 0:
-                ids = ids.flatten()  # Flatten the IDs from 2D to 1D
-                objPoints = np.array([self.board.chessboardCorners[id] for id in ids], dtype=np.float32)
-                if self.calib_model[camera] == "perspective":
-                    imgpoints2, _ = cv2.projectPoints(objPoints, rvecs[i], tvecs[i], cameraMatrix, distCoeffs)
-                else:
-                    imgpoints2, _ = cv2.fisheye.projectPoints(objPoints[None], rvecs[i], tvecs[i], cameraMatrix, distCoeffs)
-                corners2 = corners.reshape(-1, 2)
-                imgpoints2 = imgpoints2.reshape(-1, 2)
-
-                errors = np.linalg.norm(corners2 - imgpoints2, axis=1)
-                if threshold == None:
-                    threshold = max(2*np.median(errors), 150)
-                valid_mask = errors <= threshold
+        detections = DetectionSet.from_lists(filtered_corners, filtered_id)
+        objPoints_all = detections.object_points(self.board.chessboardCorners)
+        num_views = min(len(detections), len(self.img_path))
+        views = [i for i in range(num_views) if detections.counts[i] > 0]
+        # views estimate_poses found no pose for are skipped, they stay in the lists without any corner
+        posed = np.array([i < len(rvecs) and rvecs[i] is not None for i in range(len(detections))], bool)
+        detections.inliers[~posed[detections.view_index]] = False
+        posed_views = [i for i in views if posed[i]]
+        points = np.flatnonzero((detections.view_index < num_views) & posed[detections.view_index])
+        view_index = detections.view_index[points]
+
+        # all views are projected at once, only the views with corners need a pose
+        pose_rvecs = np.zeros((num_views, 3))
+        pose_tvecs = np.zeros((num_views, 3))
+        for i in posed_views:
+            pose_rvecs[i] = np.ravel(rvecs[i])
+            pose_tvecs[i] = np.ravel(tvecs[i])
+        model = camera_model(self.calib_model[camera], cameraMatrix, distCoeffs)
+        imgpoints_all = np.zeros(detections.corners.shape)
+        errors_all = np.zeros(detections.num_points)
+        imgpoints_all[points] = model.project_many(objPoints_all[points], pose_rvecs, pose_tvecs, view_index)
+        errors_all[points] = np.linalg.norm(detections.corners[points] - imgpoints_all[points], axis=1)
+
+        if threshold == None and posed_views:
+            first = posed_views[0]
+            threshold = max(2*np.median(errors_all[detections.offsets[first]:detections.offsets[first + 1]]), 150)
+        # filtering only flips the inlier mask, the lists are built once at the end
+        detections.inliers[points] = errors_all[points] <= threshold
+        valid = detections.inliers[points]
+        rms_per_view = per_view_rms(errors_all[points][valid], view_index[valid], num_views)
+        whole_error = [rms_per_view[i] for i in posed_views]
+
+        for i, frame_path in zip(range(num_views), self.img_path):
+            if self.traceLevel not in {2, 4, 8, 9, 10}:
+                break
+            if not posed[i]:
+                continue
+            start, end = detections.offsets[i], detections.offsets[i + 1]
+            if end > start:
+                corners2 = detections.corners[start:end]
+                imgpoints2 = imgpoints_all[start:end]
+                errors = errors_all[start:end]
+                valid_mask = detections.inliers[start:end]
                 removed_mask = ~valid_mask
-
-                # Collect valid IDs in the original format (array of arrays)
-                valid_ids = ids[valid_mask]
-                all_ids.append(valid_ids.reshape(-1, 1).astype(np.int32))  # Reshape and store as array of arrays
-
-                # Collect data for valid points
-                reported_error.extend(errors[valid_mask])
-                all_error.extend(errors[valid_mask])
-                display_corners.extend(corners2[valid_mask])
-                display_points.extend(imgpoints2[valid_mask])
-                all_points.append(imgpoints2[valid_mask])  # Collect valid points for calibration
-                all_corners.append(corners2[valid_mask].reshape(-1, 1, 2))   # Collect valid corners for calibration
-
-                removed_corners.extend(corners2[removed_mask])
-                removed_points.extend(imgpoints2[removed_mask])
-                removed_ids.extend(ids[removed_mask])
-                removed_error.extend(errors[removed_mask])
-
-                total_error_squared = np.sum(errors[valid_mask]**2)
-                total_points = len(objPoints[valid_mask])
-                rms_error = np.sqrt(total_error_squared / total_points if total_points else 0)
-                whole_error.append(rms_error)
+                rms_error = rms_per_view[i]
 
                 if self.traceLevel in {2, 4, 10}:
                     print(f"Overall RMS re-projection error for frame {i}: {rms_error}")
 
-            total_error_squared = 0
-            total_points = 0
+            if self.traceLevel in {8, 9, 10}:
+                display_corners = detections.corners[:end][detections.inliers[:end]]
+                removed_corners = detections.corners[:end][~detections.inliers[:end]]
 
             if self.traceLevel == 8 or self.traceLevel == 10:
                 centroid_x = np.mean(np.array(display_corners).T[0])
@@ -797,7 +1984,7 @@ class StereoCalibration(object):
                 ax.set_title(f"Reprojection error for frame {i}, camera {camera}")
                 ax.scatter(np.array(corners2).T[0], np.array(corners2).T[1], label = "Original", alpha = 0.5, color = "Black")
                 img = ax.scatter(np.array(imgpoints2).T[0], np.array(imgpoints2).T[1], c=errors, cmap = GnRd, label = "Reprojected", vmin=0, vmax=threshold)
-                ax.imshow(frame, alpha = 0.5)
+                ax.imshow(self.frame_store.get(frame_path), alpha = 0.5)
                 ax.plot([],[], label = f"Rerprojection Remade: {round(rms_error, 4)}", color = "white")
                 ax.plot([],[], label = f"Whole Rerprojection OpenCV: {round(reprojection, 4)}", color = "white")
                 cbar = plt.colorbar(img, ax=ax)
@@ -825,7 +2012,7 @@ class StereoCalibration(object):
                 ax.set_title(f"Removed error for frame {i}, camera {camera}")
                 ax.scatter(np.array(corners2[removed_mask]).T[0], np.array(corners2[removed_mask]).T[1], label = "Original", alpha = 0.5, color = "Black")
                 img = ax.scatter(np.array(imgpoints2[removed_mask]).T[0], np.array(imgpoints2[removed_mask]).T[1], c=errors[removed_mask], cmap = GnRd, label = "Reprojected", vmin=0, vmax=max(errors[removed_mask]))
-                ax.imshow(frame, alpha = 0.5)
+                ax.imshow(self.frame_store.get(frame_path), alpha = 0.5)
                 ax.plot([],[], label = f"Rerprojection Remade: {round(np.mean(errors), 4)}", color = "white")
                 ax.plot([],[], label = f"Whole Rerprojection OpenCV: {round(reprojection, 4)}", color = "white")
                 cbar = plt.colorbar(img, ax=ax)
@@ -838,6 +2025,21 @@ class StereoCalibration(object):
                 plt.grid()
                 plt.show()
 
+        processed = np.zeros(detections.num_points, bool)
+        processed[points] = True
+        valid = processed & detections.inliers
+        removed = processed & ~detections.inliers
+        # empty views stay in the lists, the callers pair them with poses and frames by index
+        all_corners = detections.corners_list(range(num_views))
+        all_ids = detections.ids_list(range(num_views))
+        all_error = errors_all[valid]
+        reported_error = all_error
+        display_corners = detections.corners[valid]
+        display_points = imgpoints_all[valid]
+        removed_corners = detections.corners[removed]
+        removed_ids = detections.ids[removed].tolist()
+        removed_error = errors_all[removed]
+
         if self.traceLevel == 3 or self.traceLevel == 5 or self.traceLevel == 10:
             center_x, center_y = self.width[camera] / 2, self.height[camera] / 2
             distances = [distance((center_x, center_y), point) for point in np.array(display_corners)]
@@ -848,7 +2050,7 @@ class StereoCalibration(object):
             ax.set_title(f"Reprojection map camera {camera}")
             ax.scatter(np.array(display_points).T[0], np.array(display_points).T[1], label = "Original", alpha = 0.5, color = "Black")
             img = ax.scatter(np.array(display_corners).T[0], np.array(display_corners).T[1], c=all_error, cmap = GnRd, label = "Reprojected", vmin=0, vmax=threshold)
-            ax.imshow(frame, alpha = 0.5)
+            ax.imshow(self.frame_store.get(frame_path), alpha = 0.5)
             ax.plot([],[], label = f"Rerprojection Remade ALL: {round(np.sqrt(np.mean(np.array(whole_error)**2)), 4)}", color = "white")
             ax.plot([],[], label = f"Whole Rerprojection OpenCV: {round(reprojection, 4)}", color = "white")
             cbar = plt.colorbar(img, ax=ax)
@@ -862,13 +2064,7 @@ class StereoCalibration(object):
             plt.show()
 
         if self.traceLevel == 3 or self.traceLevel == 5 or self.traceLevel == 10:
-            x = np.array(display_points).T[0]
-            y = np.array(display_points).T[1]
-            z = np.array(all_error)
-
-            x_flat = x.flatten()
-            y_flat = y.flatten()
-            z_flat = z.flatten()
+            z_flat = np.array(all_error).flatten()
 
             fig, ax = plt.subplots()
 
@@ -881,8 +2077,12 @@ class StereoCalibration(object):
             ax.set_title("Reprojection error for shorter dataset")
             ax.set_xlabel("Reprojection error")
             plt.show()
-            grid_x, grid_y = np.mgrid[min(x_flat):max(x_flat):100j, min(y_flat):max(y_flat):100j]
-            grid_z = abs(griddata((x_flat, y_flat), z_flat, (grid_x, grid_y), method='cubic'))
+            # mean error per cell of a 16 cell wide grid of square cells, coarse enough that a typical
+            # dataset puts several corners in most cells instead of leaving the plot patchy
+            cell_size = max(self.width[camera] / 16, 1)
+            field = ErrorField(display_points, all_error, self.width[camera], self.height[camera], nx = 16, ny = max(int(round(self.height[camera] / cell_size)), 1))
+            grid_x, grid_y = field.cell_centers()
+            grid_z = np.ma.masked_invalid(field.mean)
 
             plt.title(f"Reprojection error of {camera}")
             plt.contourf(grid_x, grid_y, grid_z, 50, cmap=GnRd)
@@ -895,40 +2095,26 @@ class StereoCalibration(object):
             plt.show()
 
         if self.traceLevel == 11:
-            sorted_points, quadrant_coords = sort_points_into_quadrants(display_points, self.width[camera], self.height[camera], error=all_error)
-            quadrant_width = self.width // nx
-            quadrant_height = self.height // ny
-
-            image = np.full((self.height, self.width, 3), 255, dtype=np.uint8)
-
-            # Define the quadrant lines
-            quadrant_width = self.width // nx
-            quadrant_height = self.height // ny
-            index = 0
-            import math
-            for i in range(nx):
-                for j in range(ny):
+            field = ErrorField(display_points, all_error, self.width[camera], self.height[camera], nx = nx, ny = ny)
+
+            image = np.full((self.height[camera], self.width[camera], 3), 255, dtype=np.uint8)
+
+            for i in range(ny):
+                for j in range(nx):
                     # Scale the color from red (0, 0, 255) to green (0, 255, 0)
-                    count = np.mean(sorted_points[index])
-                    if math.isnan(count):
-                        count = "Missing"
+                    points_in_cell = field.count[i, j]
+                    if points_in_cell < ((self.squaresX*self.squaresY))*0.05:
+                        count = f"Only {points_in_cell} points" if points_in_cell else "Missing"
                         red = 255
                         green = 0
-                    if len(sorted_points[index]) < ((self.squaresX*self.squaresY))*0.05:
-                        count = f"Only {len(sorted_points[index])} points"
-                        red = 255
-                        green = 0 
                     else:
-                        count = round(count, 4)
-                        red = int(((count / threshold)) * 255)
-                        green = int((1 -count / threshold) * 255)
+                        count = round(field.mean[i, j], 4)
+                        red = int(min(count / threshold, 1) * 255)
+                        green = int((1 - min(count / threshold, 1)) * 255)
                     color = (0, green, red)
 
-                    left = j * quadrant_width
-                    upper = i * quadrant_height
-                    right = left + quadrant_width
-                    bottom = upper + quadrant_height
-                    index += 1
+                    left, upper, right, bottom = field.cell_bounds(i, j)
+                    quadrant_height = bottom - upper
 
                     cv2.rectangle(image, (left, upper), (right, bottom), color, -1)
 
@@ -946,27 +2132,77 @@ class StereoCalibration(object):
         self.all_errors[camera] = reported_error
         return all_corners ,all_ids, all_error, removed_corners, removed_ids, removed_error
 
+    def image_size(self, im):
+        """(height, width) of an image, only the header is read for PNG and JPEG files."""
+        size = probe_image_size(im)
+        if size is None:
+            size = self.frame_store.get(im, grayscale=True).shape[:2]
+        return size
+
     def detect_charuco_board(self, image: np.array):
-        arucoParams = cv2.aruco.DetectorParameters_create()
-        arucoParams.minMarkerDistanceRate = 0.01
-        corners, ids, rejectedImgPoints = cv2.aruco.detectMarkers(image, self.aruco_dictionary, parameters=arucoParams)  # First, detect markers
-        marker_corners, marker_ids, refusd, recoverd = cv2.aruco.refineDetectedMarkers(image, self.board, corners, ids, rejectedCorners=rejectedImgPoints)
-        # If found, add object points, image points (after refining them)
-        if len(marker_corners) > 0:
-            ret, corners, ids = cv2.aruco.interpolateCornersCharuco(marker_corners,marker_ids,image, self.board, minMarkers = 1)
-            return ret, corners, ids, marker_corners, marker_ids
-        else:
-            return None, None, None, None, None
+        return self.charuco_detector.detect(image)
 
-    def camera_pose_charuco(self, objpoints: np.array, corners: np.array, ids: np.array, K: np.array, d: np.array, ini_threshold = 2, min_inliers = 0.95, threshold_stepper = 1, max_threshold = 50):
+    def estimate_poses(self, allCorners, allIds, K, d, stage = "", **pose_kwargs):
+        """
+        Runs camera_pose_charuco for every view. The views only share K and d, so they are spread over
+        a thread pool of pose_workers (the OpenCV solvers release the GIL). Returns rvecs, tvecs and the
+        inlier indices per view, in view order; rvec and tvec are None for a view without a pose.
+        """
+        name, img_path = self.name, self.img_path
+        def pose(index):
+            # pool threads do not see the stage's camera otherwise
+            self.name, self.img_path = name, img_path
+            objpts = self.charuco_ids_to_objpoints(allIds[index])
+            return self.camera_pose_charuco(objpts, allCorners[index], allIds[index], K, d, index = index, **pose_kwargs)
+
+        start_time = time.time()
+        views = range(len(allCorners))
+        workers = self.pose_workers
+        # trace level 13 plots every view, which has to happen on the main thread
+        if workers <= 1 or self.traceLevel == 13 or len(allCorners) < 2:
+            workers = 1
+            results = [pose(index) for index in views]
+        else:
+            with ThreadPoolExecutor(max_workers = workers) as executor:
+                results = list(executor.map(pose, views))
+        rvecs = [rvec for rvec, _, _ in results]
+        tvecs = [tvec for _, tvec, _ in results]
+        inliers = [objects for _, _, objects in results]
+        print(f"Pose estimation {stage}: {len(results)} views in {round(time.time() - start_time, 3)}s ({workers} workers)")
+        failed = [index for index, rvec in enumerate(rvecs) if rvec is None]
+        if failed:
+            print(f"Pose estimation {stage}: no pose for views {failed}, they are skipped")
+        return rvecs, tvecs, inliers
+
+    def camera_pose_charuco(self, objpoints: np.array, corners: np.array, ids: np.array, K: np.array, d: np.array, ini_threshold = 2, min_inliers = 0.95, threshold_stepper = 1, max_threshold = 50, index = 0):
+        if len(objpoints) < 4:
+            # nothing to solve a pose from, the callers skip the view
+            return None, None, np.zeros((0, 1), np.int32)
         objects = []
         all_objects = []
-        index = 0
         start_time = time.time()
-        while len(objects) < len(objpoints[:,0,0]) * min_inliers:
+        ret = False
+        planar = None
+        sweep = None
+        if self.pose_init == "ippe":
+            planar = self.camera_pose_planar(objpoints, corners, K, d, ini_threshold, min_inliers)
+        if planar is not None:
+            ret, rvec, tvec, objects = planar
+        elif self.pose_threshold_sweep:
+            sweep = self.camera_pose_sweep(objpoints, corners, K, d, ini_threshold, min_inliers, threshold_stepper, max_threshold)
+            if sweep is not None:
+                ret, rvec, tvec, objects, ini_threshold = sweep
+        # a sweep without any RANSAC inliers falls back to the ladder
+        use_ladder = planar is None and sweep is None
+        while use_ladder and len(objects) < len(objpoints[:,0,0]) * min_inliers:
             if ini_threshold > max_threshold:
                 break
             ret, rvec, tvec, objects  = cv2.solvePnPRansac(objpoints, corners, K, d, flags = cv2.SOLVEPNP_P3P, reprojectionError = ini_threshold,  iterationsCount = 10000, confidence = 0.9)
+            if objects is None:
+                # no consensus at this threshold
+                objects = []
+                ini_threshold += threshold_stepper
+                continue
             all_objects.append(objects)
             imgpoints2 = objpoints.copy()
 
@@ -975,43 +2211,159 @@ class StereoCalibration(object):
             imgpoints2 = np.array([imgpoints2[id[0]] for id in objects])
 
             ret, rvec, tvec = cv2.solvePnP(imgpoints2, all_corners, K, d)
-            if self.calib_model[self.name] == "perspective":
-                imgpoints2, _ = cv2.projectPoints(imgpoints2, rvec, tvec, self.cameraIntrinsics[self.name], self.cameraDistortion[self.name])
-            else:
-                imgpoints2, _ = cv2.projectPoints(imgpoints2, rvec, tvec, self.cameraIntrinsics[self.name], self.cameraDistortion[self.name])
             
             ini_threshold += threshold_stepper
-            index += 1
+        if not ret or len(objects) == 0:
+            # no pose for this view, the callers skip it
+            return None, None, np.zeros((0, 1), np.int32)
         if self.traceLevel == 13:
-            image = cv2.imread(self.img_path[self.index])
-            if len(image.shape) == 3:
-                image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            imgpoints2, _ = cv2.projectPoints(objpoints[np.ravel(objects)], rvec, tvec, self.cameraIntrinsics[self.name], self.cameraDistortion[self.name])
+            image = self.frame_store.get(self.img_path[index], grayscale=True)
             plt.title(f"Number of rejected corners in filtering, iterations needed: {ini_threshold}, inliers: {round(len(objects)/len(corners[:,0,0]), 4) *100} %")
             plt.imshow(image)
             plt.scatter(corners[:,0,0],corners[:,0,1], marker= "o", label = f"Detected all corners: {len(corners[:,0,0])}", color = "Red")
             plt.scatter(imgpoints2[:,0,0],imgpoints2[:,0,1], label = f"Filtering method: {len(objects)}", marker = "x", color = "Green")
             plt.legend()
             plt.show()
-        if ret:
-            return rvec, tvec, objects
-        else:
-            return None
+        return rvec, tvec, objects
         
+    def camera_pose_planar(self, objpoints, corners, K, d, ini_threshold, min_inliers):
+        """
+        Pose of the planar board straight from the id-matched corners with SOLVEPNP_IPPE. If at least
+        min_inliers of the corners reproject within ini_threshold, the pose is refined on those and
+        returned as (ret, rvec, tvec, inlier indices); otherwise there are real outliers and None is
+        returned so the caller falls back to RANSAC.
+        """
+        if len(objpoints) < 4:
+            return None
+        ret, rvec, tvec = cv2.solvePnP(objpoints, corners, K, d, flags = cv2.SOLVEPNP_IPPE)
+        if not ret:
+            return None
+        projected, _ = cv2.projectPoints(objpoints, rvec, tvec, K, d)
+        residuals = np.linalg.norm(projected.reshape(-1, 2) - corners.reshape(-1, 2), axis = 1)
+        inliers = residuals <= ini_threshold
+        if np.count_nonzero(inliers) < max(len(residuals) * min_inliers, 4):
+            return None
+        if not inliers.all():
+            ret, rvec, tvec = cv2.solvePnP(objpoints[inliers], corners[inliers], K, d, rvec, tvec, useExtrinsicGuess = True)
+        objects = np.flatnonzero(inliers).astype(np.int32).reshape(-1, 1)
+        return ret, rvec, tvec, objects
+
+    def camera_pose_sweep(self, objpoints, corners, K, d, ini_threshold, min_inliers, threshold_stepper, max_threshold):
+        """
+        Single pass version of the threshold ladder in camera_pose_charuco. One RANSAC at the initial
+        threshold gives the pose, the residuals of all corners are computed once and the smallest
+        threshold of the ladder (ini_threshold + k * threshold_stepper, at most max_threshold) that keeps
+        min_inliers of the corners is read from the sorted residuals. The pose is refined with a
+        single solvePnP on those inliers. None when RANSAC finds no inliers at all.
+        """
+        ret, rvec, tvec, objects = cv2.solvePnPRansac(objpoints, corners, K, d, flags = cv2.SOLVEPNP_P3P, reprojectionError = ini_threshold,  iterationsCount = 10000, confidence = 0.9)
+        if not ret or objects is None or len(objects) == 0:
+            return None
+        ret, rvec, tvec = cv2.solvePnP(objpoints[objects[:, 0]], corners[objects[:, 0]], K, d)
+        projected, _ = cv2.projectPoints(objpoints, rvec, tvec, K, d)
+        residuals = np.linalg.norm(projected.reshape(-1, 2) - corners.reshape(-1, 2), axis = 1)
+
+        needed = max(int(np.ceil(len(residuals) * min_inliers)), 1)
+        required = np.sort(residuals)[min(needed, len(residuals)) - 1]
+        steps = max(int(np.ceil((required - ini_threshold) / threshold_stepper)), 0)
+        max_steps = int(np.floor((max_threshold - ini_threshold) / threshold_stepper))
+        threshold = ini_threshold + min(steps, max(max_steps, 0)) * threshold_stepper
+
+        inliers = residuals <= threshold
+        if np.count_nonzero(inliers) < 4:
+            return ret, rvec, tvec, objects, threshold
+        ret, rvec, tvec = cv2.solvePnP(objpoints[inliers], corners[inliers], K, d, rvec, tvec, useExtrinsicGuess = True)
+        objects = np.flatnonzero(inliers).astype(np.int32).reshape(-1, 1)
+        return ret, rvec, tvec, objects, threshold
+
     def compute_reprojection_errors(self, obj_pts: np.array, img_pts: np.array, K: np.array, dist: np.array, rvec: np.array, tvec: np.array, fisheye = False):
-        if fisheye:
-            proj_pts, _ = cv2.fisheye.projectPoints(obj_pts, rvec, tvec, K, dist)
-        else:
-            proj_pts, _ = cv2.projectPoints(obj_pts, rvec, tvec, K, dist)
-        errs = np.linalg.norm(np.squeeze(proj_pts) - np.squeeze(img_pts), axis = 1)
-        return errs 
+        model = camera_model("fisheye" if fisheye else "perspective", K, dist)
+        return model.residuals(obj_pts, img_pts, rvec, tvec)
     
     def charuco_ids_to_objpoints(self, ids):
-        one_pts = self.board.chessboardCorners
-        objpts = []
-        for j in range(len(ids)):   
-            objpts.append(one_pts[ids[j]])
-        return np.array(objpts)
+        return np.asarray(self.board.chessboardCorners)[np.asarray(ids)]
+
+
+    def detection_fingerprint(self, scale_req=False, req_resolution=(800, 1280)):
+        """Everything besides the image content that changes the detection result."""
+        return json.dumps({
+            'opencv': cv2.__version__,
+            'detector': self.charuco_detector.fingerprint(),
+            'scale_req': bool(scale_req),
+            'req_resolution': list(req_resolution) if scale_req else None,
+            # cache hits skip the quality prefilter, with "reject" a hit has to have passed the same thresholds
+            'quality_thresholds': self.quality_thresholds if self.quality_filter == "reject" else None,
+        }, sort_keys=True)
 
+    def lookup_detection_cache(self, images, scale_req=False, req_resolution=(800, 1280)):
+        """
+        Opens the on-disk detection cache of the images' directory and looks every image up.
+        Returns the cache, the image keys and the cached entries (None for the misses).
+        """
+        images_dir = os.path.dirname(os.path.abspath(images[0]))
+        cache_path = images_dir + '_charuco_cache.npz'
+        cache = CharucoDetectionCache(cache_path, self.detection_fingerprint(scale_req, req_resolution))
+        keys = [CharucoDetectionCache.image_key(im) for im in images]
+        cached = [cache.get(key) for key in keys]
+        print(f"Detection cache {cache_path}: {cache.hits} hits, {cache.misses} misses")
+        return cache, keys, cached
+
+    def cached_charuco_images(self, images, lookup, scale_req=False, req_resolution=(800, 1280), keep_frame=False, skip=()):
+        """
+        Same as detect_charuco_images for the lookup_detection_cache result of images, but images with
+        a detection in the on-disk cache are not decoded or detected again. Misses in skip are
+        neither detected nor yielded.
+        """
+        cache, keys, cached = lookup
+        missing = [im for im, entry in zip(images, cached) if entry is None and im not in skip]
+        detections = self.detect_charuco_images(missing, scale_req, req_resolution, keep_frame)
+        try:
+            for im, key, entry in zip(images, keys, cached):
+                if entry is None:
+                    if im in skip:
+                        continue
+                    result = next(detections)
+                    cache.put(key, *result[:5])
+                    yield result
+                else:
+                    gray = load_gray(im, scale_req, req_resolution, self.frame_store) if keep_frame else None
+                    yield entry + (gray,)
+        finally:
+            detections.close()
+            cache.save()
+
+    def detect_charuco_images(self, images, scale_req=False, req_resolution=(800, 1280), keep_frame=False):
+        """Yields CharucoDetector.detect_image results in the order of images, see detection_workers."""
+        return self.charuco_detector.detect_many(images, self.detection_workers, self.detection_executor, scale_req, req_resolution, keep_frame, self.frame_store)
+
+    def prefilter_frames(self, images):
+        """
+        Quality prefilter ahead of the detection (quality_filter "flag" or "reject"): frame_quality of every
+        image checked against quality_thresholds, results and reasons kept in self.frame_quality. Only pass
+        the frames which are going to be detected, cache hits are not decoded at all. With the thread
+        executor the frames are decoded through the frame store, so the detection afterwards does not decode
+        them again, the process workers decode on their own and the frames are scored in a process pool too.
+        Returns the images which failed.
+        """
+        start_time = time.time()
+        if self.detection_workers > 1 and len(images) > 1 and self.detection_executor == "process":
+            with ProcessPoolExecutor(max_workers = self.detection_workers) as executor:
+                qualities = list(executor.map(measure_frame_quality, images, [self.quality_thresholds] * len(images)))
+        elif self.detection_workers > 1 and len(images) > 1:
+            with ThreadPoolExecutor(max_workers = self.detection_workers) as executor:
+                qualities = list(executor.map(lambda im: measure_frame_quality(im, self.quality_thresholds, self.frame_store), images))
+        else:
+            frame_store = None if self.detection_executor == "process" else self.frame_store
+            qualities = [measure_frame_quality(im, self.quality_thresholds, frame_store) for im in images]
+        flagged = []
+        for im, quality in zip(images, qualities):
+            self.frame_quality[im] = quality
+            if quality["reasons"]:
+                flagged.append(im)
+                print(f'Frame {im} {"rejected" if self.quality_filter == "reject" else "flagged"} by the quality prefilter: {", ".join(quality["reasons"])}')
+        print(f"Quality prefilter: {len(images)} frames in {round(time.time() - start_time, 3)}s, {len(flagged)} {'rejected' if self.quality_filter == 'reject' else 'flagged'}")
+        return flagged
 
     def analyze_charuco(self, images, scale_req=False, req_resolution=(800, 1280)):
         """
@@ -1023,62 +2375,51 @@ class StereoCalibration(object):
         all_marker_corners = []
         all_marker_ids = []
         all_recovered = []
-        # decimator = 0
-        # SUB PIXEL CORNER DETECTION CRITERION
-        criteria = (cv2.TERM_CRITERIA_EPS +
-                    cv2.TERM_CRITERIA_MAX_ITER, 10000, 0.00001)
-        count = 0
+        imsize = None
         skip_vis = False
+        keep_frame = self.traceLevel == 2 or self.traceLevel == 4 or self.traceLevel == 10
+        lookup = None
+        if self.detection_cache and len(images) > 0:
+            lookup = self.lookup_detection_cache(images, scale_req, req_resolution)
+        rejected = set()
+        if self.quality_filter is not None:
+            # cache hits passed the prefilter when they were detected, only the frames still to detect are scored
+            flagged = self.prefilter_frames(images if lookup is None else [im for im, entry in zip(images, lookup[2]) if entry is None])
+            if self.quality_filter == "reject":
+                # rejected frames skip the detection and keep an empty placeholder, the views stay index aligned
+                rejected = set(flagged)
+                if len(rejected) == len(images):
+                    return f'All {len(images)} frames rejected by the quality prefilter', None, None, None, None, None
+        if lookup is not None:
+            detections = self.cached_charuco_images(images, lookup, scale_req, req_resolution, keep_frame, rejected)
+        else:
+            detections = self.detect_charuco_images([im for im in images if im not in rejected], scale_req, req_resolution, keep_frame)
         for im in images:
+            if im in rejected:
+                placeholder_corners, placeholder_ids = empty_detection()
+                allCorners.append(placeholder_corners)
+                allIds.append(placeholder_ids)
+                all_marker_corners.append(None)
+                all_marker_ids.append(None)
+                continue
+            shape, charuco_corners, charuco_ids, marker_corners, marker_ids, gray = next(detections)
             if self.traceLevel == 3 or self.traceLevel == 10:
                 print("=> Processing image {0}".format(im))
             img_pth = Path(im)
-            frame = cv2.imread(im)
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            expected_height = gray.shape[0]*(req_resolution[1]/gray.shape[1])
-
-            if scale_req and not (gray.shape[0] == req_resolution[0] and gray.shape[1] == req_resolution[1]):
-                if int(expected_height) == req_resolution[0]:
-                    # resizing to have both stereo and rgb to have same
-                    # resolution to capture extrinsics of the rgb-right camera
-                    gray = cv2.resize(gray, req_resolution[::-1],
-                                      interpolation=cv2.INTER_CUBIC)
-                else:
-                    # resizing and cropping to have both stereo and rgb to have same resolution
-                    # to calculate extrinsics of the rgb-right camera
-                    scale_width = req_resolution[1]/gray.shape[1]
-                    dest_res = (
-                        int(gray.shape[1] * scale_width), int(gray.shape[0] * scale_width))
-                    gray = cv2.resize(
-                        gray, dest_res, interpolation=cv2.INTER_CUBIC)
-                    if gray.shape[0] < req_resolution[0]:
-                        raise RuntimeError("resizeed height of rgb is smaller than required. {0} < {1}".format(
-                            gray.shape[0], req_resolution[0]))
-                    # print(gray.shape[0] - req_resolution[0])
-                    del_height = (gray.shape[0] - req_resolution[0]) // 2
-                    # gray = gray[: req_resolution[0], :]
-                    gray = gray[del_height: del_height + req_resolution[0], :]
-
-                count += 1
-            
-            ret, charuco_corners, charuco_ids, marker_corners, marker_ids  = self.detect_charuco_board(gray)
+            imsize = shape[::-1]
 
             if self.traceLevel == 2 or self.traceLevel == 4 or self.traceLevel == 10:
                 print('{0} number of Markers corners detected in the image {1}'.format(
                     len(charuco_corners), img_pth.name))
 
             if charuco_corners is not None and charuco_ids is not None and len(charuco_corners) > 3:
-
-                charuco_corners = cv2.cornerSubPix(gray, charuco_corners,
-                                    winSize=(5, 5),
-                                    zeroZone=(-1, -1),
-                                    criteria=criteria)
                 allCorners.append(charuco_corners)  # Charco chess corners
                 allIds.append(charuco_ids)  # charuco chess corner id's
                 all_marker_corners.append(marker_corners)
                 all_marker_ids.append(marker_ids)
             else:
                 print(im)
+                detections.close()
                 return f'Failed to detect more than 3 markers on image {im}', None, None, None, None, None
 
             if self.traceLevel == 2 or self.traceLevel == 4 or self.traceLevel == 10:
@@ -1095,8 +2436,7 @@ class StereoCalibration(object):
                     if k == 27: # Esc key to skip vis
                         skip_vis = True
                 cv2.destroyAllWindows()
-        # imsize = gray.shape[::-1]
-        return allCorners, allIds, all_marker_corners, all_marker_ids, gray.shape[::-1], all_recovered
+        return allCorners, allIds, all_marker_corners, all_marker_ids, imsize, all_recovered
 
     def calibrate_intrinsics(self, image_files, hfov, name):
         image_files = glob.glob(image_files + "/*")
@@ -1116,7 +2456,7 @@ class StereoCalibration(object):
 
         coverageImage = np.ones(imsize[::-1], np.uint8) * 255
         coverageImage = cv2.cvtColor(coverageImage, cv2.COLOR_GRAY2BGR)
-        coverageImage = self.draw_corners(allCorners, coverageImage)
+        coverageImage = self.draw_corners(allCorners, coverageImage, name)
         if self.calib_model[name] == 'perspective':
             distortion_flags = self.get_distortion_flags(name)
             ret, camera_matrix, distortion_coefficients, rotation_vectors, translation_vectors, filtered_ids, filtered_corners, allCorners, allIds  = self.calibrate_camera_charuco(
@@ -1161,7 +2501,10 @@ class StereoCalibration(object):
     def undistort_visualization(self, img_list, K, D, img_size, name):
         for index, im in enumerate(img_list):
             # print(im)
-            img = cv2.imread(im)
+            if index > 0 and not (self.traceLevel == 4 or self.traceLevel == 5 or self.traceLevel == 10):
+                # only the first image is saved when nothing is displayed
+                break
+            img = self.frame_store.get(im)
             # h, w = img.shape[:2]
             if self.cameraModel == 'perspective':
                 kScaled, _ = cv2.getOptimalNewCameraMatrix(K, D, img_size, 0)
@@ -1197,14 +2540,18 @@ class StereoCalibration(object):
 
     def filter_corner_outliers(self, allIds, allCorners, camera_matrix, distortion_coefficients, rotation_vectors, translation_vectors):
         corners_removed = False
+        detections = DetectionSet.from_lists(allCorners, allIds)
+        model = camera_model(self.cameraModel, camera_matrix, distortion_coefficients)
+        # views without a pose are skipped, their corners are kept as they are
+        posed = [rvec is not None for rvec in rotation_vectors]
+        rotation_vectors = [np.zeros((3, 1)) if rvec is None else rvec for rvec in rotation_vectors]
+        translation_vectors = [np.zeros((3, 1)) if tvec is None else tvec for tvec in translation_vectors]
+        errors_all = model.residuals(detections.object_points(self.board.chessboardCorners), detections.corners, rotation_vectors, translation_vectors, detections.view_index)
         for i in range(len(allIds)):
+            if not posed[i]:
+                continue
             corners = allCorners[i]
-            ids = allIds[i]
-            objpts = self.charuco_ids_to_objpoints(ids)
-            if self.cameraModel == "fisheye":
-                errs = self.compute_reprojection_errors(objpts, corners, camera_matrix, distortion_coefficients, rotation_vectors[i], translation_vectors[i], fisheye = True)
-            else:
-                errs = self.compute_reprojection_errors(objpts, corners, camera_matrix, distortion_coefficients, rotation_vectors[i], translation_vectors[i])
+            errs = errors_all[detections.offsets[i]:detections.offsets[i + 1]]
             suspicious_err_thr = max(2*np.median(errs), 100)
             n_offending_pts = np.sum(errs > suspicious_err_thr)
             offending_pts_idxs = np.where(errs > suspicious_err_thr)[0]
@@ -1229,6 +2576,14 @@ class StereoCalibration(object):
             cameraMatrixInit = np.array([[f,    0.0,      imsize[0]/2],
                                      [0.0,     f,      imsize[1]/2],
                                      [0.0,   0.0,        1.0]])
+            if self.intrinsic_init == "zhang":
+                homography_init = self.homography_intrinsics(allCorners, allIds, imsize, hfov)
+                if homography_init is not None:
+                    cameraMatrixInit = homography_init
+            threshold = 20 * imsize[1]/800.0
+        elif name in self.closed_form_init:
+            # closed-form K without a distortion estimate, the first pass has to tolerate lens distortion
+            cameraMatrixInit = self.cameraIntrinsics[name]
             threshold = 20 * imsize[1]/800.0
         else:
             cameraMatrixInit = self.cameraIntrinsics[name]
@@ -1243,24 +2598,12 @@ class StereoCalibration(object):
         else:
             distCoeffsInit = self.cameraDistortion[name]
          # check if there are any suspicious corners with high reprojection error
-        rvecs = []
-        tvecs = []
-        self.index = 0
-        index = 0
         max_threshold = 10 + self.initial_max_threshold * (hfov / 30 + imsize[1] / 800 * 0.2)
         min_inlier = 1 - self.initial_min_filtered * (hfov / 60 + imsize[1] / 800 * 0.2)
-        for corners, ids in zip(allCorners, allIds):
-            self.index = index
-            objpts = self.charuco_ids_to_objpoints(ids)
-            rvec, tvec, newids = self.camera_pose_charuco(objpts, corners, ids, cameraMatrixInit, distCoeffsInit)
-            tvecs.append(tvec)
-            rvecs.append(rvec)
-            index += 1
+        rvecs, tvecs, _ = self.estimate_poses(allCorners, allIds, cameraMatrixInit, distCoeffsInit, stage = "intrinsic")
 
         # Here we need to get initialK and parameters for each camera ready and fill them inside reconstructed reprojection error per point
         ret = 0.0
-        flags = cv2.CALIB_USE_INTRINSIC_GUESS
-        flags += distortion_flags
 
         #     flags = (cv2.CALIB_RATIONAL_MODEL)
         reprojection = []
@@ -1271,7 +2614,8 @@ class StereoCalibration(object):
         intrinsic_array = {"f_x": [], "f_y": [], "c_x": [],"c_y": []}
         distortion_array = {}
         index = 0
-        if self.traceLevel != 0:
+        # the histogram figure is only drawn at trace level 12, stages may run off the main thread
+        if self.traceLevel == 12:
             fig, ax = plt.subplots()
         camera_matrix = cameraMatrixInit
         distortion_coefficients = distCoeffsInit
@@ -1282,8 +2626,19 @@ class StereoCalibration(object):
         translation_array_z = []
         corner_checker = 0
         previous_ids = []
+        solve_stats = []
+        self.solve_stats[name] = solve_stats
         import time
         try:
+            if self.distortion_model[name] == "AUTO":
+                self.distortion_model[name] = self.select_distortion_model(allCorners, allIds, imsize, cameraMatrixInit, name)
+                distortion_flags = self.get_distortion_flags(name)
+            flags = cv2.CALIB_USE_INTRINSIC_GUESS
+            flags += distortion_flags
+
+            if self.robust_loss is not None:
+                return self.calibrate_camera_robust(allCorners, allIds, cameraMatrixInit, distCoeffsInit, rvecs, tvecs, imsize, name, flags)
+
             whole = time.time()
             while True:
                 intrinsic_array['f_x'].append(camera_matrix[0][0])
@@ -1292,9 +2647,10 @@ class StereoCalibration(object):
                 intrinsic_array['c_y'].append(camera_matrix[1][2])
                 num_threshold.append(threshold)
 
-                translation_array_x.append(np.mean(np.array(translation_vectors).T[0][0]))
-                translation_array_y.append(np.mean(np.array(translation_vectors).T[0][1]))
-                translation_array_z.append(np.mean(np.array(translation_vectors).T[0][2]))
+                posed_translations = np.array([tvec for tvec in translation_vectors if tvec is not None])
+                translation_array_x.append(np.mean(posed_translations.T[0][0]))
+                translation_array_y.append(np.mean(posed_translations.T[0][1]))
+                translation_array_z.append(np.mean(posed_translations.T[0][2]))
 
 
                 start = time.time()
@@ -1311,29 +2667,55 @@ class StereoCalibration(object):
                     _, bins, _ = ax.hist(all_error, range = [0,30], bins = 100, label = f"Iteration {index}, number filtered: {len(removed_corners)}", color= plt.cm.summer(1-(index-1)/10), alpha = 0.3, edgecolor ="black")  
                     ax.hist(removed_error, bins = bins, color= plt.cm.summer(1-(index-1)/7), alpha = 0.8, edgecolor = "black")
                     ax.vlines(threshold, ymin = -0.5, ymax = len(all_error), color = "red")
+                inliers_settled = index > 0 and previous_ids == removed_ids
+                if self.intrinsic_schedule == "coarse_to_fine":
+                    # loose solves while the inlier set still moves, tight ones once it settled
+                    criteria = intrinsic_solve_schedule["tight" if inliers_settled else "loose"]
+                else:
+                    criteria = (cv2.TERM_CRITERIA_EPS & cv2.TERM_CRITERIA_COUNT, 50000, 1e-9)
+                # the solver writes into the guess arrays, keep the previous solution for the delta
+                previous_camera_matrix = np.array(cameraMatrixInit, copy = True)
                 start = time.time()
                 try:
-                    (ret, camera_matrix, distortion_coefficients,
-                     rotation_vectors, translation_vectors,
-                     stdDeviationsIntrinsics, stdDeviationsExtrinsics,
-                     perViewErrors) = cv2.aruco.calibrateCameraCharucoExtended(
-                        charucoCorners=filtered_corners,
-                        charucoIds=filtered_ids,
-                        board=self.board,
-                        imageSize=imsize,
-                        cameraMatrix=cameraMatrixInit,
-                        distCoeffs=distCoeffsInit,
-                        flags=flags,
-                        criteria=(cv2.TERM_CRITERIA_EPS & cv2.TERM_CRITERIA_COUNT, 50000, 1e-9))
+                    if self.intrinsic_solver == "sparse":
+                        (ret, camera_matrix, distortion_coefficients,
+                         rotation_vectors, translation_vectors,
+                         stdDeviationsIntrinsics, stdDeviationsExtrinsics,
+                         perViewErrors) = self.calibrate_charuco_sparse(
+                            filtered_corners, filtered_ids, cameraMatrixInit, distCoeffsInit,
+                            rotation_vectors, translation_vectors, flags, criteria = criteria)
+                    else:
+                        (ret, camera_matrix, distortion_coefficients,
+                         rotation_vectors, translation_vectors,
+                         stdDeviationsIntrinsics, stdDeviationsExtrinsics,
+                         perViewErrors) = self.calibrate_charuco_extended(
+                            charucoCorners=filtered_corners,
+                            charucoIds=filtered_ids,
+                            board=self.board,
+                            imageSize=imsize,
+                            cameraMatrix=cameraMatrixInit,
+                            distCoeffs=distCoeffsInit,
+                            flags=flags,
+                            criteria=criteria)
                 except:
                     return ret, camera_matrix, distortion_coefficients, rotation_vectors, translation_vectors, filtered_ids, filtered_corners, allCorners, allIds
+                parameter_delta = self.parameter_delta(previous_camera_matrix, camera_matrix)
+                solve_stats.append({"iteration": index, "criteria": criteria, "time": time.time() - start, "removed": len(removed_ids), "ret": ret, "parameter_delta": parameter_delta})
                 cameraMatrixInit = camera_matrix
                 distCoeffsInit = distortion_coefficients
                 threshold = 5 * imsize[1]/800.0
                 print(f"Each calibration {time.time()-start}")
                 index += 1
-                if  index > 5 or (previous_ids == removed_ids and len(previous_ids) >= len(removed_ids) and index > 2):
+                converged = previous_ids == removed_ids and len(previous_ids) >= len(removed_ids) and index > 2
+                if self.intrinsic_schedule == "coarse_to_fine":
+                    # settled inliers and either a negligible update or a second tight solve on them
+                    previous_tight = len(solve_stats) > 1 and solve_stats[-2]["criteria"] == intrinsic_solve_schedule["tight"]
+                    converged = inliers_settled and (parameter_delta < intrinsic_solve_schedule["parameter_tol"] or previous_tight)
+                if  index > 5 or converged:
+                    # fx fy cx cy k1 k2 p1 p2 k3 k4 k5 k6 s1 s2 s3 s4 tauX tauY
+                    self.intrinsic_std[name] = np.array(stdDeviationsIntrinsics).ravel()
                     print(f"Whole procedure: {time.time() - whole}")
+                    print(f"Intrinsic solves of {name}: {len(solve_stats)} solves, {round(sum(stat['time'] for stat in solve_stats), 3)}s")
                     if self.traceLevel == 12:
                         fig.suptitle(f"Histograms of reprojection error for threshold {threshold}")
                         ax.legend()
@@ -1400,12 +2782,176 @@ class StereoCalibration(object):
                     break
                 previous_ids = removed_ids
         except:
-            return f"Failed to calibrate camera {name}", None, None, None, None, None, None, None ,None , None
+            return f"Failed to calibrate camera {name}", None, None, None, None, None, None, None, None
         if self.traceLevel == 3 or self.traceLevel == 10:
             print('Per View Errors...')
             print(perViewErrors)
         return ret, camera_matrix, distortion_coefficients, rotation_vectors, translation_vectors, filtered_ids, filtered_corners, allCorners, allIds
 
+    def select_distortion_model(self, allCorners, allIds, imsize, cameraMatrixInit, name):
+        """
+        Picks the distortion model of a camera with distortion_model "AUTO". Every candidate of
+        distortion_candidates (ordered from the most compact one) is fitted k-fold by image in a thread
+        pool, the held-out views are scored with their poses solved under the fitted intrinsics. Returns
+        the first candidate whose validation error is within model_selection_tolerance of the best one,
+        the errors and fit times of all candidates are kept in self.model_selection[name].
+        """
+        views = [index for index, ids in enumerate(allIds) if len(ids) >= 6]
+        folds = max(2, min(self.model_selection_folds, len(views)))
+        if len(views) < folds:
+            print(f"Distortion model selection of {name}: {len(views)} usable views for {folds} folds, using NORMAL")
+            return "NORMAL"
+        candidate_flags = {candidate: self.get_distortion_flags(name, candidate) for candidate in self.distortion_candidates}
+
+        def fit(candidate, fold):
+            train = [index for position, index in enumerate(views) if position % folds != fold]
+            held_out = [index for position, index in enumerate(views) if position % folds == fold]
+            flags = cv2.CALIB_USE_INTRINSIC_GUESS + candidate_flags[candidate]
+            start = time.time()
+            ret, camera_matrix, distortion_coefficients, _, _ = cv2.aruco.calibrateCameraCharuco(
+                charucoCorners=[allCorners[index] for index in train],
+                charucoIds=[allIds[index] for index in train],
+                board=self.board,
+                imageSize=imsize,
+                cameraMatrix=np.array(cameraMatrixInit, copy = True),
+                distCoeffs=np.zeros((14, 1)),
+                flags=flags,
+                criteria=(cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_COUNT, 1000, 1e-6))
+            fit_time = time.time() - start
+            squared = []
+            for index in held_out:
+                objpoints = self.charuco_ids_to_objpoints(allIds[index])
+                _, rvec, tvec = cv2.solvePnP(objpoints, allCorners[index], camera_matrix, distortion_coefficients, flags = cv2.SOLVEPNP_IPPE)
+                rvec, tvec = cv2.solvePnPRefineLM(objpoints, allCorners[index], camera_matrix, distortion_coefficients, rvec, tvec)
+                projected, _ = cv2.projectPoints(objpoints, rvec, tvec, camera_matrix, distortion_coefficients)
+                squared.append(np.sum(np.square(projected.reshape(-1, 2) - allCorners[index].reshape(-1, 2)), axis = 1))
+            return ret, fit_time, np.concatenate(squared)
+
+        jobs = [(candidate, fold) for candidate in self.distortion_candidates for fold in range(folds)]
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers = max(1, self.model_selection_workers)) as executor:
+            results = dict(zip(jobs, executor.map(lambda job: fit(*job), jobs)))
+        selection = {}
+        for candidate in self.distortion_candidates:
+            fold_results = [results[(candidate, fold)] for fold in range(folds)]
+            selection[candidate] = {
+                "flags": candidate_flags[candidate],
+                "train_error": float(np.mean([ret for ret, _, _ in fold_results])),
+                "validation_error": float(np.sqrt(np.mean(np.concatenate([squared for _, _, squared in fold_results])))),
+                "fit_time": sum(fit_time for _, fit_time, _ in fold_results),
+            }
+        best = min(entry["validation_error"] for entry in selection.values())
+        chosen = next(candidate for candidate in self.distortion_candidates if selection[candidate]["validation_error"] <= best * (1 + self.model_selection_tolerance))
+        self.model_selection[name] = selection
+        print(f"Distortion model selection of {name}: {len(jobs)} fits ({folds} folds) in {round(time.time() - start_time, 3)}s")
+        for candidate, entry in selection.items():
+            print(f"  {candidate}: validation {round(entry['validation_error'], 4)} px, train {round(entry['train_error'], 4)} px, fit {round(entry['fit_time'], 3)}s{' <- chosen' if candidate == chosen else ''}")
+        return chosen
+
+    def calibrate_camera_robust(self, allCorners, allIds, camera_matrix, distortion_coefficients, rvecs, tvecs, imsize, name, flags):
+        """
+        Replaces the filtering/re-solve loop of calibrate_camera_charuco: one sparse solve over all corners
+        with the robust_loss ("huber", "cauchy", ...) where the outliers only lose weight, inliers marked from
+        its residuals with the threshold the loop ends on, so the removed corners are reported the same way.
+        The loss still pulls the inliers a little, a last plain solve on them, warm-started from the robust
+        solution, removes that bias and gives the reprojection error the loop would report.
+        """
+        f_scale = self.robust_loss_scale * imsize[1] / 800.0
+        threshold = 5 * imsize[1] / 800.0
+        solve_stats = []
+        self.solve_stats[name] = solve_stats
+        start = time.time()
+        try:
+            (ret, new_camera_matrix, distortion_coefficients,
+             rotation_vectors, translation_vectors,
+             stdDeviationsIntrinsics, stdDeviationsExtrinsics,
+             perViewErrors) = self.calibrate_charuco_sparse(
+                allCorners, allIds, camera_matrix, distortion_coefficients, rvecs, tvecs, flags, loss = self.robust_loss, f_scale = f_scale)
+        except Exception:
+            return f"Failed to calibrate camera {name}", None, None, None, None, None, None, None, None
+        filtered_corners, filtered_ids, all_error, removed_corners, removed_ids, removed_error = self.features_filtering_function(rotation_vectors, translation_vectors, new_camera_matrix, distortion_coefficients, ret, allCorners, allIds, camera = name, threshold = threshold)
+        solve_stats.append({"iteration": 0, "criteria": self.robust_loss, "time": time.time() - start, "removed": len(removed_ids), "ret": ret,
+                            "parameter_delta": self.parameter_delta(camera_matrix, new_camera_matrix)})
+
+        camera_matrix = np.array(new_camera_matrix, copy = True)
+        start = time.time()
+        try:
+            if self.intrinsic_solver == "sparse":
+                (ret, new_camera_matrix, distortion_coefficients,
+                 rotation_vectors, translation_vectors,
+                 stdDeviationsIntrinsics, stdDeviationsExtrinsics,
+                 perViewErrors) = self.calibrate_charuco_sparse(
+                    filtered_corners, filtered_ids, new_camera_matrix, distortion_coefficients, rotation_vectors, translation_vectors, flags)
+            else:
+                (ret, new_camera_matrix, distortion_coefficients,
+                 rotation_vectors, translation_vectors,
+                 stdDeviationsIntrinsics, stdDeviationsExtrinsics,
+                 perViewErrors) = self.calibrate_charuco_extended(
+                    charucoCorners=filtered_corners,
+                    charucoIds=filtered_ids,
+                    board=self.board,
+                    imageSize=imsize,
+                    cameraMatrix=new_camera_matrix,
+                    distCoeffs=distortion_coefficients,
+                    flags=flags,
+                    criteria=intrinsic_solve_schedule["tight"])
+        except:
+            return f"Failed to calibrate camera {name}", None, None, None, None, None, None, None, None
+        solve_stats.append({"iteration": 1, "criteria": intrinsic_solve_schedule["tight"], "time": time.time() - start, "removed": len(removed_ids), "ret": ret,
+                            "parameter_delta": self.parameter_delta(camera_matrix, new_camera_matrix)})
+        self.intrinsic_std[name] = np.array(stdDeviationsIntrinsics).ravel()
+        print(f"Robust ({self.robust_loss}) calibration of {name}: {len(solve_stats)} solves in {round(sum(stat['time'] for stat in solve_stats), 3)}s, {len(removed_ids)} corners above {threshold} px removed")
+        if self.traceLevel == 3 or self.traceLevel == 10:
+            print('Per View Errors...')
+            print(perViewErrors)
+        return ret, new_camera_matrix, distortion_coefficients, rotation_vectors, translation_vectors, filtered_ids, filtered_corners, allCorners, allIds
+
+    def parameter_delta(self, camera_matrix, new_camera_matrix):
+        """
+        Largest change of the camera matrix between two solves, relative to the focal length. The
+        distortion is left out, the higher rational terms are poorly constrained and keep drifting
+        without changing the reprojection.
+        """
+        focal = max(abs(new_camera_matrix[0][0]), 1e-9)
+        return np.max(np.abs(np.asarray(new_camera_matrix) - np.asarray(camera_matrix))) / focal
+
+    def calibrate_charuco_extended(self, charucoCorners, charucoIds, board, imageSize, cameraMatrix, distCoeffs, flags, criteria):
+        """
+        cv2.aruco.calibrateCameraCharucoExtended over the views that have corners. Views skipped for lack
+        of a pose are empty and OpenCV rejects those, they are left out of the solve.
+        """
+        views = [i for i, ids in enumerate(charucoIds) if len(ids) > 0]
+        result = cv2.aruco.calibrateCameraCharucoExtended(
+            charucoCorners=[charucoCorners[i] for i in views],
+            charucoIds=[charucoIds[i] for i in views],
+            board=board,
+            imageSize=imageSize,
+            cameraMatrix=cameraMatrix,
+            distCoeffs=distCoeffs,
+            flags=flags,
+            criteria=criteria)
+        return expand_views(result, views, len(charucoIds))
+
+    def calibrate_charuco_sparse(self, allCorners, allIds, camera_matrix, distortion_coefficients, rvecs, tvecs, flags, fisheye = False, criteria = None, loss = 'linear', f_scale = 1.0):
+        """
+        Drop-in for cv2.aruco.calibrateCameraCharucoExtended (and cv2.fisheye.calibrate with fisheye=True)
+        on top of sparse_calibrate. The poses of the previous solve or of estimate_poses are the starting
+        point, a COUNT criteria bounds the number of function evaluations.
+        """
+        # views skipped for lack of a pose have no corners, they are left out of the solve
+        views = [i for i, ids in enumerate(allIds) if len(ids) > 0]
+        detections = DetectionSet.from_lists([allCorners[i] for i in views], [allIds[i] for i in views])
+        max_nfev = 100
+        if criteria is not None and criteria[0] & cv2.TERM_CRITERIA_COUNT:
+            max_nfev = criteria[1]
+        # a view with corners but no pose starts from the board straight ahead
+        rvecs = [np.zeros((3, 1)) if rvecs[i] is None else rvecs[i] for i in views]
+        tvecs = [np.array([[0.0], [0.0], [1.0]]) if tvecs[i] is None else tvecs[i] for i in views]
+        result = sparse_calibrate(detections.object_points(self.board.chessboardCorners), detections.corners, detections.view_index,
+                                  camera_matrix, distortion_coefficients, rvecs, tvecs, flags = flags, fisheye = fisheye, max_nfev = max_nfev,
+                                  loss = loss, f_scale = f_scale)
+        return expand_views(result, views, len(allIds))
+
     def calibrate_fisheye(self, allCorners, allIds, imsize, hfov, name):
         one_pts = self.board.chessboardCorners
         obj_points = []
@@ -1413,22 +2959,18 @@ class StereoCalibration(object):
             obj_points.append(self.charuco_ids_to_objpoints(allIds[i]))
 
         f_init = imsize[0]/np.deg2rad(hfov)*1.15
+        if self.intrinsic_init == "zhang":
+            homography_init = self.homography_intrinsics(allCorners, allIds, imsize, hfov, fisheye = True)
+            if homography_init is not None:
+                f_init = (homography_init[0, 0] + homography_init[1, 1]) / 2
 
         cameraMatrixInit = np.array([[f_init, 0.          , imsize[0]/2],
                                      [0.          , f_init, imsize[1]/2],
                                      [0.          , 0.          , 1.          ]])
         distCoeffsInit = np.zeros((4,1))
          # check if there are any suspicious corners with high reprojection error
-        rvecs = []
-        tvecs = []
-        self.index = 0
-        for corners, ids in zip(allCorners, allIds):
-            objpts = self.charuco_ids_to_objpoints(ids)
-            corners_undist = cv2.fisheye.undistortPoints(corners, cameraMatrixInit, distCoeffsInit, None, np.eye(3))
-            rvec, tvec, new_ids = self.camera_pose_charuco(objpts, corners_undist,ids, np.eye(3), np.array((0.0,0,0,0)))
-            tvecs.append(tvec)
-            rvecs.append(rvec)
-            self.index +=1 
+        corners_undist = [cv2.fisheye.undistortPoints(corners, cameraMatrixInit, distCoeffsInit, None, np.eye(3)) for corners in allCorners]
+        rvecs, tvecs, _ = self.estimate_poses(corners_undist, allIds, np.eye(3), np.array((0.0,0,0,0)), stage = "fisheye")
         corners_removed, filtered_ids, filtered_corners = self.filter_corner_outliers(allIds, allCorners, cameraMatrixInit, distCoeffsInit, rvecs, tvecs)
         if corners_removed:
             obj_points = []
@@ -1448,71 +2990,525 @@ class StereoCalibration(object):
         term_criteria = (cv2.TERM_CRITERIA_COUNT +
                          cv2.TERM_CRITERIA_EPS, 30, 1e-9)
         try:
-            res, K, d, rvecs, tvecs =  cv2.fisheye.calibrate(obj_points, filtered_corners, None, cameraMatrixInit, distCoeffsInit, flags=flags, criteria=term_criteria)
+            if self.robust_loss is not None:
+                res, K, d, rvecs, tvecs = self.calibrate_charuco_sparse(filtered_corners, filtered_ids, cameraMatrixInit, distCoeffsInit, rvecs, tvecs, distortion_flags, fisheye = True,
+                                                                        loss = self.robust_loss, f_scale = self.robust_loss_scale * imsize[1] / 800.0)[:5]
+            elif self.intrinsic_solver == "sparse":
+                res, K, d, rvecs, tvecs = self.calibrate_charuco_sparse(filtered_corners, filtered_ids, cameraMatrixInit, distCoeffsInit, rvecs, tvecs, distortion_flags, fisheye = True, criteria = term_criteria)[:5]
+            else:
+                res, K, d, rvecs, tvecs =  cv2.fisheye.calibrate(obj_points, filtered_corners, None, cameraMatrixInit, distCoeffsInit, flags=flags, criteria=term_criteria)
         except:
-            # calibration failed for full FOV, let's try to limit the corners to smaller part of FOV first to find initial parameters
-            success = False
-            crop = 0.95
-            while not success:
-                print(f"trying crop factor {crop}")
-                obj_points_limited = []
-                corners_limited = []
-                for obj_pts, corners in zip(obj_points, filtered_corners):
-                    obj_points_tmp = []
-                    corners_tmp = []
-                    for obj_pt, corner in zip(obj_pts, corners):
-                        check_x = corner[0,0] > imsize[0]*(1-crop) and corner[0,0] < imsize[0]*crop
-                        check_y = corner[0,1] > imsize[1]*(1-crop) and corner[0,1] < imsize[1]*crop
-                        if check_x and check_y:
-                            obj_points_tmp.append(obj_pt)
-                            corners_tmp.append(corner)
-                    obj_points_limited.append(np.array(obj_points_tmp))
-                    corners_limited.append(np.array(corners_tmp))
-                try:
-                    res, K, d, rvecs, tvecs = cv2.fisheye.calibrate(obj_points_limited, corners_limited, None, cameraMatrixInit, distCoeffsInit, flags=flags, criteria=term_criteria)
-                    print(f"success with crop factor {crop}")
-                    success = True
-                    break
-                except:
-                    print(f"failed with crop factor {crop}")
-                    if crop > 0.7:
-                        crop -= 0.05
-                    else:
-                        raise Exception("Calibration failed: Tried maximum crop factor and still no success")
-            if success:
-                # trying the full FOV once more with better initial K
-                print(f"new K init {K}")
-                print(f"new d_init {d}")
-                try:
-                    res, K, d, rvecs, tvecs =  cv2.fisheye.calibrate(obj_points, filtered_corners, imsize, K, distCoeffsInit, flags=flags, criteria=term_criteria) 
-                except:
-                    print(f"Failed the full res calib, using calibration with crop factor {crop}")
+            # calibration failed for full FOV, find the initial parameters on the central corners first
+            res, K, d, rvecs, tvecs = self.fisheye_central_init(obj_points, filtered_corners, imsize, cameraMatrixInit, distCoeffsInit, flags, term_criteria)
         filtered_corners, filtered_ids,all_error, removed_corners, removed_ids, removed_error = self.features_filtering_function(rvecs, tvecs, K, d, res, allCorners, allIds, camera = name, threshold=1)
         return res, K, d, rvecs, tvecs, filtered_ids, filtered_corners
 
 
-    def calibrate_stereo(self, left_name, right_name, allIds_l, allCorners_l, allIds_r, allCorners_r, cameraMatrix_l, distCoeff_l, cameraMatrix_r, distCoeff_r, t_in, r_in, features = None):
+    def fisheye_central_init(self, obj_points, corners, imsize, K, d, flags, criteria, radii = (0.5, 0.75)):
+        """
+        Fallback initialization of the fisheye calibration when the full FOV solve fails. The corners
+        closer to the image center than radii[0] of the half diagonal are fitted with the pure equidistant
+        model first, then the corners inside the next radius and finally all of them, each solve started
+        from the previous result. The full FOV is tried right after every solve, so a camera which fails
+        only due to a bad initial focal length needs two solves.
+        """
+        center = np.array([imsize[0], imsize[1]], dtype=np.float32) / 2
+        half_diagonal = np.linalg.norm(center)
+        distances = [np.linalg.norm(np.reshape(view, (-1, 2)) - center, axis=1) / half_diagonal for view in corners]
+        equidistant = cv2.fisheye.CALIB_FIX_K1 | cv2.fisheye.CALIB_FIX_K2 | cv2.fisheye.CALIB_FIX_K3 | cv2.fisheye.CALIB_FIX_K4
+        result = None
+        for step, radius in enumerate(radii):
+            masks = [distance < radius for distance in distances]
+            views = [i for i, mask in enumerate(masks) if np.count_nonzero(mask) >= 6]
+            print(f"trying corners within {radius} of the half diagonal, {len(views)} views")
+            if len(views) < 3:
+                continue
+            step_flags = flags & ~cv2.fisheye.CALIB_CHECK_COND
+            if step == 0:
+                step_flags |= equidistant
+            try:
+                _, K, d, _, _ = cv2.fisheye.calibrate([obj_points[i][masks[i]] for i in views], [corners[i][masks[i]] for i in views], imsize, K, d, flags=step_flags, criteria=criteria)
+            except:
+                print(f"failed with corners within {radius}")
+                continue
+            print(f"new K init {K}")
+            print(f"new d_init {d}")
+            try:
+                return cv2.fisheye.calibrate(obj_points, corners, imsize, K, d, flags=flags, criteria=criteria)
+            except:
+                result = (radius, K, d)
+        if result is None:
+            raise Exception("Calibration failed: no initialization on the central corners succeeded")
+        radius, K, d = result
+        print(f"Failed the full res calib, using calibration with corners within {radius}")
+        return cv2.fisheye.calibrate(obj_points, corners, imsize, K, d, flags=flags & ~cv2.fisheye.CALIB_CHECK_COND, criteria=criteria)
+
+    def calibrate_camera_stage(self, board_config, camera, filepath, charucos, resize):
+        """
+        Intrinsic stage of one camera: detection, filtering and the intrinsic calibration. Returns the
+        coverage image of the camera or an error string.
+        """
+        resizeWidth, resizeHeight = resize
+        cam_info = board_config['cameras'][camera]
+        self.id = cam_info["name"]
+        print(
+            '<------------Calibrating {} ------------>'.format(cam_info['name']))
+        images_path = filepath + '/' + cam_info['name']
+        distCoeffsInit = np.zeros((12, 1))
+        if "calib_model" in cam_info.keys():
+            self.cameraModel_ccm, self.model_ccm = cam_info["calib_model"].split("_")
+            if self.cameraModel_ccm == "fisheye":
+                self.model_ccm == None
+                distCoeffsInit = np.zeros((4, 1))
+            self.calib_model[cam_info["name"]] = self.cameraModel_ccm
+            self.distortion_model[cam_info["name"]] = self.model_ccm
+        else:
+            self.calib_model[cam_info["name"]] = self.cameraModel
+            if cam_info["name"] in self.ccm_model:
+                self.distortion_model[cam_info["name"]] = self.ccm_model[cam_info["name"]]
+            else:
+                self.distortion_model[cam_info["name"]] = self.model
+
+
+        features = None
+        self.img_path = glob.glob(images_path + "/*")
+        if charucos == {}:
+            try:
+                self.img_path = sorted(self.img_path, key=lambda x: int(x.split('_')[1]))
+            except:
+                self.img_path.sort()
+        else:
+            self.img_path.sort()
+        cam_info["img_path"] = self.img_path
+        self.name = cam_info["name"]
+        if per_ccm:
+            all_features, all_ids, imsize = self.getting_features(images_path, cam_info["name"], features=features)
+            if isinstance(all_features, str) and all_ids is None:
+                return all_features
+            cam_info["imsize"] = imsize
+            # frames rejected before the detection only have placeholders, the intrinsics run without them
+            num_frames = len(all_ids)
+            frames = detected_views(all_ids, min_corners = 1)
+            frame_img_path = self.img_path
+            if len(frames) < num_frames:
+                print(f"Calibrating {cam_info['name']} on {len(frames)}/{num_frames} frames, {num_frames - len(frames)} rejected")
+                all_features = [all_features[i] for i in frames]
+                all_ids = [all_ids[i] for i in frames]
+                self.img_path = [self.img_path[i] for i in frames if i < len(self.img_path)]
+
+            f = imsize[0] / (2 * np.tan(np.deg2rad(cam_info["hfov"]/2)))
+            print("INTRINSIC CALIBRATION")
+            cameraMatrixInit = np.array([[f,    0.0,      imsize[0]/2],
+                                         [0.0,     f,      imsize[1]/2],
+                                         [0.0,   0.0,        1.0]])
+            closed_form_init = False
+            if self.intrinsic_init == "zhang" and self.cameraModel != "fisheye":
+                homography_init = self.homography_intrinsics(all_features, all_ids, imsize, cam_info["hfov"])
+                if homography_init is not None:
+                    cameraMatrixInit = homography_init
+                    closed_form_init = True
+            if cam_info["name"] not in self.cameraIntrinsics.keys():
+                self.cameraIntrinsics[cam_info["name"]] = cameraMatrixInit
+
+            if self.traceLevel == 3 or self.traceLevel == 10:
+                print(
+                    f'Camera Matrix initialization with HFOV of {cam_info["name"]} is.............')
+                print(cameraMatrixInit)
+            if cam_info["name"] not in self.cameraDistortion:
+                self.cameraDistortion[cam_info["name"]] = distCoeffsInit
+
+            if cam_info["name"] in self.intrinsic_img:
+                # intrinsic_img indexes the camera's images, the views here are the detected frames
+                removed = set(self.intrinsic_img[cam_info["name"]])
+                drop = [index for index, frame in enumerate(frames) if frame in removed]
+                all_features, all_ids, filtered_images = self.remove_features(all_features, all_ids, drop, [cam_info['img_path'][frame] for frame in frames if frame < len(cam_info['img_path'])])
+                frames = [frame for frame in frames if frame not in removed]
+                self.img_path = filtered_images
+            else:
+                filtered_images = images_path
+            current_time = time.time()
+            if self.cameraModel != "fisheye":
+                print("Filtering corners")
+                removed_features, filtered_features, filtered_ids = self.filtering_features(all_features, all_ids, cam_info["name"],imsize,cam_info["hfov"], cameraMatrixInit, distCoeffsInit, closed_form_init)
+
+                if filtered_features is None:
+                    return removed_features
+
+                print(f"Filtering takes: {time.time()-current_time}")
+                if  cam_info["name"] not in self.collected_features.keys():
+                    self.collected_features[cam_info["name"]] = filtered_features
+                if  cam_info["name"] not in self.collected_ids.keys():
+                    self.collected_ids[cam_info["name"]] = filtered_ids
+            else:
+                filtered_features = all_features
+                filtered_ids = all_ids
+
+            cam_info['filtered_ids'] = filtered_ids
+            cam_info['filtered_corners'] = filtered_features
+            if len(frames) < num_frames:
+                # back to one entry per frame for the extrinsics, which pair the cameras' views by index
+                cam_info['filtered_corners'], cam_info['filtered_ids'] = map(list, zip(*[empty_detection() for _ in range(num_frames)]))
+                for frame, corners, ids in zip(frames, filtered_features, filtered_ids):
+                    cam_info['filtered_corners'][frame] = corners
+                    cam_info['filtered_ids'][frame] = ids
+
+            if self.keyframe_selection:
+                # only the intrinsic solve runs on the keyframes, stereo keeps every view
+                keyframes = self.select_keyframes(filtered_features, filtered_ids, imsize, cam_info["name"])
+                all_features = [all_features[i] for i in keyframes]
+                all_ids = [all_ids[i] for i in keyframes]
+                filtered_features = [filtered_features[i] for i in keyframes]
+                filtered_ids = [filtered_ids[i] for i in keyframes]
+                self.img_path = [self.img_path[i] for i in keyframes if i < len(self.img_path)]
+            ret, intrinsics, dist_coeff, _, _, filtered_ids, filtered_corners, size, coverageImage, all_corners, all_ids = self.calibrate_wf_intrinsics(cam_info["name"], all_features, all_ids, filtered_features, filtered_ids, cam_info["imsize"], cam_info["hfov"], features, filtered_images)
+            self.img_path = frame_img_path
+            if self.keyframe_selection and cam_info["name"] in self.solve_stats:
+                solve_time = sum(stat['time'] for stat in self.solve_stats[cam_info["name"]])
+                print(f"Intrinsic solve of {cam_info['name']} on {len(keyframes)}/{len(cam_info['filtered_ids'])} keyframes: {round(solve_time, 3)}s, ~{round(solve_time * (self.keyframe_points_ratio - 1), 3)}s saved")
+            if isinstance(ret, str) and all_ids is None:
+                return ret
+        else:
+            ret, intrinsics, dist_coeff, _, _, filtered_ids, filtered_corners, size, coverageImage, all_corners, all_ids = self.calibrate_intrinsics(
+                images_path, cam_info['hfov'], cam_info["name"])
+            cam_info['filtered_ids'] = filtered_ids
+            cam_info['filtered_corners'] = filtered_corners
+        self.cameraIntrinsics[cam_info["name"]] = intrinsics
+        self.cameraDistortion[cam_info["name"]] = dist_coeff
+        cam_info['intrinsics'] = intrinsics
+        cam_info['dist_coeff'] = dist_coeff
+        cam_info['size'] = size # (Width, height)
+        cam_info['reprojection_error'] = ret
+        print("Reprojection error of {0}: {1}".format(
+            cam_info['name'], ret))
+        if self.traceLevel == 3 or self.traceLevel == 10:
+            print("Estimated intrinsics of {0}: \n {1}".format(
+            cam_info['name'], intrinsics))
+
+        coverage_name = cam_info['name']
+        print_text = f'Coverage Image of {coverage_name} with reprojection error of {round(ret,5)}'
+        height, width, _ = coverageImage.shape
+
+        if width > resizeWidth and height > resizeHeight:
+            coverageImage = cv2.resize(
+            coverageImage, (0, 0), fx= resizeWidth / width, fy= resizeWidth / width)
+
+        height, width, _ = coverageImage.shape
+        if height > resizeHeight:
+            height_offset = (height - resizeHeight)//2
+            coverageImage = coverageImage[height_offset:height_offset+resizeHeight, :]
+
+        height, width, _ = coverageImage.shape
+        height_offset = (resizeHeight - height)//2
+        width_offset = (resizeWidth - width)//2
+        subImage = np.pad(coverageImage, ((height_offset, height_offset), (width_offset, width_offset), (0, 0)), 'constant', constant_values=0)
+        cv2.putText(subImage, print_text, (50, 50+height_offset), cv2.FONT_HERSHEY_SIMPLEX, 2*coverageImage.shape[0]/1750, (0, 0, 0), 2)
+        coverage_file_path = filepath + '/' + coverage_name + '_coverage.png'
+        cv2.imwrite(coverage_file_path, subImage)
+        return subImage
+
+    def calibrate_extrinsic_stage(self, board_config, left_cam, filepath, features = None):
+        """
+        Extrinsic stage of one to_cam pair, needs the intrinsics of both cameras. Fills the extrinsics of
+        the left camera and the stereo_config rectification, returns an error string on failure. Pairs
+        sharing a camera filter and record that camera's features, they hold its lock one after the other.
+        """
+        names = sorted({board_config['cameras'][left_cam]['name'], board_config['cameras'][board_config['cameras'][left_cam]['extrinsics']['to_cam']]['name']})
+        locks = [self.camera_locks.setdefault(name, threading.Lock()) for name in names]
+        for lock in locks:
+            lock.acquire()
+        try:
+            return self.calibrate_extrinsic_pair(board_config, left_cam, filepath, features)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def calibrate_extrinsic_pair(self, board_config, left_cam, filepath, features = None):
+        left_cam_info = board_config['cameras'][left_cam]
+        right_cam = left_cam_info['extrinsics']['to_cam']
+        left_path = filepath + '/' + left_cam_info['name']
+        right_cam_info = board_config['cameras'][right_cam]
+        right_path = filepath + '/' + right_cam_info['name']
+        print('<-------------Extrinsics calibration of {} and {} ------------>'.format(
+            left_cam_info['name'], right_cam_info['name']))
+
+        specTranslation = left_cam_info['extrinsics']['specTranslation']
+        rot = left_cam_info['extrinsics']['rotation']
+
+        translation = np.array(
+            [specTranslation['x'], specTranslation['y'], specTranslation['z']], dtype=np.float32)
+        rotation = Rotation.from_euler(
+            'xyz', [rot['r'], rot['p'], rot['y']], degrees=True).as_matrix().astype(np.float32)
+        # the pair works on its own copies, other pairs of the same cameras read the intrinsic stage's views
+        left_ids, left_corners = left_cam_info['filtered_ids'], left_cam_info['filtered_corners']
+        right_ids, right_corners = right_cam_info['filtered_ids'], right_cam_info['filtered_corners']
+        left_img_path, right_img_path = left_cam_info.get('img_path', []), right_cam_info.get('img_path', [])
+        self.name, self.img_path = left_cam_info['name'], left_img_path
+        if per_ccm and extrinsic_per_ccm:
+            if left_cam_info["name"] in self.extrinsic_img or right_cam_info["name"] in self.extrinsic_img:
+                if left_cam_info["name"] in self.extrinsic_img:
+                    array = self.extrinsic_img[left_cam_info["name"]]
+                elif right_cam_info["name"] in self.extrinsic_img:
+                    array = self.extrinsic_img[left_cam_info["name"]]
+                left_corners, left_ids, filtered_images = self.remove_features(left_corners, left_ids, array)
+                right_corners, right_ids, filtered_images = self.remove_features(right_corners, right_ids, array)
+                removed_features, left_corners, left_ids = self.filtering_features(left_corners, left_ids, left_cam_info["name"],left_cam_info["imsize"],left_cam_info["hfov"], left_cam_info['intrinsics'], left_cam_info['dist_coeff'])
+                self.name, self.img_path = right_cam_info['name'], right_img_path
+                removed_features, right_corners, right_ids = self.filtering_features(right_corners, right_ids, right_cam_info["name"], right_cam_info["imsize"], right_cam_info["hfov"], right_cam_info['intrinsics'], right_cam_info['dist_coeff'])
+
+        # frames rejected on either camera only have placeholders, the pair uses the frames both cameras kept
+        common = sorted(set(detected_views(left_ids, min_corners = 1)) & set(detected_views(right_ids, min_corners = 1)))
+        if len(common) < min(len(left_ids), len(right_ids)):
+            print(f"Extrinsics of {left_cam_info['name']} and {right_cam_info['name']} on {len(common)} common frames")
+            left_ids, left_corners = [left_ids[i] for i in common], [left_corners[i] for i in common]
+            right_ids, right_corners = [right_ids[i] for i in common], [right_corners[i] for i in common]
+            left_img_path = [left_img_path[i] for i in common if i < len(left_img_path)]
+            right_img_path = [right_img_path[i] for i in common if i < len(right_img_path)]
+        extrinsics = self.calibrate_stereo(left_cam_info['name'], right_cam_info['name'], left_ids, left_corners, right_ids, right_corners, left_cam_info['intrinsics'], left_cam_info[
+                                               'dist_coeff'], right_cam_info['intrinsics'], right_cam_info['dist_coeff'], translation, rotation, features, img_paths = (left_img_path, right_img_path))
+        if extrinsics[0] == -1:
+            return extrinsics[1]
+
+        if board_config['stereo_config']['left_cam'] == left_cam and board_config['stereo_config']['right_cam'] == right_cam:
+            board_config['stereo_config']['rectification_left'] = extrinsics[3]
+            board_config['stereo_config']['rectification_right'] = extrinsics[4]
+
+        elif board_config['stereo_config']['left_cam'] == right_cam and board_config['stereo_config']['right_cam'] == left_cam:
+            board_config['stereo_config']['rectification_left'] = extrinsics[4]
+            board_config['stereo_config']['rectification_right'] = extrinsics[3]
+
+        """ for stereoObj in board_config['stereo_config']:
+
+            if stereoObj['left_cam'] == left_cam and stereoObj['right_cam'] == right_cam and stereoObj['main'] == 1:
+                stereoObj['rectification_left'] = extrinsics[3]
+                stereoObj['rectification_right'] = extrinsics[4] """
+
+        print('<-------------Epipolar error of {} and {} ------------>'.format(
+            left_cam_info['name'], right_cam_info['name']))
+        #print(f"dist {left_cam_info['name']}: {left_cam_info['dist_coeff']}")
+        #print(f"dist {right_cam_info['name']}: {right_cam_info['dist_coeff']}")
+        if left_cam_info['intrinsics'][0][0] < right_cam_info['intrinsics'][0][0]:
+            scale = right_cam_info['intrinsics'][0][0]
+        else:
+            scale = left_cam_info['intrinsics'][0][0]
+        if per_ccm and extrinsic_per_ccm:
+            scale = ((left_cam_info['intrinsics'][0][0]*right_cam_info['intrinsics'][0][0] + left_cam_info['intrinsics'][1][1]*right_cam_info['intrinsics'][1][1])/2)
+            print(f"Epipolar error {extrinsics[0]*np.sqrt(scale)}")
+            left_cam_info['extrinsics']['epipolar_error'] = extrinsics[0]*np.sqrt(scale)
+            left_cam_info['extrinsics']['stereo_error'] = extrinsics[0]*np.sqrt(scale)
+        else:
+            print(f"Epipolar error {extrinsics[0]}")
+            left_cam_info['extrinsics']['epipolar_error'] = extrinsics[0]
+            left_cam_info['extrinsics']['stereo_error'] = extrinsics[0]
+        """self.test_epipolar_charuco(left_cam_info['name'], 
+                                    right_cam_info['name'],
+                                    left_path, 
+                                    right_path, 
+                                    left_cam_info['intrinsics'], 
+                                    left_cam_info['dist_coeff'], 
+                                    right_cam_info['intrinsics'], 
+                                    right_cam_info['dist_coeff'], 
+                                    extrinsics[2], # Translation between left and right Cameras
+                                    extrinsics[3], # Left Rectification rotation 
+                                    extrinsics[4]) # Right Rectification rotation"""
+
+
+        left_cam_info['extrinsics']['rotation_matrix'] = extrinsics[1]
+        left_cam_info['extrinsics']['translation'] = extrinsics[2]
+
+    def calibrate_rig_stage(self, board_config):
+        rig = self.calibrate_rig(board_config)
+        if rig[0] == -1:
+            return rig[1]
+
+    def calibrate_rig(self, board_config):
+        """
+        Calibrates all cameras of the rig at once with rig_calibrate: intrinsics, the pose of every camera
+        relative to stereo_config left_cam and one board pose per capture, using every view the cameras
+        share. Fills the same intrinsics, dist_coeff, extrinsics rotation_matrix/translation/epipolar_error
+        and stereo_config rectification_left/right fields as the pairwise calibrate_stereo path.
+        """
+        def pose_matrix(rvec, tvec):
+            pose = np.eye(4)
+            pose[:3, :3] = cv2.Rodrigues(np.asarray(rvec, np.float64))[0]
+            pose[:3, 3] = np.ravel(tvec)
+            return pose
+
+        cameras = [camera for camera, cam_info in board_config['cameras'].items() if str(cam_info["name"]) not in self.disableCamera and 'filtered_ids' in cam_info]
+        reference = board_config.get('stereo_config', {}).get('left_cam')
+        if reference in cameras:
+            cameras.remove(reference)
+            cameras.insert(0, reference)
+        print('<-------------Joint rig calibration of {} ------------>'.format(', '.join(board_config['cameras'][camera]['name'] for camera in cameras)))
+
+        # board pose of every capture seen by a camera, from that camera alone
+        views, detections, view_poses = [], [], []
+        for camera in cameras:
+            cam_info = board_config['cameras'][camera]
+            name = cam_info['name']
+            self.name = name
+            camera_views = [i for i, ids in enumerate(cam_info['filtered_ids']) if ids is not None and len(ids) >= 4]
+            # the filtering below reads this camera's images, one per view it keeps
+            img_path = cam_info.get('img_path', [])
+            self.img_path = [img_path[i] for i in camera_views if i < len(img_path)]
+            corners = [cam_info['filtered_corners'][i] for i in camera_views]
+            ids = [cam_info['filtered_ids'][i] for i in camera_views]
+            if self.calib_model[name] == "fisheye":
+                corners_undist = [cv2.fisheye.undistortPoints(c, cam_info['intrinsics'], cam_info['dist_coeff']) for c in corners]
+                rvecs, tvecs, _ = self.estimate_poses(corners_undist, ids, np.eye(3), np.array((0.0,0,0,0)), stage = f"rig {name}")
+            else:
+                rvecs, tvecs, _ = self.estimate_poses(corners, ids, cam_info['intrinsics'], cam_info['dist_coeff'], stage = f"rig {name}")
+            # views without a pose are skipped
+            posed = [position for position, rvec in enumerate(rvecs) if rvec is not None]
+            if len(posed) < len(camera_views):
+                camera_views = [camera_views[position] for position in posed]
+                corners, ids = [corners[position] for position in posed], [ids[position] for position in posed]
+                rvecs, tvecs = [rvecs[position] for position in posed], [tvecs[position] for position in posed]
+                self.img_path = [img_path[i] for i in camera_views if i < len(img_path)]
+            # same outlier rejection calibrate_stereo applies before its solve
+            corners, ids, _, _, _, _ = self.features_filtering_function(rvecs, tvecs, cam_info['intrinsics'], cam_info['dist_coeff'], 0.0, corners, ids, camera = name, threshold = 1)
+            views.append(np.array(camera_views, np.int64))
+            detections.append(DetectionSet.from_lists(corners, ids))
+            view_poses.append({view: pose_matrix(rvec, tvec) for view, rvec, tvec in zip(camera_views, rvecs, tvecs)})
+
+        # chain the cameras to the reference through the captures they share
+        camera_from_reference = {0: np.eye(4)}
+        while len(camera_from_reference) < len(cameras):
+            added = False
+            for index in range(len(cameras)):
+                if index in camera_from_reference:
+                    continue
+                for known in list(camera_from_reference):
+                    shared = sorted(view_poses[index].keys() & view_poses[known].keys())
+                    if not shared:
+                        continue
+                    relative = [view_poses[index][i] @ np.linalg.inv(view_poses[known][i]) for i in shared]
+                    pose = np.eye(4)
+                    pose[:3, :3] = Rotation.from_matrix([r[:3, :3] for r in relative]).mean().as_matrix()
+                    pose[:3, 3] = np.median([r[:3, 3] for r in relative], axis = 0)
+                    camera_from_reference[index] = pose @ camera_from_reference[known]
+                    added = True
+                    break
+            if not added:
+                missing = [board_config['cameras'][cameras[i]]['name'] for i in range(len(cameras)) if i not in camera_from_reference]
+                return -1, f"Rig calibration failed, {missing} share no captures with the other cameras"
+
+        captures = np.unique(np.concatenate(views))
+        board_poses = []
+        for capture in captures:
+            index = next(i for i in range(len(cameras)) if capture in view_poses[i])
+            board_poses.append(np.linalg.inv(camera_from_reference[index]) @ view_poses[index][capture])
+        camera_poses = [camera_from_reference[i] for i in range(len(cameras))]
+        as_vector = lambda pose: np.concatenate([cv2.Rodrigues(pose[:3, :3])[0].ravel(), pose[:3, 3]])
+
+        models, flags = [], []
+        for camera in cameras:
+            cam_info = board_config['cameras'][camera]
+            models.append(camera_model(self.calib_model[cam_info['name']], cam_info['intrinsics'], cam_info['dist_coeff']))
+            if self.calib_model[cam_info['name']] == "fisheye":
+                flags.append(self.get_fisheye_distortion_flags(cam_info['name']))
+            else:
+                flags.append(cv2.CALIB_USE_INTRINSIC_GUESS + self.get_distortion_flags(cam_info['name']))
+        object_points = np.concatenate([d.object_points(self.board.chessboardCorners) for d in detections])
+        image_points = np.concatenate([d.corners for d in detections])
+        camera_index = np.concatenate([np.full(d.num_points, i) for i, d in enumerate(detections)])
+        capture_index = np.concatenate([np.searchsorted(captures, v[d.view_index]) for v, d in zip(views, detections)])
+        start = time.time()
+        rms, camera_poses, board_poses, per_camera, errors = rig_calibrate(
+            models, object_points, image_points, camera_index, capture_index,
+            np.array([as_vector(pose) for pose in camera_poses]), np.array([as_vector(pose) for pose in board_poses]), flags)
+        print(f"Rig solve: {len(cameras)} cameras, {len(captures)} captures, {len(errors)} points in {round(time.time() - start, 3)}s, reprojection error {rms}")
+
+        rotations = {}
+        translations = {}
+        for i, camera in enumerate(cameras):
+            cam_info = board_config['cameras'][camera]
+            size = len(np.ravel(cam_info['dist_coeff']))
+            cam_info['intrinsics'] = models[i].K
+            cam_info['dist_coeff'] = models[i].dist[:size].reshape(-1, 1)
+            self.cameraIntrinsics[cam_info['name']] = cam_info['intrinsics']
+            self.cameraDistortion[cam_info['name']] = cam_info['dist_coeff']
+            rotations[camera] = cv2.Rodrigues(camera_poses[i, :3])[0]
+            translations[camera] = camera_poses[i, 3:].reshape(3, 1)
+            print(f"Reprojection error of {cam_info['name']} in the rig: {per_camera[i]}")
+
+        for i, camera in enumerate(cameras):
+            left_cam_info = board_config['cameras'][camera]
+            right_cam = left_cam_info.get('extrinsics', {}).get('to_cam')
+            if right_cam not in rotations:
+                continue
+            right_cam_info = board_config['cameras'][right_cam]
+            # left camera -> right camera, the convention of cv2.stereoCalibrate
+            R = rotations[right_cam] @ rotations[camera].T
+            T = translations[right_cam] - R @ translations[camera]
+            left_fisheye = self.calib_model[left_cam_info['name']] == 'fisheye'
+            right_fisheye = self.calib_model[right_cam_info['name']] == 'fisheye'
+            # the image size gives P_l/P_r real focal lengths, the epipolar error below is measured in their pixels
+            if left_fisheye and right_fisheye:
+                R_l, R_r, P_l, P_r, Q = cv2.fisheye.stereoRectify(
+                    left_cam_info['intrinsics'], left_cam_info['dist_coeff'],
+                    right_cam_info['intrinsics'], right_cam_info['dist_coeff'],
+                    tuple(left_cam_info['size']), R, T, flags=0)
+            else:
+                # a fisheye side of a mixed pair is undistorted with its own model below, not by stereoRectify
+                R_l, R_r, P_l, P_r, Q, validPixROI1, validPixROI2 = cv2.stereoRectify(
+                    left_cam_info['intrinsics'], None if left_fisheye else left_cam_info['dist_coeff'],
+                    right_cam_info['intrinsics'], None if right_fisheye else right_cam_info['dist_coeff'],
+                    tuple(left_cam_info['size']), R, T)
+            if board_config['stereo_config']['left_cam'] == camera and board_config['stereo_config']['right_cam'] == right_cam:
+                board_config['stereo_config']['rectification_left'] = R_l
+                board_config['stereo_config']['rectification_right'] = R_r
+            elif board_config['stereo_config']['left_cam'] == right_cam and board_config['stereo_config']['right_cam'] == camera:
+                board_config['stereo_config']['rectification_left'] = R_r
+                board_config['stereo_config']['rectification_right'] = R_l
+            # epipolar error of the corners both cameras see, after rectification, as test_epipolar_charuco measures it
+            right_index = cameras.index(right_cam)
+            rectified = {i: [], right_index: []}
+            for capture in np.intersect1d(views[i], views[right_index]):
+                left_view, right_view = np.searchsorted(views[i], capture), np.searchsorted(views[right_index], capture)
+                left_corners, left_ids, _ = detections[i].view(left_view)
+                right_corners, right_ids, _ = detections[right_index].view(right_view)
+                _, left_match, right_match = np.intersect1d(left_ids, right_ids, return_indices = True)
+                rectified[i].append(left_corners[left_match])
+                rectified[right_index].append(right_corners[right_match])
+            if not any(len(corners) for corners in rectified[i]):
+                return -1, f"Rig calibration failed, {left_cam_info['name']} and {right_cam_info['name']} share no corners"
+            for index, cam_info, rectification, projection in ((i, left_cam_info, R_l, P_l), (right_index, right_cam_info, R_r, P_r)):
+                points = np.concatenate(rectified[index]).reshape(-1, 1, 2).astype(np.float64)
+                if self.calib_model[cam_info['name']] == 'fisheye':
+                    rectified[index] = cv2.fisheye.undistortPoints(points, cam_info['intrinsics'], cam_info['dist_coeff'], R=rectification, P=projection).reshape(-1, 2)
+                else:
+                    rectified[index] = cv2.undistortPoints(points, cam_info['intrinsics'], cam_info['dist_coeff'], R=rectification, P=projection).reshape(-1, 2)
+            axis = 1 if np.absolute(T[0]) > np.absolute(T[1]) else 0
+            pair_error = np.mean(np.absolute(rectified[i][:, axis] - rectified[right_index][:, axis]))
+            print('<-------------Epipolar error of {} and {} ------------>'.format(
+                left_cam_info['name'], right_cam_info['name']))
+            print(f"Epipolar error {pair_error}")
+            if self.traceLevel == 3 or self.traceLevel == 10:
+                print('Printing Extrinsics res...')
+                print(R)
+                print(T)
+                print(f"Euler angles in XYZ {Rotation.from_matrix(R).as_euler('xyz', degrees=True)} degs")
+            left_cam_info['extrinsics']['epipolar_error'] = pair_error
+            left_cam_info['extrinsics']['stereo_error'] = pair_error
+            left_cam_info['extrinsics']['rotation_matrix'] = R
+            left_cam_info['extrinsics']['translation'] = T
+        return 1, board_config
+
+    def calibrate_stereo(self, left_name, right_name, allIds_l, allCorners_l, allIds_r, allCorners_r, cameraMatrix_l, distCoeff_l, cameraMatrix_r, distCoeff_r, t_in, r_in, features = None, img_paths = None):
         left_corners_sampled = []
         right_corners_sampled = []
         left_ids_sampled = []
         obj_pts = []
         res = 0.0
         one_pts = self.board.chessboardCorners
-        rvecs = []
-        tvecs = []
-        for corners, ids in zip(allCorners_l, allIds_l):
-            objpts = self.charuco_ids_to_objpoints(ids)
-            rvec, tvec, newids = self.camera_pose_charuco(objpts, corners, ids, cameraMatrix_l, distCoeff_l)
-            tvecs.append(tvec)
-            rvecs.append(rvec)
+        # the pose estimation and filtering of each camera run with that camera's name and images
+        if img_paths is not None:
+            self.name, self.img_path = left_name, img_paths[0]
+        rvecs, tvecs, _ = self.estimate_poses(allCorners_l, allIds_l, cameraMatrix_l, distCoeff_l, stage = f"stereo {left_name}")
         allCorners_l, allIds_l, all_error, removed_corners, removed_ids, removed_error = self.features_filtering_function(rvecs, tvecs, cameraMatrix_l, distCoeff_l, res, allCorners_l, allIds_l, camera = left_name, threshold=1)
-        rvecs = []
-        tvecs = []
-        for corners, ids in zip(allCorners_r, allIds_r):
-            objpts = self.charuco_ids_to_objpoints(ids)
-            rvec, tvec, newids = self.camera_pose_charuco(objpts, corners, ids, cameraMatrix_r, distCoeff_r)
-            tvecs.append(tvec)
-            rvecs.append(rvec)
+        if img_paths is not None:
+            self.name, self.img_path = right_name, img_paths[1]
+        rvecs, tvecs, _ = self.estimate_poses(allCorners_r, allIds_r, cameraMatrix_r, distCoeff_r, stage = f"stereo {right_name}")
         allCorners_r, allIds_r ,all_error, removed_corners, removed_ids, removed_error = self.features_filtering_function(rvecs, tvecs, cameraMatrix_r, distCoeff_r, res, allCorners_r, allIds_r, camera = right_name, threshold=1)
         if self.traceLevel == 2 or self.traceLevel == 4 or self.traceLevel == 10:
             print('Length of allIds_l')
@@ -1521,6 +3517,9 @@ class StereoCalibration(object):
             print(len(allIds_r))
 
         for i in range(len(allIds_l)):
+            if len(allIds_l[i]) == 0 or len(allIds_r[i]) == 0:
+                # skipped, one of the cameras has no pose for this view
+                continue
             left_sub_corners = []
             right_sub_corners = []
             obj_pts_sub = []
@@ -1775,8 +3774,8 @@ class StereoCalibration(object):
             # read images
             imagesCount += 1
             # print(imagesCount)
-            img_l = cv2.imread(image_left, 0)
-            img_r = cv2.imread(image_right, 0)
+            img_l = self.frame_store.get(image_left, grayscale=True)
+            img_r = self.frame_store.get(image_right, grayscale=True)
 
             img_l = self.scale_image(img_l, scaled_res)
             img_r = self.scale_image(img_r, scaled_res)
@@ -1799,23 +3798,15 @@ class StereoCalibration(object):
 
         imgpoints_r = []
         imgpoints_l = []
-        criteria = (cv2.TERM_CRITERIA_EPS +
-                    cv2.TERM_CRITERIA_MAX_ITER, 10000, 0.00001)
-            
+
         for i, image_data_pair in enumerate(image_data_pairs):
             res2_l = self.detect_charuco_board(image_data_pair[0])
             res2_r = self.detect_charuco_board(image_data_pair[1])
 
             if res2_l[1] is not None and res2_r[2] is not None and len(res2_l[1]) > 3 and len(res2_r[1]) > 3:
 
-                cv2.cornerSubPix(image_data_pair[0], res2_l[1], 
-                                 winSize=(5, 5),
-                                 zeroZone=(-1, -1),
-                                 criteria=criteria)
-                cv2.cornerSubPix(image_data_pair[1], res2_r[1],
-                                 winSize=(5, 5),
-                                 zeroZone=(-1, -1),
-                                 criteria=criteria)
+                self.charuco_detector.refine(image_data_pair[0], res2_l[1])
+                self.charuco_detector.refine(image_data_pair[1], res2_r[1])
 
                 # termination criteria
                 img_pth_right = Path(images_right[i])
@@ -1871,8 +3862,8 @@ class StereoCalibration(object):
 
         scale = None
         scale_req = False
-        frame_left_shape = cv2.imread(images_left[0], 0).shape
-        frame_right_shape = cv2.imread(images_right[0], 0).shape
+        frame_left_shape = self.image_size(images_left[0])
+        frame_right_shape = self.image_size(images_right[0])
         scalable_res = frame_left_shape
         scaled_res = frame_right_shape
         if frame_right_shape[0] < frame_left_shape[0] and frame_right_shape[1] < frame_left_shape[1]:
@@ -1899,9 +3890,6 @@ class StereoCalibration(object):
         M_lp = self.scale_intrinsics(M_l, frame_left_shape, scaled_res)
         M_rp = self.scale_intrinsics(M_r, frame_right_shape, scaled_res)
 
-        criteria = (cv2.TERM_CRITERIA_EPS +
-                    cv2.TERM_CRITERIA_MAX_ITER, 10000, 0.00001)
-
         # TODO(Sachin): Observe Images by adding visualization 
         # TODO(Sachin): Check if the stetch is only in calibration Images
         print('Original intrinsics ....')
@@ -1944,8 +3932,8 @@ class StereoCalibration(object):
         image_data_pairs = []
         for image_left, image_right in zip(images_left, images_right):
             # read images
-            img_l = cv2.imread(image_left, 0)
-            img_r = cv2.imread(image_right, 0)
+            img_l = self.frame_store.get(image_left, grayscale=True)
+            img_r = self.frame_store.get(image_right, grayscale=True)
 
             img_l = self.scale_image(img_l, scaled_res)
             img_r = self.scale_image(img_r, scaled_res)
@@ -2005,14 +3993,8 @@ class StereoCalibration(object):
             
             if res2_l[1] is not None and res2_r[2] is not None and len(res2_l[1]) > 3 and len(res2_r[1]) > 3:
 
-                cv2.cornerSubPix(image_data_pair[0], res2_l[1],
-                                 winSize=(5, 5),
-                                 zeroZone=(-1, -1),
-                                 criteria=criteria)
-                cv2.cornerSubPix(image_data_pair[1], res2_r[1],
-                                 winSize=(5, 5),
-                                 zeroZone=(-1, -1),
-                                 criteria=criteria)
+                self.charuco_detector.refine(image_data_pair[0], res2_l[1])
+                self.charuco_detector.refine(image_data_pair[1], res2_r[1])
 
                 # termination criteria
                 img_pth_right = Path(images_right[i])
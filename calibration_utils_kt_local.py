@@ -13,6 +13,10 @@ from pathlib import Path
 from functools import reduce
 from collections import deque
 from typing import Optional
+try:
+    from .calibration_utils import CharucoDetector
+except ImportError:
+    from calibration_utils import CharucoDetector
 # Creates a set of 13 polygon coordinates
 rectProjectionMode = 0
 
@@ -105,14 +109,13 @@ class StereoCalibration(object):
         self.enable_rectification_disp = enable_disp_rectify
         self.cameraModel = camera_model
         self.data_path = filepath
-        self.aruco_dictionary = aruco.Dictionary_get(aruco.DICT_4X4_1000)
-
-        self.board = aruco.CharucoBoard_create(
+        self.charuco_detector = CharucoDetector(
             # 22, 16,
             squaresX, squaresY,
             square_size,
-            mrk_size,
-            self.aruco_dictionary)
+            mrk_size)
+        self.aruco_dictionary = self.charuco_detector.aruco_dictionary
+        self.board = self.charuco_detector.board
 
         # parameters = aruco.DetectorParameters_create()
         combinedCoverageImage = None
@@ -268,16 +271,10 @@ class StereoCalibration(object):
         return displayframe
     
     def detect_charuco_board(self, image: np.array):
-        arucoParams = cv2.aruco.DetectorParameters_create()
-        arucoParams.minMarkerDistanceRate = 0.01
-        corners, ids, rejectedImgPoints = cv2.aruco.detectMarkers(image, self.aruco_dictionary, parameters=arucoParams)  # First, detect markers
-        marker_corners, marker_ids, refusd, recoverd = cv2.aruco.refineDetectedMarkers(image, self.board, corners, ids, rejectedCorners=rejectedImgPoints)
-        # If found, add object points, image points (after refining them)
-        if len(marker_corners)>0:
-            ret, corners, ids = cv2.aruco.interpolateCornersCharuco(marker_corners,marker_ids,image, self.board, minMarkers = 1)
-            return ret, corners, ids, marker_corners, marker_ids
-        else:
+        result = self.charuco_detector.detect(image)
+        if result[3] is None:
             return None
+        return result
 
     def camera_pose_charuco(self, image: np.array, K: np.array, d: np.array):
         corners = self.detect_charuco_board(image)
@@ -314,9 +311,6 @@ class StereoCalibration(object):
         all_marker_ids = []
         all_recovered = []
         # decimator = 0
-        # SUB PIXEL CORNER DETECTION CRITERION
-        criteria = (cv2.TERM_CRITERIA_EPS +
-                    cv2.TERM_CRITERIA_MAX_ITER, 10000, 0.00001)
         count = 0
         skip_vis = False
         for im in images:
@@ -359,10 +353,7 @@ class StereoCalibration(object):
 
             if charuco_corners is not None and charuco_ids is not None and len(charuco_corners) > 3:
 
-                cv2.cornerSubPix(gray, charuco_corners,
-                                    winSize=(5, 5),
-                                    zeroZone=(-1, -1),
-                                    criteria=criteria)
+                self.charuco_detector.refine(gray, charuco_corners)
                 allCorners.append(charuco_corners)  # Charco chess corners
                 allIds.append(charuco_ids)  # charuco chess corner id's
                 all_marker_corners.append(marker_corners)
@@ -892,8 +883,6 @@ class StereoCalibration(object):
 
         imgpoints_r = []
         imgpoints_l = []
-        criteria = (cv2.TERM_CRITERIA_EPS +
-                    cv2.TERM_CRITERIA_MAX_ITER, 10000, 0.00001)
             
         for i, image_data_pair in enumerate(image_data_pairs):
             res2_l = self.detect_charuco_board(image_data_pair[0])
@@ -901,14 +890,8 @@ class StereoCalibration(object):
 
             if res2_l[1] is not None and res2_r[2] is not None and len(res2_l[1]) > 3 and len(res2_r[1]) > 3:
 
-                cv2.cornerSubPix(image_data_pair[0], res2_l[1], 
-                                 winSize=(5, 5),
-                                 zeroZone=(-1, -1),
-                                 criteria=criteria)
-                cv2.cornerSubPix(image_data_pair[1], res2_r[1],
-                                 winSize=(5, 5),
-                                 zeroZone=(-1, -1),
-                                 criteria=criteria)
+                self.charuco_detector.refine(image_data_pair[0], res2_l[1])
+                self.charuco_detector.refine(image_data_pair[1], res2_r[1])
 
                 # termination criteria
                 img_pth_right = Path(images_right[i])
@@ -994,9 +977,6 @@ class StereoCalibration(object):
         M_lp = self.scale_intrinsics(M_l, frame_left_shape, scaled_res)
         M_rp = self.scale_intrinsics(M_r, frame_right_shape, scaled_res)
 
-        criteria = (cv2.TERM_CRITERIA_EPS +
-                    cv2.TERM_CRITERIA_MAX_ITER, 10000, 0.00001)
-
         # TODO(Sachin): Observe Images by adding visualization 
         # TODO(Sachin): Check if the stetch is only in calibration Images
         print('Original intrinsics ....')
@@ -1100,14 +1080,8 @@ class StereoCalibration(object):
             
             if res2_l[1] is not None and res2_r[2] is not None and len(res2_l[1]) > 3 and len(res2_r[1]) > 3:
 
-                cv2.cornerSubPix(image_data_pair[0], res2_l[1],
-                                 winSize=(5, 5),
-                                 zeroZone=(-1, -1),
-                                 criteria=criteria)
-                cv2.cornerSubPix(image_data_pair[1], res2_r[1],
-                                 winSize=(5, 5),
-                                 zeroZone=(-1, -1),
-                                 criteria=criteria)
+                self.charuco_detector.refine(image_data_pair[0], res2_l[1])
+                self.charuco_detector.refine(image_data_pair[1], res2_r[1])
 
                 # termination criteria
                 img_pth_right = Path(images_right[i])
@@ -4,15 +4,10 @@ import numpy as np
 import cv2.aruco as aruco
 import depthai as dai
 from pathlib import Path
+from calibration_utils import CharucoDetector, DetectionSet, FisheyeModel
 
 def detect_markers_corners(frame):
-    marker_corners, ids, rejectedImgPoints = cv2.aruco.detectMarkers(frame, aruco_dictionary)
-    marker_corners, ids, refusd, recoverd = cv2.aruco.refineDetectedMarkers(frame, charuco_board,
-                                                                            marker_corners, ids, 
-                                                                            rejectedCorners=rejectedImgPoints)
-    if len(marker_corners) <= 0:
-        return marker_corners, ids, None, None
-    ret, charuco_corners, charuco_ids = cv2.aruco.interpolateCornersCharuco(marker_corners, ids, frame, charuco_board)
+    ret, charuco_corners, charuco_ids, marker_corners, ids = charuco_detector.detect(frame)
     return marker_corners, ids, charuco_corners, charuco_ids
 
 size = (1920, 1200)
@@ -31,13 +26,12 @@ d_zero = np.zeros((14, 1), dtype=np.float32)
 M_focal = cv2.fisheye.estimateNewCameraMatrixForUndistortRectify(k, d, size, np.eye(3), fov_scale=1.1)
 mapXL, mapYL = cv2.fisheye.initUndistortRectifyMap(k, d[:4], r, M_focal, size, cv2.CV_32FC1)
 
-aruco_dictionary = aruco.Dictionary_get(cv2.aruco.DICT_4X4_1000)
-charuco_board = aruco.CharucoBoard_create(
+charuco_detector = CharucoDetector(
                             11, 
                             8,
                             6.0,
-                            4.6,
-                            aruco_dictionary)
+                            4.6)
+charuco_board = charuco_detector.board
 checkCorners3D = charuco_board.chessboardCorners
 rvec = np.array([[0.0],
                  [0.0],
@@ -47,6 +41,11 @@ tvec = np.array([[0.0],
                  [0.0],
                  [0.0]], dtype=np.float32)
 # count = 0
+names = []
+poses_r = []
+poses_t = []
+detected_corners = []
+detected_ids = []
 for im_name in images:
     ## Undistort it first
     path = Path(im_name)
@@ -62,15 +61,19 @@ for im_name in images:
         print('checkCorners3D shape -> ', checkCorners3D.shape)
         raise ValueError("Number of ids does not match number of original corners") """
 
-    points_2d, _ = cv2.fisheye.projectPoints(checkCorners3D[None], rvec, tvec, k, d)
-    undistorted_points_2d = cv2.fisheye.undistortPoints(points_2d, k, d, R = r, P = M_focal)
-    # print("undistorted_points_2d shape -> ", undistorted_points_2d.shape)
-    # print("charuco_corners shape -> ", charuco_corners.shape)
-    error = 0
-    for i in range(len(charuco_ids)):
-        error_vec = charuco_corners[i][0] - undistorted_points_2d[0][charuco_ids[i]]
-        error += np.linalg.norm(error_vec)
-    # print(im_name)
-    print(f'Reprojection error is {error / len(charuco_ids)} avg of {len(charuco_ids)} of points in file {path.name} ')
-
+    names.append(path.name)
+    poses_r.append(rvec.copy())
+    poses_t.append(tvec.copy())
+    detected_corners.append(charuco_corners)
+    detected_ids.append(charuco_ids)
 
+# project and undistort the board of every image in one go
+detections = DetectionSet.from_lists(detected_corners, detected_ids)
+fisheye = FisheyeModel(k, d)
+points_2d = fisheye.project_many(checkCorners3D[detections.ids], poses_r, poses_t, detections.view_index)
+undistorted_points_2d = fisheye.unproject_many(points_2d, R = r, P = M_focal)
+errors = np.linalg.norm(detections.corners - undistorted_points_2d, axis = 1)
+error_sums = np.bincount(detections.view_index, weights = errors, minlength = len(detections))
+for name, error, count in zip(names, error_sums, detections.counts):
+    # print(im_name)
+    print(f'Reprojection error is {error / count} avg of {count} of points in file {name} ')